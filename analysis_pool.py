@@ -0,0 +1,228 @@
+from concurrent.futures import ProcessPoolExecutor, TimeoutError as FutureTimeoutError
+from concurrent.futures.process import BrokenProcessPool
+import multiprocessing
+import threading
+import logging
+import signal
+import time
+import os
+
+import models
+
+logger = logging.getLogger(__name__)
+
+# Worker processes for CPU-heavy analyses (sentiment, clustering, metadata statistics)
+ANALYSIS_WORKERS = int(os.environ.get('ANALYSIS_WORKERS', min(4, os.cpu_count() or 1)))
+# Tasks that may wait for a free worker; one more is rejected with AnalysisBusy
+ANALYSIS_QUEUE = int(os.environ.get('ANALYSIS_QUEUE', ANALYSIS_WORKERS))
+# Seconds a request waits for its task, and the longest a task may run in a worker
+ANALYSIS_TIMEOUT = float(os.environ.get('ANALYSIS_TIMEOUT', 120))
+# How workers are started. Not 'fork': by the first analysis the process runs
+# the ingestion, event loop and request threads, and a forked worker could
+# inherit a lock one of them held (logging, sqlite)
+ANALYSIS_START_METHOD = os.environ.get(
+    'ANALYSIS_START_METHOD', 'forkserver' if 'forkserver' in multiprocessing.get_all_start_methods() else 'spawn')
+
+
+class AnalysisRejected(Exception):
+    """An analysis that was not carried out; status_code is the HTTP status to answer with
+    and retry_after, when set, the seconds a client should wait before retrying"""
+    status_code = 503
+    retry_after = None
+
+
+class AnalysisBusy(AnalysisRejected):
+    """Every worker is busy and the queue is full"""
+    status_code = 429
+    retry_after = 1
+
+
+class AnalysisTimeout(AnalysisRejected):
+    """The task did not finish within its timeout"""
+    status_code = 504
+
+
+class _Deadline(BaseException):
+    """Raised in a worker when its task runs out of time; not an Exception so
+    that the task's own error handling cannot swallow it"""
+
+
+def _deadline_exceeded(signum, frame):
+    raise _Deadline()
+
+
+def _call(fn, args, kwargs, seconds):
+    """Run a task inside a worker, interrupted by SIGALRM after `seconds` where the platform has it"""
+    if not seconds or not hasattr(signal, 'setitimer'):
+        return fn(*args, **kwargs)
+    previous = signal.signal(signal.SIGALRM, _deadline_exceeded)
+    signal.setitimer(signal.ITIMER_REAL, seconds)
+    try:
+        return fn(*args, **kwargs)
+    except _Deadline:
+        raise AnalysisTimeout(f'Analysis exceeded its time limit of {seconds:g}s') from None
+    finally:
+        signal.setitimer(signal.ITIMER_REAL, 0)
+        signal.signal(signal.SIGALRM, previous)
+
+
+class AnalysisPool:
+    """Run CPU-heavy analyses in worker processes, away from the request threads
+
+    At most ``workers`` tasks run at a time and at most ``queue`` more wait
+    for a worker; run() rejects anything beyond that with AnalysisBusy
+    instead of queueing without limit. A task is given ``timeout`` seconds:
+    the request stops waiting after that and raises AnalysisTimeout, and the
+    worker interrupts the task itself so it does not keep its process busy
+    (on platforms with SIGALRM). The process pool is created on first use;
+    its workers are started with ANALYSIS_START_METHOD and load the models
+    in models.PRELOAD when they start.
+    """
+
+    def __init__(self, workers=ANALYSIS_WORKERS, queue=ANALYSIS_QUEUE, timeout=ANALYSIS_TIMEOUT):
+        self.workers = max(workers, 1)
+        self.queue = max(queue, 0)
+        self.timeout = timeout
+        self.slots = threading.BoundedSemaphore(self.workers + self.queue)
+        self.lock = threading.Lock()
+        self.executor = None
+        self.in_flight = 0
+        self.counters = {'completed': 0, 'failed': 0, 'rejected': 0, 'timed_out': 0}
+        self.run_seconds = 0.0
+
+    def _executor(self):
+        with self.lock:
+            if self.executor is None:
+                context = multiprocessing.get_context(ANALYSIS_START_METHOD)
+                self.executor = ProcessPoolExecutor(max_workers=self.workers, mp_context=context,
+                                                    initializer=models.preload, initargs=(models.PRELOAD,))
+            return self.executor
+
+    def _reset(self, executor):
+        """Drop a broken executor so the next task starts a new one"""
+        with self.lock:
+            if self.executor is executor:
+                self.executor = None
+        executor.shutdown(wait=False, cancel_futures=True)
+
+    def _finished(self, future):
+        with self.lock:
+            self.in_flight -= 1
+        self.slots.release()
+
+    def run(self, fn, *args, timeout=None, **kwargs):
+        """@brief run fn(*args, **kwargs) in a worker process and wait for its result
+
+        Args:
+            fn (callable): a module-level function, it and its arguments are pickled
+            timeout (float): overrides the pool's timeout for this task
+
+        Returns:
+            the return value of fn
+
+        Raises:
+            AnalysisBusy: no worker or queue slot is free
+            AnalysisTimeout: the task did not finish in time
+        """
+        if not self.slots.acquire(blocking=False):
+            with self.lock:
+                self.counters['rejected'] += 1
+            raise AnalysisBusy('Analysis capacity is exhausted, retry later')
+        timeout = timeout or self.timeout
+        executor = self._executor()
+        try:
+            future = executor.submit(_call, fn, args, kwargs, timeout)
+        except BrokenProcessPool:
+            self.slots.release()
+            self._reset(executor)
+            raise
+        with self.lock:
+            self.in_flight += 1
+        future.add_done_callback(self._finished)
+
+        start = time.perf_counter()
+        try:
+            result = future.result(timeout=timeout)
+        except FutureTimeoutError:
+            # Drops the task if it is still queued; a running one is interrupted in the worker
+            future.cancel()
+            counter = 'timed_out'
+            raise AnalysisTimeout(f'Analysis did not finish within {timeout:g}s')
+        except AnalysisTimeout:
+            counter = 'timed_out'
+            raise
+        except BrokenProcessPool:
+            counter = 'failed'
+            logger.error("Analysis worker died, restarting the pool")
+            self._reset(executor)
+            raise
+        except Exception:
+            counter = 'failed'
+            raise
+        else:
+            counter = 'completed'
+            return result
+        finally:
+            with self.lock:
+                self.counters[counter] += 1
+                self.run_seconds += time.perf_counter() - start
+
+    def stats(self):
+        """Return capacity, load and outcome counters for monitoring"""
+        with self.lock:
+            finished = sum(self.counters.values()) - self.counters['rejected']
+            return {
+                'workers': self.workers,
+                'queue': self.queue,
+                'timeout': self.timeout,
+                'in_flight': self.in_flight,
+                **self.counters,
+                'mean_seconds': self.run_seconds / finished if finished else None,
+            }
+
+    def shutdown(self):
+        with self.lock:
+            executor, self.executor = self.executor, None
+        if executor is not None:
+            executor.shutdown(wait=False, cancel_futures=True)
+
+
+class PooledSentimentAnalyzer:
+    """The analysis methods of SentimentAnalyzer, run in an AnalysisPool
+
+    Stands in for SentimentAnalyzer behind SentimentCache, so cache hits are
+    answered in the request thread and only misses occupy a worker.
+    """
+
+    def __init__(self, pool):
+        self.pool = pool
+
+    def analyze_text(self, text):
+        return self.pool.run(_sentiment, 'analyze_text', text)
+
+    def analyze_many(self, texts, overall_only=False):
+        return self.pool.run(_sentiment, 'analyze_many', texts, overall_only=overall_only)
+
+    def analyze_document(self, doc_path):
+        return self.pool.run(_sentiment, 'analyze_document', doc_path)
+
+    def split_sentences(self, text):
+        return self.pool.run(_sentiment, 'split_sentences', text)
+
+    def score_sentences(self, sentences):
+        return self.pool.run(_sentiment, 'score_sentences', sentences)
+
+    def combined_sentiment(self, sentences, text):
+        return self.pool.run(_sentiment, 'combined_sentiment', sentences, text)
+
+
+_worker_analyzer = None
+
+
+def _sentiment(method, *args, **kwargs):
+    """Call a SentimentAnalyzer method in a worker, one analyzer per process"""
+    global _worker_analyzer
+    if _worker_analyzer is None:
+        from sentiment_analyzer import SentimentAnalyzer
+        _worker_analyzer = SentimentAnalyzer()
+    return getattr(_worker_analyzer, method)(*args, **kwargs)
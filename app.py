@@ -1,14 +1,25 @@
-from flask import Flask, jsonify, request, render_template
+from flask import Flask, jsonify, request, render_template, g, Response, stream_with_context
 import logging
 from flask_cors import CORS
-from prototype import get_connection, build_query, initialize_database
+from prototype import get_connection, build_query, initialize_database, create_tables, get_paper_text, PAPER_COLUMNS, MENTION_COLUMNS
+from ingest import IngestJob, materialize_artifacts
+from watcher import PapersWatcher
+import db
+import models
+import fulltext
 from sentiment_analyzer import SentimentAnalyzer
-from paper_clustering import PaperClusterer
+from sentiment_cache import SentimentCache, paper_key, arxiv_key
+from paper_clustering import ClusteringConfig, ClusteringCache, cluster, cluster_texts, papers_digest, CLUSTER_MODES
+import feature_store as feature_store_module
+from feature_store import FeatureStore
+import cluster_models
+import neighbour_index
+from metadata_analysis import analyze_metadata
+from analysis_pool import AnalysisPool, AnalysisRejected, PooledSentimentAnalyzer
 from arxiv_client import ArxivClient
+import hashlib
 import sqlite3
 import json
-from collections import Counter
-from datetime import datetime
 import os
 
 app = Flask(__name__)
@@ -16,11 +27,87 @@ CORS(app)
 logging.basicConfig(level=logging.DEBUG)
 logger = logging.getLogger(__name__)
 
-initialize_database()
-sentiment_analyzer = SentimentAnalyzer()
-paper_clusterer = PaperClusterer()
+# Sentiment, clustering and metadata statistics run here instead of in the request threads
+analysis_pool = AnalysisPool()
+# TF-IDF features of the local corpus, refit by ingestion; when another
+# process changed the corpus, requests keep the previous features while the
+# analysis pool rebuilds them
+feature_store = FeatureStore()
+feature_store_module.rebuild_runner = analysis_pool.run
+# Immutable clustering results keyed by input and ClusteringConfig
+clustering_cache = ClusteringCache()
+# Drift refits of the persisted cluster models also run in the analysis pool
+cluster_models.refit_runner = analysis_pool.run
+# So do the background updates of the similar-papers lists
+neighbour_index.insert_runner = analysis_pool.run
 arxiv_client = ArxivClient()
 
+def get_db():
+    """Check out a pooled database connection for the current request"""
+    if 'db' not in g:
+        g.db = db.pool.acquire()
+    return g.db
+
+@app.teardown_appcontext
+def release_db(exception):
+    conn = g.pop('db', None)
+    if conn is not None:
+        db.pool.release(conn)
+
+# Only misses are analyzed, in the analysis pool
+pooled_sentiment_analyzer = PooledSentimentAnalyzer(analysis_pool)
+sentiment_cache = SentimentCache(lambda: pooled_sentiment_analyzer)
+
+def analysis_rejected(e):
+    """Answer a request whose analysis the pool refused or gave up on"""
+    response = jsonify({
+        'status': 'error',
+        'message': str(e)
+    })
+    if e.retry_after is not None:
+        response.headers['Retry-After'] = str(e.retry_after)
+    return response, e.status_code
+
+def run_clustering(key, fn, *args):
+    """Cluster in the analysis pool; identical requests (same input key and config) share one result
+
+    Args:
+        key (tuple): identifies the input papers and ends with the ClusteringConfig
+        fn (callable): paper_clustering.cluster or cluster_texts, args are passed on
+
+    Returns:
+        (dict): ClusteringResult.to_dict()
+    """
+    return clustering_cache.get_or_compute(key, lambda: analysis_pool.run(fn, *args)).to_dict()
+
+def start_background_ingestion():
+    """Create the schema and ingest the local corpus in a background thread
+
+    The server binds its port right away; search endpoints serve whatever has
+    been committed so far while /ready reports the ingestion progress. With
+    WATCH_PAPERS=1 a watcher thread keeps ingesting PDFs added to Papers/.
+    Models listed in PRELOAD_MODELS are loaded first, so that processes
+    forked afterwards share them.
+    """
+    models.preload(models.PRELOAD)
+    os.makedirs("data", exist_ok=True)
+    conn = get_connection("data/test_db.sqlite")
+    create_tables(conn.cursor())
+    conn.commit()
+    conn.close()
+    ingest_job.start()
+    if papers_watcher is not None:
+        papers_watcher.start()
+
+ingest_job = IngestJob(initialize_database)
+papers_watcher = None
+if os.environ.get('WATCH_PAPERS') == '1':
+    papers_watcher = PapersWatcher(lambda paths: initialize_database(commit_every=1, paths=paths))
+# Skip the reloader's parent process when running `python app.py` in debug mode,
+# and analysis workers, which import this script as __mp_main__ when it is run directly
+if __name__ != '__mp_main__' and (__name__ != '__main__' or os.environ.get('WERKZEUG_RUN_MAIN') == 'true'):
+    start_background_ingestion()
+
 @app.route('/')
 def index():
     # Serve arxiv.html as the homepage
@@ -59,7 +146,7 @@ def search_papers():
         query_string = f"get {limit} papers that mention {entity_type} {entity_name}"
         logger.debug(f"Built query string: {query_string}")
         
-        conn = get_connection("data/test_db.sqlite")
+        conn = get_db()
         cur = conn.cursor()
         
         sql_query = build_query(query_string)
@@ -137,9 +224,43 @@ def search_papers():
             'status': 'error',
             'message': str(e)
         }), 500
-    finally:
-        if 'conn' in locals():
-            conn.close()
+
+@app.route('/fulltext_search', methods=['GET'])
+def fulltext_search():
+    try:
+        query = request.args.get('q', '')
+        scope = request.args.get('scope', 'all')  # 可选值: local, arxiv, all
+        limit = max(1, min(int(request.args.get('limit', 10)), 100))
+        offset = max(int(request.args.get('offset', 0)), 0)
+
+        if not fulltext.fts_query(query):
+            return jsonify({
+                'status': 'error',
+                'message': 'Query must contain at least one word'
+            }), 400
+        if scope not in ('local', 'arxiv', 'all'):
+            return jsonify({
+                'status': 'error',
+                'message': f'Unknown scope: {scope}'
+            }), 400
+
+        conn = get_db()
+        local_results = fulltext.search_local(conn, query, limit, offset) if scope in ('local', 'all') else []
+        arxiv_results = fulltext.search_arxiv(conn, query, limit, offset) if scope in ('arxiv', 'all') else []
+
+        return jsonify({
+            'status': 'success',
+            'query': query,
+            'local_results': local_results,
+            'arxiv_results': arxiv_results
+        })
+
+    except Exception as e:
+        logger.error(f"Error in full-text search: {str(e)}", exc_info=True)
+        return jsonify({
+            'status': 'error',
+            'message': str(e)
+        }), 500
 
 @app.route('/analyze/sentiment', methods=['POST'])
 def analyze_sentiment():
@@ -153,7 +274,7 @@ def analyze_sentiment():
                 'message': 'Missing document path'
             }), 400
             
-        sentiment_results = sentiment_analyzer.analyze_document(doc_path)
+        sentiment_results = sentiment_cache.document(doc_path, get_db())
         
         if 'error' in sentiment_results:
             return jsonify({
@@ -161,7 +282,7 @@ def analyze_sentiment():
                 'message': sentiment_results['error']
             }), 500
             
-        sentiment_results['sentiment_label'] = sentiment_analyzer.get_sentiment_label(
+        sentiment_results['sentiment_label'] = SentimentAnalyzer.get_sentiment_label(
             sentiment_results['overall_sentiment']['polarity']
         )
         
@@ -170,6 +291,8 @@ def analyze_sentiment():
             'results': sentiment_results
         })
         
+    except AnalysisRejected as e:
+        return analysis_rejected(e)
     except Exception as e:
         logger.error(f"Error analyzing sentiment: {str(e)}", exc_info=True)
         return jsonify({
@@ -182,7 +305,7 @@ def get_paper_sentiment(paper_id):
     try:
         logger.info(f"Getting sentiment for paper ID: {paper_id}")
         
-        conn = get_connection("data/test_db.sqlite")
+        conn = get_db()
         cur = conn.cursor()
         cur.execute("SELECT paper_json FROM papers WHERE paper_id = ?", (paper_id,))
         result = cur.fetchone()
@@ -196,8 +319,18 @@ def get_paper_sentiment(paper_id):
             
         json_path = result[0]
         logger.info(f"Found JSON path for paper: {json_path}")
-            
-        sentiment_results = sentiment_analyzer.analyze_document(json_path)
+
+        if os.path.exists(json_path):
+            sentiment_results = sentiment_cache.document(json_path, conn)
+        else:
+            # Papers ingested with the 'pdf' engine have no JSON, use the text stored at ingest time
+            paper_text = get_paper_text(cur, paper_id)
+            if paper_text is None:
+                return jsonify({
+                    'status': 'error',
+                    'message': 'No text available for this paper'
+                }), 404
+            sentiment_results = sentiment_cache.text(paper_key(paper_id), paper_text, conn)
         
         if 'error' in sentiment_results:
             logger.error(f"Error in sentiment analysis: {sentiment_results['error']}")
@@ -206,7 +339,7 @@ def get_paper_sentiment(paper_id):
                 'message': sentiment_results['error']
             }), 500
             
-        sentiment_results['sentiment_label'] = sentiment_analyzer.get_sentiment_label(
+        sentiment_results['sentiment_label'] = SentimentAnalyzer.get_sentiment_label(
             sentiment_results['overall_sentiment']['polarity']
         )
         
@@ -217,15 +350,141 @@ def get_paper_sentiment(paper_id):
             'results': sentiment_results
         })
         
+    except AnalysisRejected as e:
+        return analysis_rejected(e)
     except Exception as e:
         logger.error(f"Error getting paper sentiment: {str(e)}", exc_info=True)
         return jsonify({
             'status': 'error',
             'message': str(e)
         }), 500
-    finally:
-        if 'conn' in locals():
-            conn.close()
+
+@app.route('/papers/<int:paper_id>/sentiment/stream', methods=['GET'])
+def stream_paper_sentiment(paper_id):
+    """Sentence-level sentiment of a paper as NDJSON, one sentence per line and the overall score last
+
+    Query parameters offset and limit select a range of sentences. A cached
+    analysis is paged directly. On a miss the text is split into sentences
+    once and scored in the analysis pool a batch at a time, so the first
+    lines go out while the rest is scored; sentence indexes are the same
+    either way, and the complete result is cached at the end.
+    """
+    try:
+        offset = max(int(request.args.get('offset', 0)), 0)
+        limit = int(request.args['limit']) if request.args.get('limit') else None
+
+        conn = get_db()
+        cur = conn.cursor()
+        cur.execute("SELECT paper_json FROM papers WHERE paper_id = ?", (paper_id,))
+        result = cur.fetchone()
+        if not result:
+            return jsonify({
+                'status': 'error',
+                'message': 'Paper not found'
+            }), 404
+
+        json_path = result[0]
+        if os.path.exists(json_path):
+            results = sentiment_cache.document(json_path, conn, compute=False)
+            # 未命中时边计算边输出：句子在分析进程池中分批打分，完整结果最后写入缓存
+            stream = sentiment_cache.document_stream(json_path, conn) if results is None else None
+        else:
+            text = get_paper_text(cur, paper_id)
+            if text is None:
+                return jsonify({
+                    'status': 'error',
+                    'message': 'No text available for this paper'
+                }), 404
+            results = sentiment_cache.text(paper_key(paper_id), text, conn, compute=False)
+            stream = sentiment_cache.text_stream(paper_key(paper_id), text, conn) if results is None else None
+        if results is not None and 'error' in results:
+            return jsonify({
+                'status': 'error',
+                'message': results['error']
+            }), 500
+    except Exception as e:
+        logger.error(f"Error streaming paper sentiment: {str(e)}", exc_info=True)
+        return jsonify({
+            'status': 'error',
+            'message': str(e)
+        }), 500
+
+    end = None if limit is None else offset + max(limit, 0)
+
+    def line(record):
+        return json.dumps(record) + '\n'
+
+    def records():
+        """(kind, value) pairs of the analysis, as SentimentCache._stream yields them"""
+        if stream is not None:
+            yield from stream
+            return
+        for entry in results['sentence_sentiments']:
+            yield 'sentence', entry
+        yield 'overall', results['overall_sentiment']
+
+    def generate():
+        try:
+            total = 0
+            count = 0
+            for kind, value in records():
+                if kind == 'sentence':
+                    if offset <= total and (end is None or total < end):
+                        yield line({'type': 'sentence', 'index': total, **value})
+                        count += 1
+                    total += 1
+                    continue
+                yield line({
+                    'type': 'overall',
+                    'paper_id': paper_id,
+                    **value,
+                    'sentiment_label': SentimentAnalyzer.get_sentiment_label(value['polarity']),
+                    'offset': offset,
+                    'count': count,
+                    'has_more': end is not None and end < total,
+                    'cached': stream is None
+                })
+        except AnalysisRejected as e:
+            yield line({'type': 'error', 'message': str(e), 'status': e.status_code})
+        except Exception as e:
+            logger.error(f"Error streaming paper sentiment: {str(e)}", exc_info=True)
+            yield line({'type': 'error', 'message': str(e)})
+
+    return Response(stream_with_context(generate()), mimetype='application/x-ndjson')
+
+@app.route('/papers/<int:paper_id>/artifacts', methods=['POST'])
+def create_paper_artifacts(paper_id):
+    """Generate the DOCX and simplified JSON of a paper ingested without them"""
+    try:
+        conn = get_db()
+        cur = conn.cursor()
+        cur.execute("SELECT paper_pdf, paper_docx, paper_json FROM papers WHERE paper_id = ?", (paper_id,))
+        result = cur.fetchone()
+
+        if not result or not os.path.isfile(result[0]):
+            return jsonify({
+                'status': 'error',
+                'message': 'Paper PDF not found'
+            }), 404
+
+        file_dict = materialize_artifacts({
+            'paper_pdf': result[0],
+            'paper_docx': result[1],
+            'paper_json': result[2]
+        })
+        return jsonify({
+            'status': 'success',
+            'paper_id': paper_id,
+            'paper_docx': file_dict['paper_docx'],
+            'paper_json': file_dict['paper_json']
+        })
+
+    except Exception as e:
+        logger.error(f"Error creating paper artifacts: {str(e)}", exc_info=True)
+        return jsonify({
+            'status': 'error',
+            'message': str(e)
+        }), 500
 
 @app.route('/papers/clusters', methods=['GET'])
 def get_paper_clusters():
@@ -233,64 +492,45 @@ def get_paper_clusters():
         # 获取查询参数
         n_clusters = int(request.args.get('n_clusters', 5))
         category = request.args.get('category', None)
+        mode = request.args.get('mode', 'auto')
+        if mode not in CLUSTER_MODES:
+            return jsonify({
+                'status': 'error',
+                'message': f"mode must be one of {', '.join(CLUSTER_MODES)}"
+            }), 400
         
-        logger.info(f"Getting paper clusters with n_clusters={n_clusters}, category={category}")
+        logger.info(f"Getting paper clusters with n_clusters={n_clusters}, category={category}, mode={mode}")
         
-        # 从数据库获取论文数据
-        conn = get_connection("data/test_db.sqlite")
-        cur = conn.cursor()
+        # 使用入库时保存的 TF-IDF 特征, 不再读取 JSON 文件和重新向量化；
+        # 尚未构建时在后台构建并返回 503
+        conn = get_db()
+        features = feature_store.get(conn)
+        if features is None:
+            return jsonify({
+                'status': 'error',
+                'message': 'No papers found'
+            }), 404
         
         if category:
-            cur.execute("""
-                SELECT paper_id, paper_name as title, paper_json
-                FROM papers 
-                WHERE paper_json LIKE ?
-            """, (f"%{category}%",))
+            # 在全文索引中匹配论文正文，而不是对 JSON 文件路径做 LIKE
+            match = fulltext.fts_query(category)
+            paper_ids = [row[0] for row in conn.execute(
+                "SELECT rowid FROM papers_fts WHERE papers_fts MATCH ?", (match,))] if match else []
+            matrix, paper_ids, titles = features.subset(paper_ids)
         else:
-            cur.execute("""
-                SELECT paper_id, paper_name as title, paper_json
-                FROM papers
-            """)
-            
-        papers = cur.fetchall()
+            matrix, paper_ids, titles = features.matrix, features.paper_ids, features.titles
         
-        if not papers:
+        if len(paper_ids) == 0:
             return jsonify({
                 'status': 'error',
                 'message': 'No papers found'
             }), 404
-            
-        # 处理论文数据
-        papers_data = []
-        for paper in papers:
-            try:
-                with open(paper[2], 'r', encoding='utf-8') as f:
-                    paper_json = json.load(f)
-                    
-                # 提取摘要
-                abstract = ""
-                for item in paper_json:
-                    if isinstance(item, dict) and item.get('TYPE') == 'text':
-                        abstract += item.get('VALUE', '') + " "
-                        
-                papers_data.append({
-                    'paper_id': paper[0],
-                    'title': paper[1],
-                    'abstract': abstract.strip()
-                })
-            except Exception as e:
-                logger.warning(f"Error processing paper {paper[0]}: {str(e)}")
-                continue
-        
-        # 执行聚类
-        paper_clusterer.n_clusters = n_clusters
-        clustering_results = paper_clusterer.process_papers(papers_data)
         
-        if 'error' in clustering_results:
-            return jsonify({
-                'status': 'error',
-                'message': clustering_results['error']
-            }), 500
+        # 执行聚类; 语料和参数都没变时直接使用缓存的结果
+        config = ClusteringConfig(n_clusters=n_clusters, mode=mode)
+        rows_digest = hashlib.sha256(paper_ids.tobytes()).hexdigest()
+        clustering_results = run_clustering(('local', features.signature, rows_digest, config),
+                                            cluster, matrix, paper_ids.tolist(), titles, features.terms, config)
             
         return jsonify({
             'status': 'success',
@@ -298,15 +538,152 @@ def get_paper_clusters():
             'results': clustering_results
         })
         
+    except AnalysisRejected as e:
+        return analysis_rejected(e)
     except Exception as e:
         logger.error(f"Error getting paper clusters: {str(e)}", exc_info=True)
         return jsonify({
             'status': 'error',
             'message': str(e)
         }), 500
-    finally:
-        if 'conn' in locals():
-            conn.close()
+
+def similar_papers(scope, paper_id):
+    """Answer a similar-papers request from the precomputed neighbour lists"""
+    try:
+        limit = max(1, min(int(request.args.get('limit', neighbour_index.TOP_K)), neighbour_index.TOP_K))
+        rows = neighbour_index.similar(get_db(), scope, paper_id, limit)
+        if rows is None:
+            return jsonify({
+                'status': 'error',
+                'message': 'Paper not found'
+            }), 404
+        return jsonify({
+            'status': 'success',
+            'id': paper_id,
+            'similar': [{'id': neighbour_id, 'title': title, 'score': round(score, 4)}
+                        for neighbour_id, title, score in rows]
+        })
+    except Exception as e:
+        logger.error(f"Error getting similar papers: {str(e)}", exc_info=True)
+        return jsonify({
+            'status': 'error',
+            'message': str(e)
+        }), 500
+
+@app.route('/papers/<int:paper_id>/similar', methods=['GET'])
+def get_similar_papers(paper_id):
+    return similar_papers('local', paper_id)
+
+@app.route('/arxiv/paper/<arxiv_id>/similar', methods=['GET'])
+def get_similar_arxiv_papers(arxiv_id):
+    return similar_papers('arxiv', arxiv_id)
+
+@app.route('/papers/<int:paper_id>/keywords', methods=['GET'])
+def get_paper_keywords(paper_id):
+    try:
+        limit = max(1, min(int(request.args.get('limit', 10)), 100))
+        features = feature_store.get(get_db())
+        keywords = features.top_terms(paper_id, limit) if features is not None else None
+        if keywords is None:
+            return jsonify({
+                'status': 'error',
+                'message': 'Paper not found'
+            }), 404
+        return jsonify({
+            'status': 'success',
+            'paper_id': paper_id,
+            'keywords': [{'term': term, 'weight': round(weight, 4)} for term, weight in keywords]
+        })
+    except AnalysisRejected as e:
+        return analysis_rejected(e)
+    except Exception as e:
+        logger.error(f"Error getting paper keywords: {str(e)}", exc_info=True)
+        return jsonify({
+            'status': 'error',
+            'message': str(e)
+        }), 500
+
+@app.route('/clusters/<scope>', methods=['GET'])
+def get_cluster_model(scope):
+    if scope not in cluster_models.SCOPES:
+        return jsonify({
+            'status': 'error',
+            'message': f"Invalid scope, expected one of: {', '.join(cluster_models.SCOPES)}"
+        }), 400
+    try:
+        conn = get_db()
+        model = cluster_models.current_model(conn, scope)
+        if model is None:
+            return jsonify({
+                'status': 'error',
+                'message': 'No cluster model has been fitted yet'
+            }), 404
+        sizes = cluster_models.cluster_sizes(conn, scope)
+        return jsonify({
+            'status': 'success',
+            'model': model.summary(),
+            'clusters': [{
+                'cluster_id': label,
+                'size': sizes.get(label, 0),
+                'terms': model.cluster_terms.get(label, [])
+            } for label in range(model.n_clusters)]
+        })
+    except Exception as e:
+        logger.error(f"Error getting cluster model: {str(e)}", exc_info=True)
+        return jsonify({
+            'status': 'error',
+            'message': str(e)
+        }), 500
+
+@app.route('/clusters/<scope>/<int:cluster_id>/papers', methods=['GET'])
+def get_cluster_papers(scope, cluster_id):
+    if scope not in cluster_models.SCOPES:
+        return jsonify({
+            'status': 'error',
+            'message': f"Invalid scope, expected one of: {', '.join(cluster_models.SCOPES)}"
+        }), 400
+    try:
+        limit = max(1, min(int(request.args.get('limit', 20)), 100))
+        offset = max(int(request.args.get('offset', 0)), 0)
+        rows = cluster_models.list_cluster(get_db(), scope, cluster_id, limit, offset)
+        return jsonify({
+            'status': 'success',
+            'cluster_id': cluster_id,
+            'papers': [{'id': paper_id, 'title': title} for paper_id, title in rows]
+        })
+    except Exception as e:
+        logger.error(f"Error listing cluster papers: {str(e)}", exc_info=True)
+        return jsonify({
+            'status': 'error',
+            'message': str(e)
+        }), 500
+
+@app.route('/clusters/<scope>/refit', methods=['POST'])
+def refit_cluster_model(scope):
+    if scope not in cluster_models.SCOPES:
+        return jsonify({
+            'status': 'error',
+            'message': f"Invalid scope, expected one of: {', '.join(cluster_models.SCOPES)}"
+        }), 400
+    try:
+        summary = analysis_pool.run(cluster_models.fit_database, db.pool.db_file, scope)
+        if summary is None:
+            return jsonify({
+                'status': 'error',
+                'message': 'Not enough papers to fit a cluster model'
+            }), 400
+        return jsonify({
+            'status': 'success',
+            'model': summary
+        })
+    except AnalysisRejected as e:
+        return analysis_rejected(e)
+    except Exception as e:
+        logger.error(f"Error refitting cluster model: {str(e)}", exc_info=True)
+        return jsonify({
+            'status': 'error',
+            'message': str(e)
+        }), 500
 
 @app.route('/health', methods=['GET'])
 def health_check():
@@ -316,6 +693,37 @@ def health_check():
         'message': 'Service is running'
     })
 
+@app.route('/ready', methods=['GET'])
+def readiness_check():
+    ingest_status = ingest_job.status()
+    watcher_status = papers_watcher.stats() if papers_watcher is not None else None
+    if ingest_job.ready:
+        return jsonify({
+            'status': 'ready',
+            'ingest': ingest_status,
+            'watcher': watcher_status
+        })
+    return jsonify({
+        'status': 'starting' if ingest_status['state'] in ['pending', 'running'] else 'error',
+        'message': 'Local paper ingestion has not finished yet, search results may be incomplete',
+        'ingest': ingest_status,
+        'watcher': watcher_status
+    }), 503
+
+@app.route('/metrics', methods=['GET'])
+def metrics():
+    return jsonify({
+        'status': 'success',
+        'sentiment_cache': sentiment_cache.stats(),
+        'analysis_pool': analysis_pool.stats(),
+        'feature_store': feature_store.stats(),
+        'clustering_cache': clustering_cache.stats(),
+        'neighbour_index': neighbour_index.stats(get_db()),
+        'arxiv_cache': arxiv_client.cache.stats(),
+        'arxiv_rate_limit': arxiv_client.limiter.stats(),
+        'models': models.status()
+    })
+
 @app.route('/arxiv/search', methods=['GET'])
 def search_arxiv_papers():
     try:
@@ -330,8 +738,8 @@ def search_arxiv_papers():
         # Log the received search type
         logger.info(f"Searching arXiv papers: query={query}, type={search_type}, start={start}, max_results={max_results}, cluster={should_cluster}")
 
-        # Pass search_type to the client method
-        search_result = arxiv_client.search_papers(query, start, max_results, search_type=search_type)
+        # Pass search_type to the client method; the cache uses the request's connection
+        search_result = arxiv_client.search_papers(query, start, max_results, search_type=search_type, conn=get_db())
 
         # Extract papers and total results from the dictionary
         papers = search_result.get('papers', [])
@@ -344,21 +752,22 @@ def search_arxiv_papers():
                 'message': search_result['error']
             }), 500
 
-        # Perform sentiment analysis on abstracts
+        # Perform sentiment analysis on abstracts, all uncached abstracts of the page in one batch.
+        # Only the overall polarity is shown, so per-sentence scoring is skipped
         try:
-            for paper in papers:
-                if paper.get('abstract'):
-                    # Assuming sentiment_analyzer has a method for direct text analysis
-                    # You might need to adapt this based on your SentimentAnalyzer implementation
-                    sentiment_score = sentiment_analyzer.analyze_text(paper['abstract'])
-                    if sentiment_score and 'overall_sentiment' in sentiment_score:
-                         polarity = sentiment_score['overall_sentiment']['polarity']
-                         paper['sentiment_label'] = sentiment_analyzer.get_sentiment_label(polarity)
-                         paper['sentiment_score'] = round(polarity, 2)
-                    else:
-                        paper['sentiment_label'] = 'N/A' # Mark if analysis failed
-                        paper['sentiment_score'] = 'N/A'
+            with_abstract = [paper for paper in papers if paper.get('abstract')]
+            scores = sentiment_cache.texts([(arxiv_key(paper['arxiv_id']), paper['abstract']) for paper in with_abstract],
+                                           overall_only=True, conn=get_db())
+            for paper, sentiment_score in zip(with_abstract, scores):
+                if sentiment_score and 'overall_sentiment' in sentiment_score:
+                     polarity = sentiment_score['overall_sentiment']['polarity']
+                     paper['sentiment_label'] = SentimentAnalyzer.get_sentiment_label(polarity)
+                     paper['sentiment_score'] = round(polarity, 2)
                 else:
+                    paper['sentiment_label'] = 'N/A' # Mark if analysis failed
+                    paper['sentiment_score'] = 'N/A'
+            for paper in papers:
+                if not paper.get('abstract'):
                     paper['sentiment_label'] = 'N/A' # No abstract
                     paper['sentiment_score'] = 'N/A'
         except Exception as e:
@@ -369,7 +778,7 @@ def search_arxiv_papers():
                 paper['sentiment_score'] = 'Error'
 
         # 保存到数据库 (pass the list of papers)
-        conn = get_connection("data/test_db.sqlite")
+        conn = get_db()
         try:
             if papers: # Only save if there are papers
                 arxiv_client.save_papers_to_db(papers, conn)
@@ -385,14 +794,9 @@ def search_arxiv_papers():
                 'abstract': paper['abstract']
             } for paper in papers]
 
-            paper_clusterer.n_clusters = min(n_clusters, len(papers))
-            clustering_results = paper_clusterer.process_papers(papers_data)
-
-            if 'error' in clustering_results:
-                return jsonify({
-                    'status': 'error',
-                    'message': clustering_results['error']
-                }), 500
+            config = ClusteringConfig(n_clusters=min(n_clusters, len(papers)))
+            clustering_results = run_clustering(('texts', papers_digest(papers_data), config),
+                                                cluster_texts, papers_data, config)
 
             return jsonify({
                 'status': 'success',
@@ -407,15 +811,14 @@ def search_arxiv_papers():
             'total_results': total_results # Include total results
         })
 
+    except AnalysisRejected as e:
+        return analysis_rejected(e)
     except Exception as e:
         logger.error(f"Error searching arXiv papers: {str(e)}", exc_info=True)
         return jsonify({
             'status': 'error',
             'message': str(e)
         }), 500
-    finally:
-        if 'conn' in locals():
-            conn.close()
 
 @app.route('/arxiv/paper/<arxiv_id>', methods=['GET'])
 def get_arxiv_paper(arxiv_id):
@@ -423,7 +826,7 @@ def get_arxiv_paper(arxiv_id):
         logger.info(f"Getting arXiv paper: {arxiv_id}")
         
         # 先从数据库查找
-        conn = get_connection("data/test_db.sqlite")
+        conn = get_db()
         cur = conn.cursor()
         
         cur.execute("SELECT json_data FROM arxiv_papers WHERE arxiv_id = ?", (arxiv_id,))
@@ -433,7 +836,7 @@ def get_arxiv_paper(arxiv_id):
             paper = json.loads(result[0])
         else:
             # 如果数据库中没有，从API获取
-            paper = arxiv_client.get_paper_by_id(arxiv_id)
+            paper = arxiv_client.get_paper_by_id(arxiv_id, conn=conn)
             if isinstance(paper, dict) and 'error' not in paper:
                 try:
                     arxiv_client.save_papers_to_db([paper], conn)
@@ -457,9 +860,6 @@ def get_arxiv_paper(arxiv_id):
             'status': 'error',
             'message': str(e)
         }), 500
-    finally:
-        if 'conn' in locals():
-            conn.close()
 
 @app.route('/unified_search', methods=['GET'])
 def unified_search():
@@ -504,7 +904,7 @@ def unified_search():
             }
         }
         
-        conn = get_connection("data/test_db.sqlite")
+        conn = get_db()
         cur = conn.cursor()
         
         # 执行本地搜索
@@ -607,11 +1007,12 @@ def unified_search():
                                     
                     # 尝试直接从实体表搜索包含关键词的组织
                     if len(local_results) == 0:
-                        direct_query = """
-                            SELECT p.* FROM papers p
-                            JOIN papers_have_entities phe ON p.paper_id = phe.paper_id
-                            JOIN entities e ON phe.entity_id = e.entity_id
-                            WHERE e.entity_type = 'ORG' AND e.entity_name LIKE ?
+                        # 与 build_query 相同的列，实体名和类型位于 result[9] 和 result[10]
+                        direct_query = f"""
+                            SELECT {', '.join(PAPER_COLUMNS + MENTION_COLUMNS)} FROM papers
+                            JOIN papers_have_entities ON papers.paper_id = papers_have_entities.paper_id
+                            JOIN entities ON papers_have_entities.entity_id = entities.entity_id
+                            WHERE entities.entity_type = 'ORG' AND entities.entity_name LIKE ?
                         """
                         search_term = f"%{entity_name}%"
                         logger.info(f"直接实体表查询: {direct_query} with term: {search_term}")
@@ -681,16 +1082,9 @@ def unified_search():
                             elif entity_name_lower in result_entity_lower or result_entity_lower in entity_name_lower:
                                 paper_data['relevance_score'] = 0.8  # 部分匹配
                             else:
-                                # 尝试从论文内容中找名字
+                                # 尝试从论文内容中找名字（全文索引，不再逐个读取 JSON）
                                 try:
-                                    with open(result[4], 'r', encoding='utf-8') as f:
-                                        paper_json = json.load(f)
-                                    paper_text = ""
-                                    for item in paper_json:
-                                        if isinstance(item, dict) and item.get('TYPE') == 'text':
-                                            paper_text += item.get('VALUE', '') + " "
-                                
-                                    if entity_name_lower in paper_text.lower():
+                                    if fulltext.paper_mentions(conn, result[0], entity_name):
                                         paper_data['relevance_score'] = 0.6  # 内容中找到名字
                                     else:
                                         paper_data['relevance_score'] = 0.4  # 相关实体但不是直接匹配
@@ -717,12 +1111,12 @@ def unified_search():
                     if is_person_query:
                         # 使用专门的作者搜索功能
                         logger.info(f"使用专门的作者搜索功能搜索arXiv: {entity_name}")
-                        arxiv_papers = arxiv_client.search_by_author(entity_name, start, max_results)
+                        arxiv_papers = arxiv_client.search_by_author(entity_name, start, max_results, conn=conn)
                     else:
                         # 普通实体搜索
                         arxiv_query = entity_name
                         logger.info(f"使用实体名称搜索arXiv: {arxiv_query}")
-                        arxiv_papers = arxiv_client.search_papers(arxiv_query, start, max_results)
+                        arxiv_papers = arxiv_client.search_papers(arxiv_query, start, max_results, conn=conn)
                     
                     if isinstance(arxiv_papers, dict) and 'error' in arxiv_papers:
                         results['arxiv_error'] = arxiv_papers['error']
@@ -737,7 +1131,7 @@ def unified_search():
                                 try:
                                     logger.info(f"Processing arXiv paper: {paper['title']}")
                                     # 检查论文是否已存在
-                                    cur.execute("SELECT paper_id FROM papers WHERE paper_name = ?", (paper['title'],))
+                                    cur.execute("SELECT paper_id FROM papers WHERE paper_name = ? COLLATE NOCASE", (paper['title'],))
                                     existing_paper = cur.fetchone()
                                     
                                     if existing_paper:
@@ -828,10 +1222,10 @@ def unified_search():
                 # 对于人名搜索，使用专门的作者搜索功能
                 if is_person_query and query:
                     logger.info(f"使用专门的作者搜索功能搜索arXiv: {query}")
-                    arxiv_papers = arxiv_client.search_by_author(query, start, max_results)
+                    arxiv_papers = arxiv_client.search_by_author(query, start, max_results, conn=conn)
                 else:
                     logger.info(f"使用普通关键词搜索arXiv: {query}")
-                    arxiv_papers = arxiv_client.search_papers(query, start, max_results)
+                    arxiv_papers = arxiv_client.search_papers(query, start, max_results, conn=conn)
                     
                 if isinstance(arxiv_papers, dict) and 'error' in arxiv_papers:
                     results['arxiv_error'] = arxiv_papers['error']
@@ -845,7 +1239,7 @@ def unified_search():
                             try:
                                 logger.info(f"Processing arXiv paper: {paper['title']}")
                                 # 检查论文是否已存在
-                                cur.execute("SELECT paper_id FROM papers WHERE paper_name = ?", (paper['title'],))
+                                cur.execute("SELECT paper_id FROM papers WHERE paper_name = ? COLLATE NOCASE", (paper['title'],))
                                 existing_paper = cur.fetchone()
                                 
                                 if existing_paper:
@@ -940,12 +1334,15 @@ def unified_search():
             # 添加本地论文
             for paper in results['local_results']:
                 try:
-                    with open(paper['json_path'], 'r', encoding='utf-8') as f:
-                        paper_json = json.load(f)
-                    abstract = ""
-                    for item in paper_json:
-                        if isinstance(item, dict) and item.get('TYPE') == 'text':
-                            abstract += item.get('VALUE', '') + " "
+                    # 优先使用入库时保存的全文
+                    abstract = get_paper_text(cur, paper['paper_id'])
+                    if abstract is None:
+                        with open(paper['json_path'], 'r', encoding='utf-8') as f:
+                            paper_json = json.load(f)
+                        abstract = ""
+                        for item in paper_json:
+                            if isinstance(item, dict) and item.get('TYPE') == 'text':
+                                abstract += item.get('VALUE', '') + " "
                     all_papers.append({
                         'paper_id': str(paper['paper_id']),
                         'title': paper['title'],
@@ -964,10 +1361,13 @@ def unified_search():
                 })
             
             if all_papers:
-                paper_clusterer.n_clusters = min(n_clusters, len(all_papers))
-                clustering_results = paper_clusterer.process_papers(all_papers)
-                if 'error' not in clustering_results:
-                    results['clusters'] = clustering_results
+                try:
+                    config = ClusteringConfig(n_clusters=min(n_clusters, len(all_papers)))
+                    results['clusters'] = run_clustering(('texts', papers_digest(all_papers), config),
+                                                         cluster_texts, all_papers, config)
+                except Exception as e:
+                    # 搜索结果照常返回, 只是没有聚类
+                    logger.warning(f"Skipping clustering of unified search results: {str(e)}")
         
         return jsonify(results)
         
@@ -977,27 +1377,6 @@ def unified_search():
             'status': 'error',
             'message': str(e)
         }), 500
-    finally:
-        if 'conn' in locals():
-            conn.close()
-
-def load_arxiv_metadata(file_path, limit=None):
-    """加载arXiv元数据文件"""
-    papers = []
-    try:
-        with open(file_path, 'r', encoding='utf-8') as f:
-            for i, line in enumerate(f):
-                if limit and i >= limit:
-                    break
-                try:
-                    paper = json.loads(line.strip())
-                    papers.append(paper)
-                except json.JSONDecodeError:
-                    continue
-        return papers
-    except Exception as e:
-        logger.error(f"Error loading arXiv metadata: {str(e)}")
-        return None
 
 @app.route('/arxiv/metadata/analysis', methods=['GET'])
 def analyze_arxiv_metadata():
@@ -1006,81 +1385,23 @@ def analyze_arxiv_metadata():
         limit = request.args.get('limit', type=int)
         analysis_type = request.args.get('type', 'all')  # categories, authors, time, all
         
-        # 加载数据
+        # 在分析进程池中加载并统计数据
         file_path = os.path.join(os.path.dirname(__file__), 'arxiv', 'arxiv-metadata-oai-snapshot.json')
-        papers = load_arxiv_metadata(file_path, limit)
+        results = analysis_pool.run(analyze_metadata, file_path, limit, analysis_type)
         
-        if not papers:
+        if results is None:
             return jsonify({
                 'status': 'error',
                 'message': 'Failed to load arXiv metadata'
             }), 500
-            
-        results = {}
-        
-        # 分类统计
-        if analysis_type in ['categories', 'all']:
-            category_counter = Counter()
-            for paper in papers:
-                categories = paper.get('categories', '').split()
-                category_counter.update(categories)
-            
-            results['category_analysis'] = {
-                'total_categories': len(category_counter),
-                'category_distribution': dict(category_counter.most_common(20))
-            }
-        
-        # 作者统计
-        if analysis_type in ['authors', 'all']:
-            author_counter = Counter()
-            for paper in papers:
-                authors_parsed = paper.get('authors_parsed', [])
-                for author in authors_parsed:
-                    if author and len(author) >= 2:
-                        author_name = f"{author[0]}, {author[1]}"
-                        author_counter[author_name] += 1
-            
-            results['author_analysis'] = {
-                'total_authors': len(author_counter),
-                'top_authors': dict(author_counter.most_common(20))
-            }
-        
-        # 时间趋势分析
-        if analysis_type in ['time', 'all']:
-            time_counter = Counter()
-            version_counter = Counter()
-            
-            for paper in papers:
-                update_date = paper.get('update_date', '')
-                if update_date:
-                    try:
-                        year = datetime.strptime(update_date, '%Y-%m-%d').year
-                        time_counter[year] += 1
-                    except ValueError:
-                        continue
-                
-                versions = paper.get('versions', [])
-                version_counter[len(versions)] += 1
-            
-            results['time_analysis'] = {
-                'yearly_distribution': dict(sorted(time_counter.items())),
-                'version_distribution': dict(sorted(version_counter.items()))
-            }
-        
-        # 基本统计
-        if analysis_type == 'all':
-            results['basic_stats'] = {
-                'total_papers': len(papers),
-                'papers_with_doi': sum(1 for p in papers if p.get('doi')),
-                'papers_with_license': sum(1 for p in papers if p.get('license')),
-                'papers_with_journal_ref': sum(1 for p in papers if p.get('journal-ref'))
-            }
         
         return jsonify({
             'status': 'success',
             'analysis_results': results
         })
         
+    except AnalysisRejected as e:
+        return analysis_rejected(e)
     except Exception as e:
         logger.error(f"Error analyzing arXiv metadata: {str(e)}", exc_info=True)
         return jsonify({
@@ -1097,12 +1418,12 @@ def get_papers():
     """获取论文列表的API"""
     source = request.args.get('source', 'all')
     try:
-        conn = get_connection("data/test_db.sqlite")
+        conn = get_db()
         
         if source == 'local':
             # 使用简化的查询逻辑获取本地论文
             query = "SELECT rowid as id, * FROM papers"
-            papers = query_db(conn, query)
+            papers = db.query_db(conn, query)
             
         elif source == 'arxiv':
             # 从arxiv_papers表获取论文
@@ -1121,7 +1442,7 @@ def get_papers():
                 FROM arxiv_papers
                 ORDER BY relevance_score DESC, published DESC
             """
-            papers = query_db(conn, query)
+            papers = db.query_db(conn, query)
             
             # 处理json格式的字段
             for paper in papers:
@@ -1156,11 +1477,11 @@ def get_papers():
                 FROM arxiv_papers
             """
             
-            papers = query_db(conn, local_query)
+            papers = db.query_db(conn, local_query)
             for paper in papers:
                 paper['source'] = 'local'
             
-            arxiv_papers = query_db(conn, arxiv_query)
+            arxiv_papers = db.query_db(conn, arxiv_query)
             # 处理json格式的字段
             for paper in arxiv_papers:
                 try:
@@ -1180,7 +1501,6 @@ def get_papers():
             # 按发布日期排序
             papers.sort(key=lambda x: x.get('published', ''), reverse=True)
         
-        conn.close()
         return jsonify({'papers': papers})
     
     except Exception as e:
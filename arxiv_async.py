@@ -0,0 +1,267 @@
+from concurrent.futures import TimeoutError as FutureTimeoutError
+import threading
+import asyncio
+import logging
+import random
+import urllib.parse
+import os
+
+import aiohttp
+
+from arxiv_feed import AtomStreamParser, author_relevance
+from rate_limiter import arxiv_limiter
+
+logger = logging.getLogger(__name__)
+
+# Seconds to open a connection and to wait between bytes of a response
+ARXIV_CONNECT_TIMEOUT = float(os.environ.get('ARXIV_CONNECT_TIMEOUT', 5))
+ARXIV_READ_TIMEOUT = float(os.environ.get('ARXIV_READ_TIMEOUT', 30))
+# Attempts after the first one for 429/5xx answers and connection errors, and the base of their backoff
+ARXIV_RETRIES = int(os.environ.get('ARXIV_RETRIES', 3))
+ARXIV_BACKOFF = float(os.environ.get('ARXIV_BACKOFF', 1.0))
+# Larger max_results are fetched as concurrent pages of this size
+ARXIV_PAGE_SIZE = int(os.environ.get('ARXIV_PAGE_SIZE', 100))
+# Bytes of the response handed to the streaming parser at a time
+ARXIV_CHUNK_SIZE = int(os.environ.get('ARXIV_CHUNK_SIZE', 64 * 1024))
+# Keep-alive connections kept open to the API
+ARXIV_CONNECTIONS = int(os.environ.get('ARXIV_CONNECTIONS', 4))
+# Longest a synchronous wrapper waits for a whole call, retries and pages included
+ARXIV_CALL_TIMEOUT = float(os.environ.get('ARXIV_CALL_TIMEOUT', 120))
+
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+
+
+class ArxivError(Exception):
+    """The arXiv API answered with an error status or could not be reached"""
+
+
+def build_query(query, search_type):
+    """@brief the search_query of a keyword, exact author or exact title search"""
+    if search_type == 'author':
+        return f'au:"{query}"'
+    if search_type == 'title':
+        return f'ti:"{query}"'
+    return f'all:{query}'
+
+
+class AsyncArxivClient:
+    """arXiv API calls as coroutines over one keep-alive aiohttp session
+
+    Every HTTP request first takes a token from the rate limiter, so
+    concurrent pages and callers together stay within arXiv's limit. Failed
+    requests (429, 5xx, timeouts, connection errors) are retried with
+    exponential backoff and full jitter, honouring Retry-After. The session
+    belongs to the event loop it was created on; use it from one loop, e.g.
+    the one of AsyncRunner.
+    """
+
+    def __init__(self, base_url, limiter=None, connect_timeout=ARXIV_CONNECT_TIMEOUT,
+                 read_timeout=ARXIV_READ_TIMEOUT, retries=ARXIV_RETRIES, backoff=ARXIV_BACKOFF,
+                 page_size=ARXIV_PAGE_SIZE, connections=ARXIV_CONNECTIONS):
+        self.base_url = base_url
+        self.limiter = limiter or arxiv_limiter()
+        self.timeout = aiohttp.ClientTimeout(sock_connect=connect_timeout, sock_read=read_timeout)
+        self.retries = retries
+        self.backoff = backoff
+        self.page_size = page_size
+        self.connections = connections
+        self.session = None
+        self.counters = {'requests': 0, 'retries': 0, 'failures': 0}
+
+    def _session(self):
+        if self.session is None or self.session.closed:
+            self.session = aiohttp.ClientSession(
+                timeout=self.timeout,
+                connector=aiohttp.TCPConnector(limit=self.connections, keepalive_timeout=60))
+        return self.session
+
+    async def close(self):
+        if self.session is not None:
+            await self.session.close()
+            self.session = None
+
+    async def _get(self, params):
+        """@brief GET the API with the given query parameters, retrying transient failures
+
+        The response is parsed while it is received, one chunk at a time.
+
+        Returns:
+            (tuple): (list of paper dicts, opensearch total or None)
+
+        Raises:
+            ArxivError: an error status, or the last failure once the retries are used up
+        """
+        url = self.base_url + urllib.parse.urlencode(params, quote_via=urllib.parse.quote)
+        for attempt in range(self.retries + 1):
+            await self.limiter.acquire_async()
+            self.counters['requests'] += 1
+            retry_after = None
+            try:
+                async with self._session().get(url) as response:
+                    if response.status == 200:
+                        parser = AtomStreamParser()
+                        papers = []
+                        async for chunk in response.content.iter_chunked(ARXIV_CHUNK_SIZE):
+                            papers.extend(parser.feed(chunk))
+                        papers.extend(parser.close())
+                        return papers, parser.total
+                    if response.status not in RETRY_STATUSES:
+                        raise ArxivError(f"HTTP Error {response.status}: {response.reason}")
+                    error = ArxivError(f"HTTP Error {response.status}: {response.reason}")
+                    retry_after = response.headers.get('Retry-After')
+            except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+                error = ArxivError(f"{type(e).__name__}: {str(e) or 'timed out'}")
+            if attempt == self.retries:
+                break
+            delay = random.uniform(0, self.backoff * 2 ** attempt)
+            if retry_after is not None and retry_after.isdigit():
+                delay = max(delay, float(retry_after))
+            self.counters['retries'] += 1
+            logger.warning(f"arXiv request failed ({error}), retry {attempt + 1} in {delay:.2f}s")
+            await asyncio.sleep(delay)
+        self.counters['failures'] += 1
+        raise error
+
+    async def _page(self, search_query, start, max_results):
+        return await self._get({
+            'search_query': search_query,
+            'start': start,
+            'max_results': max_results,
+            'sortBy': 'submittedDate',
+            'sortOrder': 'descending',
+        })
+
+    async def search(self, query, start=0, max_results=10, search_type='keyword'):
+        """@brief search arXiv, see ArxivClient.search_papers
+
+        A max_results above page_size is fetched page by page: the first page
+        tells the total, the remaining pages up to it are requested concurrently.
+
+        Returns:
+            (dict): 'papers' and 'total_results'
+        """
+        search_query = build_query(query, search_type)
+        logger.info(f"Constructed arXiv query: {search_query}")
+        first = min(max_results, self.page_size)
+        papers, total = await self._page(search_query, start, first)
+        if total is None:
+            # The feed did not say how many results there are
+            total = len(papers)
+            if len(papers) == first:
+                logger.warning("opensearch_totalresults not found in feed. Using len(papers) as total_results, which might be inaccurate.")
+        else:
+            end = min(start + max_results, total)
+            pages = await asyncio.gather(*(self._page(search_query, page_start, min(self.page_size, end - page_start))
+                                           for page_start in range(start + first, end, self.page_size)))
+            for page_papers, _ in pages:
+                papers.extend(page_papers)
+
+        for paper in papers:
+            paper['relevance_score'] = author_relevance(query, paper['authors']) if search_type == 'author' else 1.0
+        if search_type == 'author':
+            papers.sort(key=lambda x: x['relevance_score'], reverse=True)
+        return {
+            'papers': papers,
+            'total_results': total
+        }
+
+    async def _author_attempt(self, query, start, max_results):
+        """Papers of one author-name attempt; a failed attempt counts as no match, so the next one is tried"""
+        try:
+            return (await self.search(query, start, max_results, search_type='author'))['papers']
+        except Exception as e:
+            logger.error(f"Error searching arXiv papers: {str(e)}")
+            return []
+
+    async def search_by_author(self, author_name, start=0, max_results=10):
+        """@brief author search with fallbacks, see ArxivClient.search_by_author
+
+        Only the final keyword search raises when arXiv fails; the author-name
+        attempts before it fall through on errors as on empty results.
+        """
+        results = []
+        logger.info(f"Exact author search: {author_name}")
+        results.extend(await self._author_attempt(author_name, start, max_results))
+
+        # Surname first for a two-part name
+        name_parts = author_name.split()
+        if ' ' in author_name and not results and len(name_parts) == 2:
+            surname_first = f"{name_parts[1]}, {name_parts[0]}"
+            logger.info(f"Author search with the surname first: {surname_first}")
+            results.extend(await self._author_attempt(surname_first, start, max_results))
+
+        # Initials without dots
+        if '.' in author_name and not results:
+            simplified_name = author_name.replace('.', ' ').replace('  ', ' ').strip()
+            logger.info(f"Author search without initials' dots: {simplified_name}")
+            results.extend(await self._author_attempt(simplified_name, start, max_results))
+
+        if not results:
+            logger.info(f"No exact author match, keyword search: {author_name}")
+            results.extend((await self.search(author_name, start, max_results, search_type='keyword'))['papers'])
+
+        unique_results = []
+        seen_ids = set()
+        for paper in results:
+            if paper['arxiv_id'] not in seen_ids:
+                seen_ids.add(paper['arxiv_id'])
+                unique_results.append(paper)
+        unique_results.sort(key=lambda x: x.get('relevance_score', 0), reverse=True)
+        return {
+            'papers': unique_results,
+            'total_results': len(unique_results)
+        }
+
+    async def get_paper(self, arxiv_id):
+        """@brief one paper by id
+
+        Returns:
+            (dict): the paper, {'error': 'Paper not found'} when arXiv has none
+        """
+        papers, _ = await self._get({'id_list': arxiv_id})
+        if not papers:
+            return {'error': 'Paper not found'}
+        return papers[0]
+
+    def stats(self):
+        return dict(self.counters)
+
+
+class AsyncRunner:
+    """An event loop in a daemon thread, so synchronous code (Flask views) can run coroutines on it
+
+    Keeping one loop alive is what lets the aiohttp session, and with it the
+    keep-alive connections, outlive a single call.
+    """
+
+    def __init__(self):
+        self.loop = None
+        self.lock = threading.Lock()
+
+    def _loop(self):
+        with self.lock:
+            if self.loop is None:
+                self.loop = asyncio.new_event_loop()
+                threading.Thread(target=self.loop.run_forever, name='arxiv-async', daemon=True).start()
+            return self.loop
+
+    def run(self, coro, timeout=ARXIV_CALL_TIMEOUT):
+        """@brief run a coroutine on the loop and wait for its result
+
+        Raises:
+            TimeoutError: the coroutine did not finish within timeout seconds; it is cancelled
+        """
+        future = asyncio.run_coroutine_threadsafe(coro, self._loop())
+        try:
+            return future.result(timeout)
+        except FutureTimeoutError:
+            future.cancel()
+            raise TimeoutError(f"arXiv call did not finish within {timeout:g}s") from None
+
+
+_runner = AsyncRunner()
+
+
+def runner():
+    """The AsyncRunner shared by every ArxivClient of this process"""
+    return _runner
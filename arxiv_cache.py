@@ -0,0 +1,197 @@
+from contextlib import nullcontext
+import threading
+import sqlite3
+import logging
+import time
+import json
+import os
+
+import db
+
+logger = logging.getLogger(__name__)
+
+# Seconds a cached result is fresh, per kind of call
+TTLS = {
+    'search': float(os.environ.get('ARXIV_CACHE_TTL_SEARCH', 3600)),
+    'author': float(os.environ.get('ARXIV_CACHE_TTL_SEARCH', 3600)),
+    'paper': float(os.environ.get('ARXIV_CACHE_TTL_PAPER', 86400)),
+}
+# Seconds after expiry during which the old result is still served while it is refreshed in the background
+STALE_SECONDS = float(os.environ.get('ARXIV_CACHE_STALE', 86400))
+# Entries kept in the arxiv_response_cache table, least recently used go first; 0 disables the cache
+MAX_ENTRIES = int(os.environ.get('ARXIV_CACHE_ENTRIES', 2000))
+
+
+def cache_key(kind, params):
+    """@brief a key that is the same for requests arXiv answers the same way
+
+    Strings are compared case-insensitively with collapsed whitespace, as the
+    arXiv search does.
+
+    Args:
+        kind (str): a key of TTLS
+        params (tuple): the call's arguments
+    """
+    normalized = [' '.join(value.split()).lower() if isinstance(value, str) else value for value in params]
+    return json.dumps([kind] + normalized)
+
+
+class ArxivCache:
+    """Parsed arXiv API results cached in SQLite with per-kind TTLs
+
+    A fresh entry is answered without contacting arXiv (and without the
+    client's rate-limit sleep or Atom parsing). An entry that expired less
+    than stale_seconds ago is answered as well while one background thread
+    refetches it; an older one is refetched before answering, and still
+    served if that fetch fails. Results with an 'error' key are never stored.
+    """
+
+    def __init__(self, ttls=None, stale_seconds=STALE_SECONDS, max_entries=MAX_ENTRIES, pool=None):
+        """
+        Args:
+            ttls (dict): seconds an entry of each kind is fresh, defaults to TTLS
+            stale_seconds (float): how long an expired entry may still be served
+            max_entries (int): entries kept on disk, 0 disables the cache
+            pool (db.ConnectionPool): defaults to db.pool
+        """
+        self.ttls = dict(TTLS, **(ttls or {}))
+        self.stale_seconds = stale_seconds
+        self.max_entries = max_entries
+        self.pool = pool or db.pool
+        self.lock = threading.Lock()
+        self.refreshing = set()
+        self.counters = {'hits': 0, 'stale_hits': 0, 'misses': 0, 'stale_on_error': 0,
+                         'revalidations': 0, 'evictions': 0}
+
+    def fetch(self, kind, params, load, conn=None):
+        """@brief the cached result of an arXiv call, calling load() when there is none
+
+        Args:
+            kind (str): a key of TTLS
+            params (tuple): the call's arguments, normalized by cache_key()
+            load (callable): fetches and parses the result from arXiv
+            conn (sqlite3.Connection): the caller's connection, e.g. one a request
+                already holds; when None a pooled one is checked out for the lookup
+                and the store and not held while arXiv is called
+
+        Returns:
+            (dict): the result, a new object on every call
+        """
+        if self.max_entries <= 0:
+            return load()
+        key = cache_key(kind, params)
+        with self._connection(conn) as lookup_conn:
+            try:
+                row = lookup_conn.execute("SELECT fetched_at, results FROM arxiv_response_cache WHERE cache_key = ?",
+                                   (key,)).fetchone()
+            except sqlite3.Error as e:
+                # e.g. the schema has not been migrated yet: answer from arXiv
+                logger.warning(f"arXiv cache unavailable: {str(e)}")
+                row = None
+            now = time.time()
+            if row is not None and now - row[0] < self.ttls[kind] + self.stale_seconds:
+                self._touch(lookup_conn, key, now)
+                if now - row[0] < self.ttls[kind]:
+                    self._count('hits')
+                else:
+                    self._count('stale_hits')
+                    self._revalidate(kind, key, load)
+                return json.loads(row[1])
+
+        # No pooled connection is held while arXiv is called
+        self._count('misses')
+        results = load()
+        if 'error' in results:
+            if row is not None:
+                logger.warning(f"arXiv call failed, serving an expired result: {results['error']}")
+                self._count('stale_on_error')
+                return json.loads(row[1])
+            return results
+        with self._connection(conn) as store_conn:
+            self._store(store_conn, kind, key, results)
+        return results
+
+    def _connection(self, conn):
+        """The caller's connection as is, or a pooled one checked out for a with block"""
+        return nullcontext(conn) if conn is not None else self.pool.connection()
+
+    def _count(self, counter):
+        with self.lock:
+            self.counters[counter] += 1
+
+    def _touch(self, conn, key, now):
+        """Record a hit for the LRU order; skipped rather than waited for while the database is busy"""
+        try:
+            conn.execute("UPDATE arxiv_response_cache SET accessed_at = ? WHERE cache_key = ?", (now, key))
+            conn.commit()
+        except sqlite3.OperationalError as e:
+            conn.rollback()
+            logger.debug(f"Could not update arXiv cache access time: {str(e)}")
+
+    def _store(self, conn, kind, key, results):
+        now = time.time()
+        try:
+            conn.execute("""INSERT INTO arxiv_response_cache(cache_key, kind, fetched_at, accessed_at, results)
+                VALUES(?, ?, ?, ?, ?)
+                ON CONFLICT(cache_key) DO UPDATE SET
+                    fetched_at = excluded.fetched_at, accessed_at = excluded.accessed_at, results = excluded.results""",
+                (key, kind, now, now, json.dumps(results)))
+            excess = conn.execute("SELECT count(*) FROM arxiv_response_cache").fetchone()[0] - self.max_entries
+            if excess > 0:
+                conn.execute("""DELETE FROM arxiv_response_cache WHERE cache_key IN
+                    (SELECT cache_key FROM arxiv_response_cache ORDER BY accessed_at LIMIT ?)""", (excess,))
+                with self.lock:
+                    self.counters['evictions'] += excess
+            conn.commit()
+        except sqlite3.Error as e:
+            conn.rollback()
+            logger.warning(f"Could not cache arXiv results: {str(e)}")
+
+    def _revalidate(self, kind, key, load):
+        """Refetch an expired entry in a background thread, once per key at a time"""
+        with self.lock:
+            if key in self.refreshing:
+                return
+            self.refreshing.add(key)
+
+        def run():
+            try:
+                results = load()
+                if 'error' in results:
+                    logger.warning(f"Refreshing cached arXiv results failed: {results['error']}")
+                    return
+                with self.pool.connection() as conn:
+                    self._store(conn, kind, key, results)
+                self._count('revalidations')
+            except Exception as e:
+                logger.error(f"Refreshing cached arXiv results failed: {str(e)}")
+            finally:
+                with self.lock:
+                    self.refreshing.discard(key)
+
+        threading.Thread(target=run, name='arxiv-cache-revalidate', daemon=True).start()
+
+    def clear(self):
+        with self.pool.connection() as conn:
+            conn.execute("DELETE FROM arxiv_response_cache")
+            conn.commit()
+
+    def stats(self):
+        """Return hit/miss counters and the number of stored entries for monitoring"""
+        with self.lock:
+            counters = dict(self.counters)
+            refreshing = len(self.refreshing)
+        with self.pool.connection() as conn:
+            try:
+                entries = conn.execute("SELECT count(*) FROM arxiv_response_cache").fetchone()[0]
+            except sqlite3.Error:
+                entries = None
+        lookups = counters['hits'] + counters['stale_hits'] + counters['misses']
+        return {
+            **counters,
+            'lookups': lookups,
+            'hit_ratio': (counters['hits'] + counters['stale_hits']) / lookups if lookups else None,
+            'refreshing': refreshing,
+            'entries': entries,
+            'capacity': self.max_entries,
+        }
@@ -0,0 +1,141 @@
+import xml.etree.ElementTree as ET
+import logging
+
+logger = logging.getLogger(__name__)
+
+ATOM = '{http://www.w3.org/2005/Atom}'
+OPENSEARCH = '{http://a9.com/-/spec/opensearch/1.1/}'
+
+_TEXT_FIELDS = {
+    ATOM + 'id': 'id',
+    ATOM + 'title': 'title',
+    ATOM + 'summary': 'abstract',
+    ATOM + 'published': 'published',
+    ATOM + 'updated': 'updated',
+}
+
+
+def _text(element):
+    return (element.text or '').strip()
+
+
+def entry_to_paper(entry):
+    """@brief the paper dict the application uses for one Atom <entry> element
+
+    Only the fields the application reads are extracted; text is stripped
+    of surrounding whitespace, as feedparser did.
+    """
+    fields = {'id': '', 'title': '', 'abstract': '', 'published': '', 'updated': ''}
+    authors = []
+    categories = []
+    for child in entry:
+        tag = child.tag
+        if tag in _TEXT_FIELDS:
+            fields[_TEXT_FIELDS[tag]] = _text(child)
+        elif tag == ATOM + 'author':
+            name = child.find(ATOM + 'name')
+            if name is not None:
+                authors.append(_text(name))
+        elif tag == ATOM + 'category':
+            term = child.get('term')
+            if term is not None:
+                categories.append(term)
+    arxiv_id = fields['id'].split('/abs/')[-1]
+    return {
+        'arxiv_id': arxiv_id,
+        'title': fields['title'],
+        'abstract': fields['abstract'],
+        'authors': authors,
+        'categories': categories,
+        'published': fields['published'],
+        'updated': fields['updated'],
+        'pdf_url': f"https://arxiv.org/pdf/{arxiv_id}.pdf",
+    }
+
+
+class AtomStreamParser:
+    """Incremental parser for arXiv API responses
+
+    Feed it the response body in chunks as they arrive; feed() returns the
+    papers whose <entry> was completed by that chunk, and each entry is
+    dropped from the tree once converted, so memory does not grow with the
+    number of entries. total holds opensearch:totalResults once it has been
+    seen (arXiv sends it before the entries), 0 when that value is not a
+    number (as the feedparser client reported it) and None when it is missing.
+    """
+
+    def __init__(self):
+        self.parser = ET.XMLPullParser(events=('start', 'end'))
+        self.root = None
+        self.total = None
+        self.count = 0
+
+    def feed(self, chunk):
+        """@brief parse the next chunk of the document
+
+        Returns:
+            (list): paper dicts of the entries completed by this chunk
+
+        Raises:
+            xml.etree.ElementTree.ParseError: the document is not well-formed XML
+        """
+        self.parser.feed(chunk)
+        return self._papers()
+
+    def close(self):
+        """@brief finish the document, raising ParseError if it was truncated
+
+        Returns:
+            (list): paper dicts of any entries completed by the end of the document
+        """
+        self.parser.close()
+        return self._papers()
+
+    def _papers(self):
+        papers = []
+        for event, element in self.parser.read_events():
+            if event == 'start':
+                if self.root is None:
+                    self.root = element
+                continue
+            if element.tag == ATOM + 'entry':
+                papers.append(entry_to_paper(element))
+                self.count += 1
+                try:
+                    self.root.remove(element)
+                except ValueError:
+                    # Not a direct child of <feed>, keep the element but drop its content
+                    element.clear()
+            elif element.tag == OPENSEARCH + 'totalResults':
+                try:
+                    self.total = int(_text(element))
+                except ValueError:
+                    logger.warning("Could not parse opensearch_totalresults")
+                    self.total = 0
+        return papers
+
+
+def parse_feed(body):
+    """@brief papers and total result count of a complete arXiv API response
+
+    Args:
+        body (bytes): the Atom document
+
+    Returns:
+        (tuple): (list of paper dicts, opensearch total: None when the feed has none, 0 when it is not a number)
+    """
+    parser = AtomStreamParser()
+    papers = parser.feed(body)
+    papers.extend(parser.close())
+    return papers, parser.total
+
+
+def author_relevance(query, authors):
+    """Relevance of a paper to an author search: 1.0 exact name, 0.8 partial, 0.4 otherwise"""
+    query_lower = query.lower()
+    if any(query_lower == author.lower() for author in authors):
+        return 1.0
+    if any(query_lower in author.lower() for author in authors):
+        return 0.8
+    # The author may only be mentioned in the content
+    return 0.4
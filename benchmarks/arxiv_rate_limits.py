@@ -0,0 +1,104 @@
+"""Throughput and burst checks of the arXiv token-bucket limiter
+
+Hammers a TokenBucket from many threads, and a SQLiteTokenBucket from
+several processes sharing one file, records when every request was let
+through, and checks that no one-second window (nor the whole run) admits
+more than rate x seconds + burst requests while throughput still reaches
+the configured rate. Exits non-zero if a check fails.
+
+Usage: python benchmarks/arxiv_rate_limits.py [--rate 10] [--burst 2] [--requests 60]
+"""
+import argparse
+import multiprocessing
+import os
+import sys
+import tempfile
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from rate_limiter import SQLiteTokenBucket, TokenBucket
+
+
+def worst_window(times, seconds=1.0):
+    """Most requests admitted within any window of the given length"""
+    times = sorted(times)
+    worst = 0
+    start = 0
+    for end, moment in enumerate(times):
+        while moment - times[start] >= seconds:
+            start += 1
+        worst = max(worst, end - start + 1)
+    return worst
+
+
+def hammer(limiter, requests, threads):
+    times = []
+    lock = threading.Lock()
+
+    def run(count):
+        for _ in range(count):
+            limiter.acquire()
+            with lock:
+                times.append(time.time())
+
+    workers = [threading.Thread(target=run, args=(requests // threads,)) for _ in range(threads)]
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+    return times
+
+
+def process_worker(path, rate, burst, count, queue):
+    limiter = SQLiteTokenBucket(path, rate=rate, burst=burst)
+    times = []
+    for _ in range(count):
+        limiter.acquire()
+        times.append(time.time())
+    queue.put(times)
+
+
+def report(name, times, rate, burst):
+    elapsed = max(times) - min(times)
+    window = worst_window(times)
+    throughput = (len(times) - burst) / elapsed if elapsed else float('inf')
+    ok = window <= rate + burst and len(times) <= rate * elapsed + burst + 1 and throughput >= rate * 0.9
+    print(f"{'ok ' if ok else 'FAIL'} {name}: {len(times)} requests in {elapsed:.2f}s, "
+          f"{throughput:.2f}/s after the burst, at most {window} in any 1s window")
+    return ok
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--rate', type=float, default=10)
+    parser.add_argument('--burst', type=int, default=2)
+    parser.add_argument('--requests', type=int, default=60)
+    args = parser.parse_args()
+
+    results = []
+    limiter = TokenBucket(args.rate, args.burst)
+    results.append(report('16 threads, one process', hammer(limiter, args.requests, 16), args.rate, args.burst))
+    stats = limiter.stats()
+    print(f"     queue wait: mean {stats['mean_wait_seconds']:.3f}s, p95 {stats['p95_wait_seconds']:.3f}s, "
+          f"max {stats['max_wait_seconds']:.3f}s")
+
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, 'rate.sqlite')
+        SQLiteTokenBucket(path, rate=args.rate, burst=args.burst)
+        queue = multiprocessing.Queue()
+        processes = [multiprocessing.Process(target=process_worker,
+                                             args=(path, args.rate, args.burst, args.requests // 4, queue))
+                     for _ in range(4)]
+        for process in processes:
+            process.start()
+        times = [moment for _ in processes for moment in queue.get()]
+        for process in processes:
+            process.join()
+        results.append(report('4 processes, shared SQLite bucket', times, args.rate, args.burst))
+    sys.exit(0 if all(results) else 1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,86 @@
+"""Paging, keep-alive, retry, timeout and rate-limit checks of the async arXiv client
+
+Runs ArxivClient (caching disabled) and AsyncArxivClient against
+FakeArxivServer. Exits non-zero if a check fails.
+
+Usage: python benchmarks/arxiv_transport.py
+"""
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from arxiv_async import AsyncArxivClient, runner
+from arxiv_cache import ArxivCache
+from arxiv_client import ArxivClient
+from fake_arxiv import FakeArxivServer
+from rate_limiter import TokenBucket
+from arxiv_rate_limits import worst_window
+
+
+def main():
+    failures = 0
+
+    def check(name, ok, detail=''):
+        nonlocal failures
+        failures += not ok
+        print(f"{'ok ' if ok else 'FAIL'} {name}{': ' + detail if detail else ''}")
+
+    rate = 20
+    with FakeArxivServer(total=1000) as server:
+        limiter = TokenBucket(rate=rate, burst=1)
+        client = ArxivClient(base_url=server.base_url, cache=ArxivCache(max_entries=0), limiter=limiter)
+
+        start = time.perf_counter()
+        results = client.search_papers('graph', 50, 250)
+        elapsed = time.perf_counter() - start
+        ids = [paper['arxiv_id'] for paper in results['papers']]
+        check('large max_results is fetched as pages', len(server.requests) == 3
+              and ids == [f"2401.{index:05d}v1" for index in range(50, 300)] and results['total_results'] == 1000,
+              f"{len(server.requests)} requests, {elapsed * 1000:.0f} ms")
+        results = client.search_papers('graph', 950, 200)
+        check('paging stops at the total', len(results['papers']) == 50 and len(server.requests) == 4)
+
+        for index in range(6):
+            client.get_paper_by_id(f"2401.{index:05d}")
+        check('connections are kept alive', len(server.ports) < len(server.requests),
+              f"{len(server.requests)} requests over {len(server.ports)} connections")
+        check('requests respect the rate limiter', worst_window(server.times) <= rate + 1,
+              f"at most {worst_window(server.times)} in any 1s window")
+
+        author = client.search_by_author('Author 1 Name', 0, 5)
+        check('author search wrapper', len(author['papers']) == 5 and 'error' not in author)
+
+        server.fail_next = 2
+        retrying = AsyncArxivClient(server.base_url, limiter, retries=3, backoff=0.05)
+        paper = runner().run(retrying.get_paper('2401.00042'))
+        check('503s are retried with backoff', paper.get('arxiv_id') == '2401.00042v1'
+              and retrying.stats()['retries'] == 2, str(retrying.stats()))
+
+        server.fail = True
+        failing = ArxivClient(base_url=server.base_url, cache=ArxivCache(max_entries=0), limiter=limiter)
+        failing.async_client.backoff = 0.05
+        result = failing.search_papers('graph', 0, 10)
+        check('exhausted retries give an error result', 'error' in result and result['papers'] == []
+              and failing.async_client.stats()['requests'] == failing.async_client.retries + 1, result.get('error', ''))
+        server.fail = False
+
+        server.delay = 2.0
+        slow = AsyncArxivClient(server.base_url, limiter, read_timeout=0.3, retries=1, backoff=0.05)
+        start = time.perf_counter()
+        try:
+            runner().run(slow.get_paper('2401.00001'))
+            timed_out = False
+        except Exception as e:
+            timed_out = 'Timeout' in type(e).__name__ or 'Timeout' in str(e)
+        elapsed = time.perf_counter() - start
+        check('a hung response times out instead of blocking', timed_out and elapsed < 1.5, f"{elapsed:.2f}s")
+        server.delay = 0.0
+        for async_client in (client.async_client, failing.async_client, retrying, slow):
+            runner().run(async_client.close())
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == '__main__':
+    main()
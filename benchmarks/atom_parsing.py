@@ -0,0 +1,118 @@
+"""Speed, memory and output parity of the streaming Atom parser against feedparser
+
+Parses arXiv responses of 10, 100 and 2000 entries with feedparser (the
+previous implementation, converted to paper dicts the way ArxivClient
+did), with arxiv_feed.parse_feed on the whole body, and with
+AtomStreamParser fed 64 KB chunks as they would arrive from the network.
+Reports the best of --repeat runs, peak traced memory and, for the
+streaming parser, the time until the first paper is available. Exits
+non-zero if the two parsers disagree on any paper or total.
+
+The fixtures are arXiv-shaped feeds from fake_arxiv.atom_feed (wrapped
+titles and abstracts, escaped markup, LaTeX, accented names); pass
+--fixtures DIR to use recorded responses saved as DIR/*.xml instead.
+
+Usage: python benchmarks/atom_parsing.py [--fixtures DIR] [--repeat 5]
+"""
+import argparse
+import glob
+import os
+import sys
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import feedparser
+
+from arxiv_feed import AtomStreamParser, parse_feed
+from fake_arxiv import atom_feed
+
+CHUNK_SIZE = 64 * 1024
+
+
+def feedparser_papers(body):
+    """What ArxivClient returned before the streaming parser"""
+    feed = feedparser.parse(body)
+    papers = [{
+        'arxiv_id': entry.id.split('/abs/')[-1],
+        'title': entry.title,
+        'abstract': entry.summary,
+        'authors': [author.name for author in entry.authors],
+        'categories': [t['term'] for t in entry.tags],
+        'published': entry.published,
+        'updated': entry.updated,
+        'pdf_url': f"https://arxiv.org/pdf/{entry.id.split('/abs/')[-1]}.pdf",
+    } for entry in feed.entries]
+    total = int(feed.feed.opensearch_totalresults) if hasattr(feed.feed, 'opensearch_totalresults') else None
+    return papers, total
+
+
+def streamed_papers(body, first=None):
+    parser = AtomStreamParser()
+    papers = []
+    start = time.perf_counter()
+    for offset in range(0, len(body), CHUNK_SIZE):
+        papers.extend(parser.feed(body[offset:offset + CHUNK_SIZE]))
+        if first is not None and papers and not first:
+            first.append(time.perf_counter() - start)
+    papers.extend(parser.close())
+    return papers, parser.total
+
+
+def best_time(fn, repeat):
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def peak_memory(fn):
+    tracemalloc.start()
+    fn()
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return peak / 2 ** 20
+
+
+def fixtures(directory):
+    if directory:
+        for path in sorted(glob.glob(os.path.join(directory, '*.xml'))):
+            with open(path, 'rb') as f:
+                yield os.path.basename(path), f.read()
+        return
+    for size in (10, 100, 2000):
+        yield f"{size} entries", atom_feed(size, total=50000)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--fixtures')
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+
+    mismatches = 0
+    print(f"{'feed':>14} {'KB':>7} {'parser':>11} {'ms':>9} {'entries/s':>10} {'peak MB':>8} {'first ms':>8}")
+    for name, body in fixtures(args.fixtures):
+        expected = feedparser_papers(body)
+        for label, fn in (('feedparser', lambda: feedparser_papers(body)),
+                          ('whole body', lambda: parse_feed(body)),
+                          ('64KB chunks', lambda: streamed_papers(body))):
+            result = fn()
+            if result != expected:
+                mismatches += 1
+                print(f"FAIL {name}: {label} differs from feedparser")
+            seconds = best_time(fn, args.repeat)
+            first = []
+            if label == '64KB chunks':
+                streamed_papers(body, first)
+            print(f"{name:>14} {len(body) / 1024:>7.0f} {label:>11} {seconds * 1000:>9.2f} "
+                  f"{len(expected[0]) / seconds:>10.0f} {peak_memory(fn):>8.2f} "
+                  f"{first[0] * 1000 if first else float('nan'):>8.2f}")
+    sys.exit(1 if mismatches else 0)
+
+
+if __name__ == '__main__':
+    main()
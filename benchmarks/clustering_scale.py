@@ -0,0 +1,87 @@
+"""Clustering time and peak memory of PaperClusterer's exact and scalable modes
+
+Documents are synthetic: every document draws most of its words from one
+of --topics word pools and the rest from a shared pool, so the true topic
+of each document is known and the clusterings can be scored against it
+(adjusted Rand index). Features come from the same TF-IDF settings as the
+app. The exact mode densifies the matrix for PCA; it is skipped above
+--exact-max documents.
+
+Usage: python benchmarks/clustering_scale.py [--sizes 1000 10000 100000] [--exact-max 20000]
+"""
+import argparse
+import os
+import random
+import sys
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sklearn.metrics import adjusted_rand_score
+
+from paper_clustering import PaperClusterer, make_vectorizer
+
+
+def make_corpus(n_documents, n_topics, words_per_document=80, seed=0):
+    rng = random.Random(seed)
+    topics = [[f"topic{topic}word{word}" for word in range(60)] for topic in range(n_topics)]
+    shared = [f"common{word}" for word in range(400)]
+    documents = []
+    labels = []
+    for _ in range(n_documents):
+        topic = rng.randrange(n_topics)
+        words = [rng.choice(topics[topic]) if rng.random() < 0.4 else rng.choice(shared)
+                 for _ in range(words_per_document)]
+        documents.append(' '.join(words))
+        labels.append(topic)
+    return documents, labels
+
+
+def measure(fn):
+    tracemalloc.start()
+    start = time.perf_counter()
+    result = fn()
+    seconds = time.perf_counter() - start
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return seconds, peak / 2 ** 20, result
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--sizes', type=int, nargs='+', default=[1000, 10000, 100000])
+    parser.add_argument('--topics', type=int, default=8)
+    parser.add_argument('--exact-max', type=int, default=20000)
+    args = parser.parse_args()
+
+    print(f"{'documents':>10} {'mode':>9} {'seconds':>8} {'peak MB':>8} {'ARI':>6}")
+    for size in args.sizes:
+        documents, labels = make_corpus(size, args.topics)
+        start = time.perf_counter()
+        features = make_vectorizer().fit_transform(documents).tocsr()
+        vectorize_seconds = time.perf_counter() - start
+        paper_ids = list(range(size))
+        titles = [''] * size
+        terms = list(range(features.shape[1]))
+        print(f"{size:>10} {'tf-idf':>9} {vectorize_seconds:>8.2f} {'':>8} {'':>6}")
+
+        for mode in ('exact', 'scalable'):
+            if mode == 'exact' and size > args.exact_max:
+                dense_mb = features.shape[0] * features.shape[1] * 8 / 2 ** 20
+                print(f"{size:>10} {mode:>9}  skipped (dense matrix alone would be {dense_mb:.0f} MB)")
+                continue
+            clusterer = PaperClusterer(n_clusters=args.topics, mode=mode)
+            seconds, peak_mb, result = measure(lambda: clusterer.process_features(features, paper_ids, titles, terms))
+            if 'error' in result:
+                print(f"{size:>10} {mode:>9}  failed: {result['error']}")
+                continue
+            predicted = [0] * size
+            for label, papers in result['clusters'].items():
+                for paper in papers:
+                    predicted[paper['paper_id']] = label
+            print(f"{size:>10} {mode:>9} {seconds:>8.2f} {peak_mb:>8.1f} {adjusted_rand_score(labels, predicted):>6.3f}")
+
+
+if __name__ == '__main__':
+    main()
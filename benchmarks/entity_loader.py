@@ -0,0 +1,99 @@
+"""Statements per paper for the old per-mention entity writes vs ingest.load_entities
+
+Usage: python benchmarks/entity_loader.py [--papers 20] [--mentions 5000]
+"""
+import argparse
+import os
+import random
+import sqlite3
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from ingest import load_entities
+from prototype import create_tables
+
+
+class CountingCursor:
+    """Cursor wrapper that counts execute/executemany calls made from Python"""
+
+    def __init__(self, cur):
+        self.cur = cur
+        self.calls = 0
+
+    def execute(self, *args):
+        self.calls += 1
+        return self.cur.execute(*args)
+
+    def executemany(self, *args):
+        self.calls += 1
+        return self.cur.executemany(*args)
+
+    def fetchone(self):
+        return self.cur.fetchone()
+
+
+def legacy_load(cur, paper_id, entities):
+    """The per-mention loop initialize_database() used before the bulk loader"""
+    for entity in entities:
+        cur.execute("""INSERT INTO entities(entity_name, entity_type)
+            VALUES(:text,:label)
+            ON CONFLICT(entity_name, entity_type) DO UPDATE SET entity_name=:text
+                RETURNING entity_id""", entity)
+        entity_id = cur.fetchone()[0]
+        cur.execute("""INSERT INTO papers_have_entities(entity_id, paper_id)
+            VALUES(:entity_id,:paper_id)
+            ON CONFLICT(entity_id, paper_id) DO UPDATE SET count=count+1""", {"entity_id": entity_id, "paper_id": paper_id})
+
+
+def make_papers(n_papers, n_mentions, vocabulary=20000, seed=42):
+    rng = random.Random(seed)
+    labels = ['PERSON', 'ORG', 'WORK_OF_ART', 'GPE', 'DATE']
+    names = [f"entity {i}" for i in range(vocabulary)]
+    return [[{'text': rng.choice(names), 'label': rng.choice(labels)} for _ in range(n_mentions)]
+            for _ in range(n_papers)]
+
+
+def run(loader, papers):
+    conn = sqlite3.connect(':memory:')
+    create_tables(conn.cursor())
+    statements = [0]
+    conn.set_trace_callback(lambda _: statements.__setitem__(0, statements[0] + 1))
+    cur = CountingCursor(conn.cursor())
+    start = time.perf_counter()
+    for paper_id, entities in enumerate(papers, start=1):
+        conn.execute("""INSERT INTO papers(paper_id, paper_name, paper_pdf, paper_docx, paper_json, paper_entities)
+            VALUES(?, ?, '', '', '', '')""", (paper_id, f"paper {paper_id}"))
+        loader(cur, paper_id, entities)
+        conn.commit()
+    elapsed = time.perf_counter() - start
+    links = conn.execute("SELECT COUNT(*), SUM(count) FROM papers_have_entities").fetchone()
+    conn.close()
+    return {
+        'calls_per_paper': cur.calls / len(papers),
+        'statements_per_paper': statements[0] / len(papers),
+        'ms_per_paper': 1000 * elapsed / len(papers),
+        'links': links,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--papers', type=int, default=20)
+    parser.add_argument('--mentions', type=int, default=5000)
+    args = parser.parse_args()
+
+    papers = make_papers(args.papers, args.mentions)
+    before = run(legacy_load, papers)
+    after = run(load_entities, papers)
+    assert before['links'] == after['links'], (before['links'], after['links'])
+
+    print(f"{args.papers} papers x {args.mentions} mentions, links (rows, total count): {after['links']}")
+    print(f"{'':<10}{'py calls/paper':>16}{'sqlite stmts/paper':>20}{'ms/paper':>10}")
+    for name, result in (('before', before), ('after', after)):
+        print(f"{name:<10}{result['calls_per_paper']:>16.1f}{result['statements_per_paper']:>20.1f}{result['ms_per_paper']:>10.2f}")
+
+
+if __name__ == '__main__':
+    main()
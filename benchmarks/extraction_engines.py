@@ -0,0 +1,67 @@
+"""Text extraction throughput of the 'docx' and 'pdf' ingestion engines over Papers/
+
+Only the extraction stages are timed (NER is identical for both engines).
+The docx engine writes its DOCX/JSON into a temporary directory so the
+committed Docs/ and JSON/ folders are not reused.
+
+Usage: python benchmarks/extraction_engines.py [--papers-dir Papers] [--limit N]
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from ingest import convert_to_docx, extract_pdf_text, simplify_to_json
+
+
+def docx_engine(pdf_path, out_dir):
+    name = os.path.basename(pdf_path)
+    payload = {'file': {
+        'paper_pdf': pdf_path,
+        'paper_docx': os.path.join(out_dir, name + '.docx'),
+        'paper_json': os.path.join(out_dir, name + '.json'),
+    }}
+    return simplify_to_json(convert_to_docx(payload))['paragraphs']
+
+
+def pdf_engine(pdf_path, out_dir):
+    return extract_pdf_text({'file': {'paper_pdf': pdf_path}})['paragraphs']
+
+
+def measure(engine, pdfs):
+    total_chars = 0
+    failed = 0
+    with tempfile.TemporaryDirectory() as out_dir:
+        start = time.perf_counter()
+        for pdf_path in pdfs:
+            try:
+                total_chars += sum(len(para) for para in engine(pdf_path, out_dir))
+            except Exception as e:
+                failed += 1
+                print(f"  {engine.__name__} failed on {pdf_path}: {e}", file=sys.stderr)
+        elapsed = time.perf_counter() - start
+    return elapsed, total_chars, failed
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--papers-dir', default='Papers')
+    parser.add_argument('--limit', type=int, default=None)
+    args = parser.parse_args()
+
+    pdfs = sorted(os.path.join(args.papers_dir, name) for name in os.listdir(args.papers_dir)
+                  if name.lower().endswith('.pdf'))[:args.limit]
+    megabytes = sum(os.path.getsize(path) for path in pdfs) / 1e6
+    print(f"{len(pdfs)} PDFs, {megabytes:.1f} MB")
+    print(f"{'engine':<8}{'seconds':>10}{'papers/s':>10}{'MB/s':>8}{'chars':>12}{'failed':>8}")
+    for engine in (pdf_engine, docx_engine):
+        elapsed, chars, failed = measure(engine, pdfs)
+        name = engine.__name__.split('_')[0]
+        print(f"{name:<8}{elapsed:>10.2f}{len(pdfs) / elapsed:>10.2f}{megabytes / elapsed:>8.2f}{chars:>12}{failed:>8}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,121 @@
+"""A local stand-in for export.arxiv.org/api/query, for the arXiv client checks
+
+atom_feed() generates an Atom response shaped like arXiv's (opensearch
+totals, authors, categories, links). FakeArxivServer serves it on
+127.0.0.1 and counts the requests it received, so a check can tell calls
+that reached the "API" from cache hits. Point a client at it with
+ArxivClient(base_url=server.base_url).
+"""
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+from xml.sax.saxutils import escape
+import threading
+import random
+import time
+
+
+def atom_entry(arxiv_id, rng):
+    """One entry with arXiv's text quirks: wrapped title and abstract, markup characters, LaTeX, accents"""
+    words = ['neural', 'quantum', 'graph', 'spectral', 'learning', 'galaxy', 'protein', 'lattice', 'entropy', 'flow',
+             '$O(n \\log n)$', 'R&D', 'a<b', 'Schrödinger', '"robust"']
+    title = ' '.join(rng.choice(words) for _ in range(6)).capitalize() + '\n  ' + ' '.join(rng.choice(words) for _ in range(3))
+    lines = [' '.join(rng.choice(words) for _ in range(12)) for _ in range(10)]
+    summary = '\n  ' + '\n'.join(lines) + '\n'
+    authors = ''.join(f"<author><name>Author {rng.randrange(1000)} {rng.choice(['Name', 'Müller', 'Ørsted'])}</name></author>"
+                      for _ in range(rng.randint(1, 6)))
+    categories = ''.join(f'<category term="{term}" scheme="http://arxiv.org/schemas/atom"/>'
+                         for term in rng.sample(['cs.LG', 'cs.AI', 'stat.ML', 'quant-ph', 'astro-ph.GA', 'q-bio.BM'], 2))
+    return f"""<entry>
+    <id>http://arxiv.org/abs/{arxiv_id}v1</id>
+    <updated>2024-01-0{rng.randint(1, 9)}T12:00:00Z</updated>
+    <published>2024-01-0{rng.randint(1, 9)}T12:00:00Z</published>
+    <title>{escape(title)}</title>
+    <summary>{escape(summary)}</summary>
+    {authors}
+    <arxiv:comment xmlns:arxiv="http://arxiv.org/schemas/atom">12 pages</arxiv:comment>
+    <link href="http://arxiv.org/abs/{arxiv_id}v1" rel="alternate" type="text/html"/>
+    <link title="pdf" href="http://arxiv.org/pdf/{arxiv_id}v1" rel="related" type="application/pdf"/>
+    <arxiv:primary_category xmlns:arxiv="http://arxiv.org/schemas/atom" term="cs.LG" scheme="http://arxiv.org/schemas/atom"/>
+    {categories}
+  </entry>"""
+
+
+def atom_feed(n_entries, start=0, total=None, seed=0):
+    """@brief an arXiv-style Atom response with n_entries entries starting at index start"""
+    rng = random.Random(seed * 1000003 + start)
+    entries = '\n  '.join(atom_entry(f"2401.{index:05d}", rng) for index in range(start, start + n_entries))
+    return f"""<?xml version="1.0" encoding="UTF-8"?>
+<feed xmlns="http://www.w3.org/2005/Atom">
+  <link href="http://arxiv.org/api/query" rel="self" type="application/atom+xml"/>
+  <title type="html">ArXiv Query</title>
+  <id>http://arxiv.org/api/fake</id>
+  <updated>2024-01-10T00:00:00-05:00</updated>
+  <opensearch:totalResults xmlns:opensearch="http://a9.com/-/spec/opensearch/1.1/">{total if total is not None else start + n_entries}</opensearch:totalResults>
+  <opensearch:startIndex xmlns:opensearch="http://a9.com/-/spec/opensearch/1.1/">{start}</opensearch:startIndex>
+  <opensearch:itemsPerPage xmlns:opensearch="http://a9.com/-/spec/opensearch/1.1/">{n_entries}</opensearch:itemsPerPage>
+  {entries}
+</feed>
+""".encode('utf-8')
+
+
+class FakeArxivServer:
+    """Answer /api/query with generated feeds: id_list gets one entry, a search gets max_results of total
+
+    Set fail to answer every request with 503, fail_next to answer only the
+    next n requests so, and delay to stall each response. Requests are
+    recorded with their time and the client port, so keep-alive reuse shows
+    as fewer distinct ports than requests.
+    """
+
+    def __init__(self, total=1000, delay=0.0):
+        self.total = total
+        self.delay = delay
+        self.requests = []
+        self.times = []
+        self.ports = set()
+        self.fail = False
+        self.fail_next = 0
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+
+            def do_GET(self):
+                params = {key: values[0] for key, values in parse_qs(urlparse(self.path).query).items()}
+                server.requests.append(params)
+                server.times.append(time.time())
+                server.ports.add(self.client_address[1])
+                if server.fail or server.fail_next > 0:
+                    server.fail_next -= 1
+                    self.send_response(503)
+                    self.send_header('Content-Length', '0')
+                    self.end_headers()
+                    return
+                if server.delay:
+                    threading.Event().wait(server.delay)
+                if 'id_list' in params:
+                    body = atom_feed(1, int(params['id_list'].split('.')[-1]), total=1)
+                else:
+                    start = int(params.get('start', 0))
+                    count = max(0, min(int(params.get('max_results', 10)), server.total - start))
+                    body = atom_feed(count, start, total=server.total)
+                self.send_response(200)
+                self.send_header('Content-Type', 'application/atom+xml')
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        self.httpd = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+        self.base_url = f"http://127.0.0.1:{self.httpd.server_address[1]}/api/query?"
+        self.thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+
+    def __enter__(self):
+        self.thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self.httpd.shutdown()
+        self.httpd.server_close()
@@ -0,0 +1,94 @@
+"""Keyword search latency: reading every JSON file vs LIKE over paper_texts vs the FTS5 index
+
+Generates a synthetic corpus of paper bodies, stores each one both as a
+simplified JSON file (the Docs/JSON layout unified_search used to scan) and
+in paper_texts, whose triggers fill papers_fts.
+
+Usage: python benchmarks/fulltext_search.py [--papers 2000] [--words 4000] [--queries 20]
+"""
+import argparse
+import json
+import os
+import random
+import sqlite3
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import fulltext
+from prototype import create_tables
+
+
+def build_corpus(tmp, papers, words, rng):
+    vocabulary = [f"term{i}" for i in range(20000)]
+    conn = sqlite3.connect(os.path.join(tmp, 'fts.sqlite'))
+    create_tables(conn.cursor())
+    json_paths = []
+    for paper_id in range(1, papers + 1):
+        body = ' '.join(rng.choice(vocabulary) for _ in range(words))
+        json_path = os.path.join(tmp, f"{paper_id}.json")
+        with open(json_path, 'w', encoding='utf-8') as f:
+            json.dump([{'TYPE': 'text', 'VALUE': body}], f)
+        json_paths.append(json_path)
+        conn.execute("""INSERT INTO papers(paper_id, paper_name, paper_pdf, paper_docx, paper_json, paper_entities)
+            VALUES(?, ?, '', '', ?, '')""", (paper_id, f"paper {paper_id}", json_path))
+        conn.execute("INSERT INTO paper_texts(paper_id, body) VALUES(?, ?)", (paper_id, body))
+    conn.commit()
+    return conn, json_paths
+
+
+def scan_json(json_paths, keyword):
+    hits = []
+    for path in json_paths:
+        with open(path, 'r', encoding='utf-8') as f:
+            paper_json = json.load(f)
+        text = " ".join(item.get('VALUE', '') for item in paper_json if item.get('TYPE') == 'text')
+        if keyword in text.split():
+            hits.append(path)
+    return hits
+
+
+def timed(fn, keywords):
+    latencies = []
+    for keyword in keywords:
+        start = time.perf_counter()
+        fn(keyword)
+        latencies.append(time.perf_counter() - start)
+    latencies.sort()
+    return 1000 * latencies[len(latencies) // 2], 1000 * latencies[-1]
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--papers', type=int, default=2000)
+    parser.add_argument('--words', type=int, default=4000)
+    parser.add_argument('--queries', type=int, default=20)
+    args = parser.parse_args()
+
+    rng = random.Random(0)
+    with tempfile.TemporaryDirectory() as tmp:
+        start = time.perf_counter()
+        conn, json_paths = build_corpus(tmp, args.papers, args.words, rng)
+        print(f"{args.papers} papers x {args.words} words, built in {time.perf_counter() - start:.1f}s")
+        keywords = [f"term{rng.randrange(20000)}" for _ in range(args.queries)]
+
+        methods = (
+            ('JSON file scan', lambda kw: scan_json(json_paths, kw)),
+            ('LIKE paper_texts', lambda kw: conn.execute(
+                "SELECT paper_id FROM paper_texts WHERE body LIKE ?", (f"%{kw}%",)).fetchall()),
+            ('FTS5 ranked ids', lambda kw: conn.execute(
+                "SELECT rowid FROM papers_fts WHERE papers_fts MATCH ? ORDER BY rank LIMIT 10",
+                (fulltext.fts_query(kw),)).fetchall()),
+            ('FTS5 + snippets', lambda kw: fulltext.search_local(conn, kw, limit=10)),
+        )
+        print(f"{'method':<20}{'p50 ms':>10}{'max ms':>10}")
+        for name, fn in methods:
+            p50, worst = timed(fn, keywords)
+            print(f"{name:<20}{p50:>10.2f}{worst:>10.2f}")
+        conn.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,120 @@
+"""Memory and load time of the spaCy/VADER models: separate loads vs the shared registry in models.py
+
+Every scenario runs in a fresh interpreter and reports its resident set size
+after loading:
+  separate  - the pre-registry layout, a full en_core_web_sm for sentiment
+              plus an NER-only copy for ingestion
+  registry  - models.nlp('ner') + models.nlp('sentences') + models.vader()
+Then --workers forked processes run NER, once loading the model in every
+worker and once after models.preload() in the parent, and their private
+(unshared) memory is summed from /proc/<pid>/smaps_rollup (Linux only).
+
+Usage: python benchmarks/model_memory.py [--workers 4]
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+SCENARIOS = {
+    'separate': """
+import spacy
+from nltk.sentiment import SentimentIntensityAnalyzer
+full = spacy.load(MODEL)
+ner = spacy.load(MODEL, exclude=['tagger', 'parser', 'attribute_ruler', 'lemmatizer'])
+SentimentIntensityAnalyzer()
+""",
+    'registry': """
+import models
+models.preload(['ner', 'sentences', 'vader'])
+""",
+}
+
+SAMPLE = "Geoffrey Hinton worked at the University of Toronto and Google. This sentence is another one."
+
+
+def rss_mb(pid='self'):
+    with open(f'/proc/{pid}/status') as f:
+        for line in f:
+            if line.startswith('VmRSS:'):
+                return int(line.split()[1]) / 1024
+
+
+def private_mb(pid='self'):
+    total = 0
+    with open(f'/proc/{pid}/smaps_rollup') as f:
+        for line in f:
+            if line.startswith(('Private_Clean:', 'Private_Dirty:')):
+                total += int(line.split()[1])
+    return total / 1024
+
+
+def run_scenario(name):
+    code = f"""
+import json, os, sys, time
+sys.path.insert(0, {ROOT!r})
+MODEL = os.environ.get('SPACY_MODEL', 'en_core_web_sm')
+start = time.perf_counter()
+{SCENARIOS[name]}
+elapsed = time.perf_counter() - start
+with open('/proc/self/status') as f:
+    rss = next(int(line.split()[1]) for line in f if line.startswith('VmRSS:')) / 1024
+print(json.dumps({{'seconds': elapsed, 'rss_mb': rss}}))
+"""
+    output = subprocess.run([sys.executable, '-c', code], check=True, capture_output=True, text=True).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+
+def worker_ner(_):
+    import models
+    models.nlp('ner')(SAMPLE)
+    return os.getpid(), private_mb()
+
+
+def forked_workers(workers, preload):
+    code = f"""
+import json, sys
+sys.path.insert(0, {ROOT!r})
+sys.path.insert(0, {os.path.join(ROOT, 'benchmarks')!r})
+from concurrent.futures import ProcessPoolExecutor
+import multiprocessing, time
+import models
+from model_memory import worker_ner
+start = time.perf_counter()
+if {preload!r}:
+    models.preload(['ner'])
+with ProcessPoolExecutor({workers}, mp_context=multiprocessing.get_context('fork')) as pool:
+    results = list(pool.map(worker_ner, range({workers * 4})))
+elapsed = time.perf_counter() - start
+private = dict(results)
+print(json.dumps({{'seconds': elapsed, 'private_mb': sum(private.values()), 'workers': len(private)}}))
+"""
+    output = subprocess.run([sys.executable, '-c', code], check=True, capture_output=True, text=True).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--workers', type=int, default=4)
+    args = parser.parse_args()
+
+    print(f"{'scenario':<34}{'load s':>9}{'RSS MB':>9}")
+    for name in SCENARIOS:
+        result = run_scenario(name)
+        print(f"{name:<34}{result['seconds']:>9.2f}{result['rss_mb']:>9.1f}")
+
+    print(f"\n{args.workers} forked NER workers{'':<15}{'total s':>9}{'private MB':>12}")
+    for preload in (False, True):
+        result = forked_workers(args.workers, preload)
+        name = 'preloaded in parent' if preload else 'loaded in every worker'
+        print(f"{name:<34}{result['seconds']:>9.2f}{result['private_mb']:>12.1f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,79 @@
+"""Build time, peak memory and lookup latency of the similar-papers index
+
+Fills a temporary database with the synthetic topic corpus of
+clustering_scale.py, builds the local neighbour index with blocked
+products (the default SIMILAR_BLOCK_CELLS) and, up to --unblocked-max
+papers, with the whole similarity matrix in one block for comparison.
+Then inserts 1% more papers incrementally and times similar() lookups.
+
+Usage: python benchmarks/similar_index.py [--sizes 1000 10000 30000] [--unblocked-max 10000]
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import db
+import neighbour_index
+from clustering_scale import make_corpus, measure
+from feature_store import FeatureStore
+from migrations import migrate
+
+
+def add_papers(conn, documents, start):
+    ids = []
+    for offset, text in enumerate(documents):
+        paper_id = conn.execute("""INSERT INTO papers(paper_name, paper_pdf, paper_docx, paper_json, paper_entities)
+            VALUES(?, ?, '', '', '') RETURNING paper_id""", (f"Paper {start + offset}", f"{start + offset}.pdf")).fetchone()[0]
+        conn.execute("INSERT INTO paper_texts(paper_id, body) VALUES(?, ?)", (paper_id, text))
+        ids.append(paper_id)
+    conn.commit()
+    return ids
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--sizes', type=int, nargs='+', default=[1000, 10000, 30000])
+    parser.add_argument('--topics', type=int, default=8)
+    parser.add_argument('--unblocked-max', type=int, default=10000)
+    parser.add_argument('--queries', type=int, default=1000)
+    args = parser.parse_args()
+
+    print(f"{'papers':>8} {'build':>9} {'seconds':>8} {'peak MB':>8}")
+    for size in args.sizes:
+        documents, _ = make_corpus(size + size // 100, args.topics)
+        with tempfile.TemporaryDirectory() as directory:
+            conn = db.connect(os.path.join(directory, 'bench.sqlite'))
+            migrate(conn)
+            add_papers(conn, documents[:size], 0)
+            store = FeatureStore(os.path.join(directory, 'features.npz'))
+            store.rebuild(conn)
+
+            builds = [('blocked', neighbour_index.BLOCK_CELLS)]
+            if size <= args.unblocked_max:
+                builds.append(('one block', size * size))
+            for name, cells in builds:
+                seconds, peak, _ = measure(lambda: neighbour_index.build(conn, 'local', store=store, block_cells=cells))
+                print(f"{size:>8} {name:>9} {seconds:>8.2f} {peak:>8.1f}")
+
+            new_ids = add_papers(conn, documents[size:], size)
+            store.rebuild(conn)
+            seconds, peak, _ = measure(lambda: neighbour_index.insert(conn, 'local', new_ids, store=store))
+            print(f"{size:>8} {'insert':>9} {seconds:>8.2f} {peak:>8.1f}   ({len(new_ids)} papers)")
+
+            latencies = []
+            for query in range(args.queries):
+                start = time.perf_counter()
+                neighbour_index.similar(conn, 'local', query % size + 1)
+                latencies.append((time.perf_counter() - start) * 1000)
+            latencies.sort()
+            print(f"{size:>8} {'lookup':>9}   p50 {latencies[len(latencies) // 2]:.3f} ms, "
+                  f"p99 {latencies[int(len(latencies) * 0.99)]:.3f} ms")
+            conn.close()
+
+
+if __name__ == '__main__':
+    main()
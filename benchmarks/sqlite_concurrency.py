@@ -0,0 +1,130 @@
+"""Concurrent read/write throughput: connection-per-request vs the pooled WAL layer in db.py
+
+Reader threads run the entity search join used by /search while one writer
+thread keeps loading synthetic papers through ingest.load_entities, the way
+background ingestion does.
+
+Usage: python benchmarks/sqlite_concurrency.py [--readers 8] [--seconds 5]
+"""
+import argparse
+import os
+import random
+import sqlite3
+import sys
+import tempfile
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import db
+from ingest import load_entities
+from prototype import build_query, create_tables
+
+LABELS = ['PERSON', 'ORG', 'WORK_OF_ART']
+
+
+def seed(path, papers=200, mentions=300):
+    conn = sqlite3.connect(path)
+    create_tables(conn.cursor())
+    rng = random.Random(0)
+    for paper_id in range(1, papers + 1):
+        conn.execute("""INSERT INTO papers(paper_id, paper_name, paper_pdf, paper_docx, paper_json, paper_entities)
+            VALUES(?, ?, '', '', '', '')""", (paper_id, f"paper {paper_id}"))
+        load_entities(conn.cursor(), paper_id, [{'text': f"name {rng.randrange(5000)}", 'label': rng.choice(LABELS)}
+                                                for _ in range(mentions)])
+    conn.commit()
+    conn.close()
+
+
+def run(path, open_conn, close_conn, readers, seconds):
+    stop = threading.Event()
+    read_latencies = []
+    counters = {'writes': 0, 'read_errors': 0, 'write_errors': 0}
+    lock = threading.Lock()
+
+    def reader(seed_value):
+        rng = random.Random(seed_value)
+        while not stop.is_set():
+            sql = build_query(f"get all papers that mention person name {rng.randrange(5000)}")
+            start = time.perf_counter()
+            try:
+                conn = open_conn()
+                try:
+                    conn.execute(sql).fetchall()
+                finally:
+                    close_conn(conn)
+            except sqlite3.OperationalError:
+                with lock:
+                    counters['read_errors'] += 1
+                continue
+            with lock:
+                read_latencies.append(time.perf_counter() - start)
+
+    def writer():
+        rng = random.Random(1)
+        paper_id = 100000
+        while not stop.is_set():
+            paper_id += 1
+            try:
+                conn = open_conn()
+                try:
+                    conn.execute("""INSERT INTO papers(paper_id, paper_name, paper_pdf, paper_docx, paper_json, paper_entities)
+                        VALUES(?, ?, '', '', '', '')""", (paper_id, f"paper {paper_id}"))
+                    load_entities(conn.cursor(), paper_id, [{'text': f"name {rng.randrange(5000)}", 'label': rng.choice(LABELS)}
+                                                            for _ in range(300)])
+                    conn.commit()
+                finally:
+                    close_conn(conn)
+            except sqlite3.OperationalError:
+                with lock:
+                    counters['write_errors'] += 1
+                continue
+            counters['writes'] += 1
+
+    threads = [threading.Thread(target=reader, args=(i,)) for i in range(readers)]
+    threads.append(threading.Thread(target=writer))
+    for thread in threads:
+        thread.start()
+    time.sleep(seconds)
+    stop.set()
+    for thread in threads:
+        thread.join()
+
+    read_latencies.sort()
+    return {
+        'reads_per_s': len(read_latencies) / seconds,
+        'p50_ms': 1000 * read_latencies[len(read_latencies) // 2] if read_latencies else float('nan'),
+        'p99_ms': 1000 * read_latencies[int(len(read_latencies) * 0.99)] if read_latencies else float('nan'),
+        'writes_per_s': counters['writes'] / seconds,
+        'errors': counters['read_errors'] + counters['write_errors'],
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--readers', type=int, default=8)
+    parser.add_argument('--seconds', type=float, default=5.0)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        legacy_path = os.path.join(tmp, 'legacy.sqlite')
+        pooled_path = os.path.join(tmp, 'pooled.sqlite')
+        seed(legacy_path)
+        seed(pooled_path)
+
+        legacy = run(legacy_path, lambda: sqlite3.connect(legacy_path), lambda conn: conn.close(),
+                     args.readers, args.seconds)
+        pool = db.ConnectionPool(pooled_path, max_size=args.readers + 1)
+        pooled = run(pooled_path, pool.acquire, pool.release, args.readers, args.seconds)
+        pool.close_all()
+
+    print(f"{args.readers} readers + 1 writer for {args.seconds}s")
+    print(f"{'':<22}{'reads/s':>10}{'p50 ms':>9}{'p99 ms':>9}{'writes/s':>10}{'errors':>8}")
+    for name, result in (('connect per request', legacy), ('pooled WAL', pooled)):
+        print(f"{name:<22}{result['reads_per_s']:>10.0f}{result['p50_ms']:>9.2f}{result['p99_ms']:>9.2f}"
+              f"{result['writes_per_s']:>10.1f}{result['errors']:>8}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,88 @@
+"""Timing of vader_fast.FastVader against NLTK's VADER
+
+Scores every sentence and every whole document of the bundled JSON/ corpus
+with both implementations, reports the time each takes and fails if any
+score differs by more than the tolerance (tests/test_vader_fast.py holds
+the equality assertions CI runs). Sentences are split with a
+regular expression so no spaCy model is needed; the scorer does not care
+how they were produced.
+
+Usage: python benchmarks/vader_scoring.py [--corpus JSON] [--limit 0] [--tolerance 1e-3]
+"""
+import argparse
+import glob
+import os
+import re
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import models
+from sentiment_analyzer import document_segments
+from vader_fast import FastVader
+
+SENTENCE_END = re.compile(r'(?<=[.!?])\s+')
+FIELDS = ('neg', 'neu', 'pos', 'compound')
+
+
+def load_corpus(corpus, limit):
+    paths = sorted(glob.glob(os.path.join(corpus, '*.json')))
+    if limit:
+        paths = paths[:limit]
+    documents = []
+    for path in paths:
+        segments = [segment for segment in document_segments(path) if segment.strip()]
+        sentences = [sentence.strip() for segment in segments for sentence in SENTENCE_END.split(segment) if sentence.strip()]
+        documents.append((os.path.basename(path), sentences, ' '.join(segments)))
+    return documents
+
+
+def worst_difference(expected, actual):
+    return max(abs(expected[field] - actual[field]) for field in FIELDS)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--corpus', default=os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'JSON'))
+    parser.add_argument('--limit', type=int, default=0, help='number of documents, 0 for all')
+    parser.add_argument('--tolerance', type=float, default=1e-3)
+    args = parser.parse_args()
+
+    documents = load_corpus(args.corpus, args.limit)
+    sia = models.vader()
+    fast = FastVader(sia)
+    print(f"{len(documents)} documents, {sum(len(sentences) for _, sentences, _ in documents)} sentences")
+
+    nltk_seconds = fast_seconds = 0.0
+    compared = differing = failures = 0
+    worst = 0.0
+    for name, sentences, text in documents:
+        start = time.perf_counter()
+        expected = [sia.polarity_scores(sentence) for sentence in sentences]
+        expected_document = sia.polarity_scores(text)
+        nltk_seconds += time.perf_counter() - start
+
+        start = time.perf_counter()
+        actual, actual_document = fast.score_document(sentences, text)
+        fast_seconds += time.perf_counter() - start
+
+        for label, want, got in zip(sentences + [f'<document {name}>'], expected + [expected_document], actual + [actual_document]):
+            difference = worst_difference(want, got)
+            compared += 1
+            differing += difference > 0
+            worst = max(worst, difference)
+            if difference > args.tolerance:
+                failures += 1
+                print(f"MISMATCH {name}: {label[:80]!r}\n  nltk {want}\n  fast {got}")
+
+    print(f"{compared} scores compared, {differing} not identical, largest difference {worst:.4g}")
+    print(f"NLTK VADER: {nltk_seconds:.2f}s")
+    print(f"FastVader:  {fast_seconds:.2f}s ({nltk_seconds / fast_seconds:.1f}x)")
+    if failures:
+        print(f"{failures} scores outside tolerance {args.tolerance}")
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,346 @@
+from datetime import datetime
+import threading
+import logging
+import json
+import io
+import os
+
+import numpy as np
+
+import db
+from feature_store import FeatureStore, paper_documents
+from paper_clustering import ClusteringConfig, cluster, fitted_vectorizer, make_vectorizer
+
+logger = logging.getLogger(__name__)
+
+# Number of clusters of the persisted models
+MODEL_CLUSTERS = int(os.environ.get('CLUSTER_MODEL_CLUSTERS', 5))
+# Refit once papers assigned since the last fit make up this share of the corpus
+DRIFT_SHARE = float(os.environ.get('CLUSTER_DRIFT_SHARE', 0.2))
+# ... or once they sit this much further from their centroids than the fitted papers did
+DRIFT_DISTANCE = float(os.environ.get('CLUSTER_DRIFT_DISTANCE', 1.25))
+# Assignments needed before the distance ratio is trusted
+DRIFT_MIN_ASSIGNED = 5
+# Models kept per scope, older ones are deleted when a new one is fitted
+MODEL_HISTORY = 3
+# Assignment rows a refit writes per transaction
+ASSIGN_BATCH = int(os.environ.get('CLUSTER_ASSIGN_BATCH', 500))
+
+# The assignment table of every scope, its key column and the papers table with its title column
+SCOPES = {
+    'local': ('paper_clusters', 'paper_id', 'papers', 'paper_name'),
+    'arxiv': ('arxiv_paper_clusters', 'arxiv_id', 'arxiv_papers', 'title'),
+}
+
+# Called as refit_runner(fit_database, db_file, scope) to refit away from the
+# calling process, e.g. AnalysisPool.run; None refits in the background thread itself
+refit_runner = None
+
+_refitting = {scope: threading.Lock() for scope in SCOPES}
+
+
+def _to_blob(array):
+    buffer = io.BytesIO()
+    np.save(buffer, np.asarray(array), allow_pickle=False)
+    return buffer.getvalue()
+
+
+def _from_blob(blob):
+    return np.load(io.BytesIO(blob), allow_pickle=False)
+
+
+def _distances(features, centroids):
+    """Euclidean distance of every row to its nearest centroid, and that centroid's index"""
+    squared = (np.asarray(features.multiply(features).sum(axis=1)).ravel()[:, None]
+               - 2 * np.asarray(features @ centroids.T)
+               + (centroids * centroids).sum(axis=1)[None, :])
+    labels = squared.argmin(axis=1)
+    return labels, np.sqrt(np.maximum(squared[np.arange(len(labels)), labels], 0.0))
+
+
+def arxiv_documents(conn, arxiv_ids=None):
+    """@brief (arxiv_id, title, title + abstract) of saved arXiv papers, all of them when arxiv_ids is None"""
+    where = ''
+    if arxiv_ids is not None:
+        if not arxiv_ids:
+            return []
+        where = f"WHERE arxiv_id IN ({','.join('?' * len(arxiv_ids))})"
+    return [(arxiv_id, title, abstract or '') for arxiv_id, title, abstract in conn.execute(
+        f"SELECT arxiv_id, title, abstract FROM arxiv_papers {where} ORDER BY rowid", list(arxiv_ids or ()))]
+
+
+def scope_documents(conn, scope, ids=None):
+    """(id, title, text) of the papers of a scope, only the given ids unless None"""
+    if scope == 'local':
+        return paper_documents(conn, ids)
+    return arxiv_documents(conn, ids)
+
+
+class ClusterModel:
+    """A fitted clustering of one scope: centroids, the vocabulary they live in and drift counters
+
+    Attributes:
+        model_id (int): row id in cluster_models
+        scope (str): a key of SCOPES
+        corpus_version (str): version of the corpus the model was fitted on
+        centroids (numpy.ndarray): n_clusters x terms
+        terms (list), idf (numpy.ndarray): vocabulary and IDF to vectorize new papers with
+        cluster_terms (dict): cluster id -> top terms
+        baseline_distance (float): mean distance of the fitted papers to their centroid
+        fitted_papers (int), assigned_papers (int), assigned_distance (float): drift counters
+    """
+
+    COLUMNS = ('model_id', 'scope', 'corpus_version', 'n_clusters', 'fitted_at', 'fitted_papers',
+               'baseline_distance', 'assigned_papers', 'assigned_distance', 'terms', 'idf', 'centroids',
+               'cluster_terms')
+
+    def __init__(self, row):
+        values = dict(zip(self.COLUMNS, row))
+        self.model_id = values['model_id']
+        self.scope = values['scope']
+        self.corpus_version = values['corpus_version']
+        self.n_clusters = values['n_clusters']
+        self.fitted_at = values['fitted_at']
+        self.fitted_papers = values['fitted_papers']
+        self.baseline_distance = values['baseline_distance']
+        self.assigned_papers = values['assigned_papers']
+        self.assigned_distance = values['assigned_distance']
+        self.terms = json.loads(values['terms'])
+        self.idf = _from_blob(values['idf'])
+        self.centroids = _from_blob(values['centroids'])
+        self.cluster_terms = {int(label): terms for label, terms in json.loads(values['cluster_terms']).items()}
+
+    def predict(self, texts):
+        """@brief nearest centroid of each text, as KMeans.predict would pick it
+
+        Returns:
+            (tuple): (labels, distances) arrays
+        """
+        return _distances(fitted_vectorizer(self.terms, self.idf).transform(texts), self.centroids)
+
+    def drift(self):
+        """Share of papers assigned since the fit and their mean distance relative to the fitted papers'"""
+        share = self.assigned_papers / (self.fitted_papers + self.assigned_papers)
+        ratio = None
+        if self.assigned_papers >= DRIFT_MIN_ASSIGNED and self.baseline_distance > 0:
+            ratio = self.assigned_distance / self.assigned_papers / self.baseline_distance
+        return {'new_share': share, 'distance_ratio': ratio}
+
+    def drifted(self):
+        drift = self.drift()
+        return drift['new_share'] > DRIFT_SHARE or (drift['distance_ratio'] is not None
+                                                    and drift['distance_ratio'] > DRIFT_DISTANCE)
+
+    def summary(self):
+        return {
+            'model_id': self.model_id,
+            'scope': self.scope,
+            'corpus_version': self.corpus_version,
+            'n_clusters': self.n_clusters,
+            'fitted_at': self.fitted_at,
+            'fitted_papers': self.fitted_papers,
+            'assigned_papers': self.assigned_papers,
+            'drift': self.drift(),
+        }
+
+
+def current_model(conn, scope):
+    """@brief the latest model of a scope, None before the first fit"""
+    row = conn.execute(f"""SELECT {', '.join(ClusterModel.COLUMNS)} FROM cluster_models
+        WHERE scope = ? ORDER BY model_id DESC LIMIT 1""", (scope,)).fetchone()
+    return ClusterModel(row) if row is not None else None
+
+
+def _corpus(conn, scope):
+    """(ids, titles, features, terms, idf, version) of the whole scope"""
+    if scope == 'local':
+        # The feature store already holds the TF-IDF matrix of the local corpus
+        features = FeatureStore().get(conn, stale_ok=False)
+        if features is None:
+            return None
+        return ([int(paper_id) for paper_id in features.paper_ids], features.titles, features.matrix,
+                [str(term) for term in features.terms], features.idf, features.signature)
+    documents = arxiv_documents(conn)
+    if not documents:
+        return None
+    vectorizer = make_vectorizer()
+    matrix = vectorizer.fit_transform(f"{title} {text}" for _, title, text in documents).tocsr()
+    return ([arxiv_id for arxiv_id, _, _ in documents], [title for _, title, _ in documents], matrix,
+            [str(term) for term in vectorizer.get_feature_names_out()], vectorizer.idf_,
+            f"{len(documents)}:{conn.execute('SELECT max(rowid) FROM arxiv_papers').fetchone()[0]}")
+
+
+def _write_batches(conn, statement, rows):
+    """Run statement for rows in ASSIGN_BATCH sized transactions"""
+    for start in range(0, len(rows), ASSIGN_BATCH):
+        try:
+            conn.executemany(statement, rows[start:start + ASSIGN_BATCH])
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+
+
+def fit(conn, scope, n_clusters=MODEL_CLUSTERS):
+    """@brief refit the model of a scope from scratch and reassign every paper
+
+    The new model row is committed first, then only the assignments whose
+    cluster changed are written, ASSIGN_BATCH rows per transaction, so a
+    refit never holds the write lock long enough to stall ingestion. Until
+    the last batch is in, a cluster listing can mix labels of both models.
+    Papers assigned by the old model while the new one was fitted are moved
+    into the new model as well.
+
+    Returns:
+        (ClusterModel): None when the scope has fewer papers than clusters
+    """
+    table, key, _, _ = SCOPES[scope]
+    corpus = _corpus(conn, scope)
+    if corpus is None or len(corpus[0]) < n_clusters:
+        return None
+    ids, titles, features, terms, idf, version = corpus
+    result = cluster(features, ids, titles, terms, ClusteringConfig(n_clusters=n_clusters))
+    centroids = np.asarray(result.model.cluster_centers_)
+    labels, distances = _distances(features, centroids)
+
+    try:
+        model_id = conn.execute("""INSERT INTO cluster_models(scope, corpus_version, n_clusters, fitted_at,
+                fitted_papers, baseline_distance, terms, idf, centroids, cluster_terms)
+            VALUES(?, ?, ?, ?, ?, ?, ?, ?, ?, ?)""",
+            (scope, version, n_clusters, datetime.now().isoformat(), len(ids), float(distances.mean()),
+             json.dumps(terms), _to_blob(idf), _to_blob(centroids),
+             json.dumps({str(label): list(terms) for label, terms in result.cluster_terms.items()}))).lastrowid
+        conn.execute("""DELETE FROM cluster_models WHERE scope = ? AND model_id NOT IN
+            (SELECT model_id FROM cluster_models WHERE scope = ? ORDER BY model_id DESC LIMIT ?)""",
+            (scope, scope, MODEL_HISTORY))
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    model = current_model(conn, scope)
+
+    assignments = {paper_id: int(label) for paper_id, label in zip(ids, labels)}
+    existing = dict(conn.execute(f"SELECT {key}, cluster_id FROM {table}").fetchall())
+    documents = scope_documents(conn, scope, [paper_id for paper_id in existing if paper_id not in assignments])
+    if documents:
+        later_labels, _ = model.predict([f"{title} {text}" for _, title, text in documents])
+        assignments.update((paper_id, int(label)) for (paper_id, _, _), label in zip(documents, later_labels))
+    changed = [(paper_id, label) for paper_id, label in assignments.items() if existing.get(paper_id) != label]
+    removed = [(paper_id,) for paper_id in existing if paper_id not in assignments]
+    _write_batches(conn, f"""INSERT INTO {table}({key}, cluster_id) VALUES(?, ?)
+        ON CONFLICT({key}) DO UPDATE SET cluster_id = excluded.cluster_id""", changed)
+    _write_batches(conn, f"DELETE FROM {table} WHERE {key} = ?", removed)
+    logger.info(f"Fitted {scope} cluster model {model_id}: {len(ids)} papers, {n_clusters} clusters, "
+                f"{len(changed)} assignments changed, {len(removed)} removed")
+    return model
+
+
+def fit_database(db_file, scope, n_clusters=MODEL_CLUSTERS):
+    """Refit a scope with a connection of its own, e.g. inside a worker process"""
+    conn = db.connect(db_file)
+    try:
+        model = fit(conn, scope, n_clusters)
+        return model.summary() if model is not None else None
+    finally:
+        conn.close()
+
+
+def refit_in_background(scope, db_file=None):
+    """@brief refit a scope in a background thread unless a refit of it is already running
+
+    Returns:
+        (bool): whether a refit was started
+    """
+    lock = _refitting[scope]
+    if not lock.acquire(blocking=False):
+        return False
+    db_file = db_file or db.pool.db_file
+
+    def run():
+        try:
+            if refit_runner is not None:
+                refit_runner(fit_database, db_file, scope)
+            else:
+                fit_database(db_file, scope)
+        except Exception as e:
+            logger.error(f"Refitting the {scope} cluster model failed: {str(e)}")
+        finally:
+            lock.release()
+
+    threading.Thread(target=run, name=f'cluster-refit-{scope}', daemon=True).start()
+    return True
+
+
+def assign(conn, scope, ids, background=False):
+    """@brief put new or changed papers into the nearest cluster of the current model
+
+    Only papers without a cluster count towards drift, so fetching the same
+    arXiv page again does not. When there is no model yet, or the drift
+    crosses CLUSTER_DRIFT_SHARE / CLUSTER_DRIFT_DISTANCE, the scope is refit:
+    right away, or with refit_in_background() when background is True.
+
+    Args:
+        conn (sqlite3.Connection): database connection, committed by this function
+        scope (str): a key of SCOPES
+        ids (list): paper ids (local) or arXiv ids of the new papers
+        background (bool): refit in a background thread instead of before returning
+
+    Returns:
+        (dict): 'assigned' papers, 'refit' ('done', 'started', 'running' or None), 'model_id'
+    """
+    table, key, _, _ = SCOPES[scope]
+    model = current_model(conn, scope)
+    if model is None or model.drifted():
+        return _refit(conn, scope, background, model)
+
+    documents = scope_documents(conn, scope, list(ids))
+    if not documents:
+        return {'assigned': 0, 'refit': None, 'model_id': model.model_id}
+    ids = [paper_id for paper_id, _, _ in documents]
+    assigned = set(row[0] for row in conn.execute(
+        f"SELECT {key} FROM {table} WHERE {key} IN ({','.join('?' * len(ids))})", ids))
+    labels, distances = model.predict([f"{title} {text}" for _, title, text in documents])
+    new_distances = [float(distance) for paper_id, distance in zip(ids, distances) if paper_id not in assigned]
+    conn.executemany(f"""INSERT INTO {table}({key}, cluster_id) VALUES(?, ?)
+        ON CONFLICT({key}) DO UPDATE SET cluster_id = excluded.cluster_id""",
+                     [(paper_id, int(label)) for label, paper_id in zip(labels, ids)])
+    conn.execute("""UPDATE cluster_models SET assigned_papers = assigned_papers + ?,
+        assigned_distance = assigned_distance + ? WHERE model_id = ?""",
+        (len(new_distances), sum(new_distances), model.model_id))
+    conn.commit()
+
+    result = {'assigned': len(ids), 'refit': None, 'model_id': model.model_id}
+    model = current_model(conn, scope)
+    if model.drifted():
+        logger.info(f"{scope} cluster model {model.model_id} drifted: {model.drift()}")
+        result.update(_refit(conn, scope, background, model))
+        result['assigned'] = len(ids)
+    return result
+
+
+def _refit(conn, scope, background, model):
+    if background:
+        started = refit_in_background(scope)
+        return {'assigned': 0, 'refit': 'started' if started else 'running',
+                'model_id': model.model_id if model is not None else None}
+    model = fit(conn, scope)
+    return {'assigned': model.fitted_papers if model is not None else 0, 'refit': 'done',
+            'model_id': model.model_id if model is not None else None}
+
+
+def list_cluster(conn, scope, cluster_id, limit=20, offset=0):
+    """@brief the papers of one cluster, an index range scan on cluster_id
+
+    Returns:
+        (list): (id, title) rows in id order
+    """
+    table, key, papers, title = SCOPES[scope]
+    return conn.execute(f"""SELECT c.{key}, p.{title} FROM {table} c
+        JOIN {papers} p ON p.{key} = c.{key}
+        WHERE c.cluster_id = ? ORDER BY c.{key} LIMIT ? OFFSET ?""", (cluster_id, limit, offset)).fetchall()
+
+
+def cluster_sizes(conn, scope):
+    """Number of papers per cluster id, counted on the cluster_id index"""
+    table, _, _, _ = SCOPES[scope]
+    return dict(conn.execute(f"SELECT cluster_id, count(*) FROM {table} GROUP BY cluster_id").fetchall())
@@ -0,0 +1,120 @@
+from contextlib import contextmanager
+import threading
+import sqlite3
+import logging
+import queue
+import os
+
+logger = logging.getLogger(__name__)
+
+DB_PATH = os.environ.get('DB_PATH', 'data/test_db.sqlite')
+
+# Applied to every new connection. WAL lets readers keep going while the
+# ingest writer commits; NORMAL sync is safe with WAL (a power loss can only
+# drop the last transactions, never corrupt the file).
+PRAGMAS = (
+    ('journal_mode', 'WAL'),
+    ('synchronous', 'NORMAL'),
+    ('cache_size', -64000),        # ~64 MB page cache per connection
+    ('mmap_size', 268435456),      # 256 MB memory-mapped I/O
+    ('temp_store', 'MEMORY'),
+    ('busy_timeout', 5000),        # ms to wait for a lock instead of failing
+)
+
+# Size of each connection's prepared statement cache
+CACHED_STATEMENTS = 256
+
+
+def connect(db_file=DB_PATH):
+    """@brief open a SQLite connection with the tuned pragmas applied
+
+    Args:
+        db_file (str): path of the database file
+
+    Returns:
+        (sqlite3.Connection): the configured connection
+    """
+    conn = sqlite3.connect(db_file, timeout=5.0, check_same_thread=False,
+                           cached_statements=CACHED_STATEMENTS)
+    for name, value in PRAGMAS:
+        conn.execute(f"PRAGMA {name}={value}")
+    return conn
+
+
+class ConnectionPool:
+    """A bounded pool of configured SQLite connections
+
+    Connections are reused across requests, so the pragmas and each
+    connection's prepared statement cache survive between them. A connection
+    is only ever used by one thread at a time.
+    """
+
+    def __init__(self, db_file=DB_PATH, max_size=16, timeout=30.0):
+        self.db_file = db_file
+        self.timeout = timeout
+        self.idle = queue.LifoQueue()
+        self.slots = threading.BoundedSemaphore(max_size)
+
+    def acquire(self):
+        """@brief check out a connection, opening a new one if none is idle
+
+        Returns:
+            (sqlite3.Connection): a connection owned by the caller until release()
+        """
+        if not self.slots.acquire(timeout=self.timeout):
+            raise sqlite3.OperationalError("Timed out waiting for a database connection")
+        try:
+            return self.idle.get_nowait()
+        except queue.Empty:
+            pass
+        try:
+            return connect(self.db_file)
+        except Exception:
+            self.slots.release()
+            raise
+
+    def release(self, conn):
+        """Return a connection to the pool, rolling back anything left uncommitted"""
+        try:
+            if conn.in_transaction:
+                conn.rollback()
+            self.idle.put(conn)
+        except sqlite3.Error as e:
+            logger.warning(f"Dropping broken database connection: {str(e)}")
+            conn.close()
+        finally:
+            self.slots.release()
+
+    @contextmanager
+    def connection(self):
+        conn = self.acquire()
+        try:
+            yield conn
+        finally:
+            self.release(conn)
+
+    def close_all(self):
+        while True:
+            try:
+                self.idle.get_nowait().close()
+            except queue.Empty:
+                break
+
+
+pool = ConnectionPool()
+
+
+def query_db(conn, query, args=()):
+    """@brief run a query and return the rows as dicts
+
+    Args:
+        conn (sqlite3.Connection): database connection
+        query (str): SQL query
+        args (tuple): query parameters
+
+    Returns:
+        (list): one dict per row, keyed by column name
+    """
+    cur = conn.execute(query, args)
+    columns = [column[0] for column in cur.description]
+    return [dict(zip(columns, row)) for row in cur.fetchall()]
@@ -0,0 +1,371 @@
+from datetime import datetime
+import threading
+import tempfile
+import logging
+import json
+import os
+
+import numpy as np
+from scipy import sparse
+
+import db
+from analysis_pool import AnalysisRejected
+from paper_clustering import make_vectorizer, fitted_vectorizer
+
+logger = logging.getLogger(__name__)
+
+# TF-IDF matrix and vocabulary of the local corpus, one .npz file
+FEATURE_STORE_PATH = os.environ.get('FEATURE_STORE_PATH', 'data/features.npz')
+# Stale features are only rebuilt once no paper has been ingested for this
+# many seconds; until then ingestion is running and refits them when it ends
+REBUILD_QUIET = float(os.environ.get('FEATURE_REBUILD_QUIET', 30))
+
+# Called as rebuild_runner(build_features, db_file, path) to rebuild stale
+# features away from the calling process, e.g. AnalysisPool.run; None
+# rebuilds in the background thread itself
+rebuild_runner = None
+
+# Papers that went through ingestion; arXiv results saved into papers by
+# /unified_search have neither a body nor a manifest entry and are not part
+# of the local corpus
+INGESTED = """(p.paper_id IN (SELECT paper_id FROM paper_texts)
+    OR p.paper_id IN (SELECT paper_id FROM ingest_manifest WHERE paper_id IS NOT NULL))"""
+
+_rebuilding = threading.Lock()
+
+
+class FeaturesNotReady(AnalysisRejected):
+    """The features have never been built; a build has been started in the background"""
+    status_code = 503
+    retry_after = 5
+
+
+def _key(paper_id):
+    """Local paper ids are integers, arXiv ids strings"""
+    return paper_id if isinstance(paper_id, str) else int(paper_id)
+
+
+def corpus_signature(conn):
+    """@brief a cheap value that changes whenever papers are ingested, re-ingested or removed
+
+    Only ingestion's tables are read, so rows other code adds to papers do not change it.
+    """
+    row = conn.execute("""SELECT
+        (SELECT count(*) FROM paper_texts),
+        (SELECT max(paper_id) FROM paper_texts),
+        (SELECT count(*) FROM ingest_manifest),
+        (SELECT max(ingested_at) FROM ingest_manifest)""").fetchone()
+    return json.dumps(list(row))
+
+
+def ingestion_active(conn, quiet=REBUILD_QUIET):
+    """Whether a paper was ingested in the last `quiet` seconds, i.e. an ingestion run is likely still going"""
+    last = conn.execute("SELECT max(ingested_at) FROM ingest_manifest").fetchone()[0]
+    return last is not None and (datetime.now() - datetime.fromisoformat(last)).total_seconds() < quiet
+
+
+def paper_documents(conn, paper_ids=None):
+    """@brief (paper_id, title, text) of ingested local papers, the input of the TF-IDF features
+
+    The text is the body stored at ingest time; papers ingested before bodies
+    were stored fall back to the text nodes of their JSON.
+
+    Args:
+        conn (sqlite3.Connection): database connection
+        paper_ids (list): only these papers, None for all of them
+    """
+    where = f"WHERE {INGESTED}"
+    if paper_ids is not None:
+        paper_ids = [int(paper_id) for paper_id in paper_ids]
+        if not paper_ids:
+            return []
+        where += f" AND p.paper_id IN ({','.join('?' * len(paper_ids))})"
+    documents = []
+    for paper_id, title, paper_json, body in conn.execute(f"""SELECT p.paper_id, p.paper_name, p.paper_json, t.body
+            FROM papers p LEFT JOIN paper_texts t ON t.paper_id = p.paper_id
+            {where}
+            ORDER BY p.paper_id""", paper_ids or ()):
+        if body is None:
+            try:
+                with open(paper_json, 'r', encoding='utf-8') as f:
+                    items = json.load(f)
+                body = ' '.join(item.get('VALUE', '') for item in items
+                                if isinstance(item, dict) and item.get('TYPE') == 'text')
+            except (OSError, ValueError) as e:
+                logger.warning(f"No text for paper {paper_id}: {str(e)}")
+                continue
+        documents.append((paper_id, title, body.strip()))
+    return documents
+
+
+class CorpusFeatures:
+    """TF-IDF rows of the local papers plus the fitted vocabulary
+
+    Attributes:
+        matrix (scipy.sparse.csr_matrix): one L2-normalised row per paper
+        paper_ids (numpy.ndarray): paper id of every row, arXiv ids for saved arXiv papers
+        titles (list): paper name of every row
+        terms (numpy.ndarray): the term of every column
+        idf (numpy.ndarray): inverse document frequency of every column
+        signature (str): corpus_signature() of the corpus the features were built from
+    """
+
+    def __init__(self, matrix, paper_ids, titles, terms, idf, signature):
+        self.matrix = matrix
+        self.paper_ids = paper_ids
+        self.titles = titles
+        self.terms = terms
+        self.idf = idf
+        self.signature = signature
+        self._rows = {_key(paper_id): row for row, paper_id in enumerate(paper_ids)}
+
+    def row(self, paper_id):
+        """Row index of a paper, None when the paper has no features"""
+        return self._rows.get(_key(paper_id))
+
+    def subset(self, paper_ids):
+        """@brief the features of some papers, in the order of this store
+
+        Returns:
+            (tuple): (matrix rows, paper ids, titles) of the papers that have features
+        """
+        wanted = set(_key(paper_id) for paper_id in paper_ids)
+        rows = [row for row, paper_id in enumerate(self.paper_ids) if _key(paper_id) in wanted]
+        return self.matrix[rows], self.paper_ids[rows], [self.titles[row] for row in rows]
+
+    def top_terms(self, paper_id, limit=10):
+        """@brief the terms with the highest TF-IDF weight in a paper
+
+        Returns:
+            (list): (term, weight) pairs, None when the paper has no features
+        """
+        row = self.row(paper_id)
+        if row is None:
+            return None
+        start, end = self.matrix.indptr[row], self.matrix.indptr[row + 1]
+        weights = self.matrix.data[start:end]
+        order = np.argsort(weights)[::-1][:limit]
+        return [(str(self.terms[self.matrix.indices[start + i]]), float(weights[i])) for i in order]
+
+    def vectorizer(self):
+        """A TfidfVectorizer with this vocabulary and IDF, to transform texts that are not in the store"""
+        return fitted_vectorizer(self.terms, self.idf)
+
+    def save(self, path):
+        """Write the features to one .npz file, replacing the previous one atomically
+
+        Every writer uses a temporary file of its own, so concurrent saves
+        (e.g. ingestion and a background rebuild) cannot mix their data.
+        """
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        fd, temp_path = tempfile.mkstemp(suffix='.npz', prefix=os.path.basename(path) + '.', dir=directory or '.')
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                np.savez(f,
+                         data=self.matrix.data, indices=self.matrix.indices, indptr=self.matrix.indptr,
+                         shape=np.array(self.matrix.shape), paper_ids=self.paper_ids,
+                         titles=np.array(self.titles, dtype=str), terms=np.asarray(self.terms, dtype=str),
+                         idf=self.idf, signature=np.array(self.signature))
+            os.replace(temp_path, path)
+        except BaseException:
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+            raise
+
+    @classmethod
+    def load(cls, path):
+        with np.load(path, allow_pickle=False) as stored:
+            matrix = sparse.csr_matrix((stored['data'], stored['indices'], stored['indptr']),
+                                       shape=tuple(stored['shape']))
+            return cls(matrix, stored['paper_ids'], stored['titles'].tolist(), stored['terms'],
+                       stored['idf'], str(stored['signature']))
+
+    @classmethod
+    def build(cls, conn):
+        """@brief fit the TF-IDF features of the whole local corpus
+
+        Returns:
+            (CorpusFeatures): None when there are no papers with text
+        """
+        signature = corpus_signature(conn)
+        documents = paper_documents(conn)
+        if not documents:
+            return None
+        vectorizer = make_vectorizer()
+        matrix = vectorizer.fit_transform(f"{title} {text}" for _, title, text in documents).tocsr()
+        return cls(matrix,
+                   np.array([paper_id for paper_id, _, _ in documents], dtype=np.int64),
+                   [title for _, title, _ in documents],
+                   vectorizer.get_feature_names_out(),
+                   vectorizer.idf_,
+                   signature)
+
+
+def build_features(db_file, path):
+    """@brief build the features of a database and save them to path, e.g. inside a worker process
+
+    Returns:
+        (str): signature of the saved features, None when there are no papers with text
+    """
+    conn = db.connect(db_file)
+    try:
+        features = CorpusFeatures.build(conn)
+    finally:
+        conn.close()
+    if features is None:
+        if os.path.exists(path):
+            os.remove(path)
+        return None
+    features.save(path)
+    return features.signature
+
+
+def _database_file(conn):
+    """Path of the main database of a connection, '' for an in-memory one"""
+    return conn.execute("PRAGMA database_list").fetchone()[2]
+
+
+class FeatureStore:
+    """The persisted TF-IDF features of the local corpus, kept in memory between requests
+
+    Ingestion calls rebuild() after it changes the corpus. get() compares a
+    cheap signature of the ingestion tables with the one the features were
+    built from, so a process that did not ingest (e.g. the web app while the
+    CLI ingests) picks up the new file. When the file is stale too, get()
+    keeps answering with the previous features while one background
+    rebuild runs through rebuild_runner, so no request pays for it. No
+    rebuild starts while ingestion is still running (see REBUILD_QUIET),
+    since it refits the features itself when it ends; before the first
+    build, get() starts one and raises FeaturesNotReady.
+    """
+
+    def __init__(self, path=FEATURE_STORE_PATH):
+        self.path = path
+        self.lock = threading.Lock()
+        self.features = None
+        # Signature of a corpus that was found to have no papers with text
+        self.empty_signature = None
+        self.counters = {'memory_hits': 0, 'loads': 0, 'builds': 0, 'stale_hits': 0, 'background_builds': 0}
+
+    def get(self, conn, stale_ok=True):
+        """@brief the current features, loading or rebuilding them when the corpus changed
+
+        Args:
+            conn (sqlite3.Connection): database connection
+            stale_ok (bool): answer with the previous features while they are rebuilt in
+                the background, and build missing ones there too; False builds before
+                returning, for callers that are off the request path already
+                (ingestion, refits)
+
+        Returns:
+            (CorpusFeatures): None when there are no papers with text
+
+        Raises:
+            FeaturesNotReady: stale_ok and no features have been built yet
+        """
+        signature = corpus_signature(conn)
+        with self.lock:
+            if self.features is not None and self.features.signature == signature:
+                self.counters['memory_hits'] += 1
+                return self.features
+            if signature == self.empty_signature:
+                self.counters['memory_hits'] += 1
+                return None
+            if os.path.exists(self.path):
+                try:
+                    features = CorpusFeatures.load(self.path)
+                except (OSError, ValueError, KeyError) as e:
+                    logger.warning(f"Unreadable feature store {self.path}: {str(e)}")
+                else:
+                    if features.signature == signature:
+                        self.counters['loads'] += 1
+                        self.features = features
+                        return features
+                    if self.features is None:
+                        self.features = features
+            stale = self.features
+        db_file = _database_file(conn)
+        if not stale_ok or not db_file:
+            return self.rebuild(conn)
+        if stale is None:
+            texts, _, manifest_entries, _ = json.loads(signature)
+            if texts == 0 and manifest_entries == 0:
+                # Nothing has been ingested
+                return None
+            self.rebuild_in_background(db_file, signature)
+            raise FeaturesNotReady('The TF-IDF features are being built, retry shortly')
+        with self.lock:
+            self.counters['stale_hits'] += 1
+        if not ingestion_active(conn):
+            self.rebuild_in_background(db_file, signature)
+        return stale
+
+    def rebuild(self, conn):
+        """@brief refit the features from the database and save them
+
+        Returns:
+            (CorpusFeatures): None when there are no papers with text
+        """
+        signature = corpus_signature(conn)
+        features = CorpusFeatures.build(conn)
+        with self.lock:
+            self.counters['builds'] += 1
+            self.features = features
+            if features is None:
+                self.empty_signature = signature
+                if os.path.exists(self.path):
+                    os.remove(self.path)
+            else:
+                features.save(self.path)
+        if features is not None:
+            logger.info(f"Built TF-IDF features: {features.matrix.shape[0]} papers, {features.matrix.shape[1]} terms")
+        return features
+
+    def rebuild_in_background(self, db_file, signature):
+        """@brief rebuild the features in a background thread unless a rebuild is already running
+
+        The build runs through rebuild_runner and writes the file, which is
+        then loaded here; until then get() keeps serving the previous features.
+
+        Args:
+            db_file (str): the database to build from
+            signature (str): corpus_signature() when the rebuild was requested
+
+        Returns:
+            (bool): whether a rebuild was started
+        """
+        if not _rebuilding.acquire(blocking=False):
+            return False
+
+        def run():
+            try:
+                if rebuild_runner is not None:
+                    built = rebuild_runner(build_features, db_file, self.path)
+                else:
+                    built = build_features(db_file, self.path)
+                features = CorpusFeatures.load(self.path) if built is not None else None
+                with self.lock:
+                    self.counters['background_builds'] += 1
+                    if features is None:
+                        self.empty_signature = signature
+                    else:
+                        self.features = features
+                if features is not None:
+                    logger.info(f"Rebuilt TF-IDF features in the background: {features.matrix.shape[0]} papers")
+            except Exception as e:
+                logger.error(f"Rebuilding the feature store failed: {str(e)}")
+            finally:
+                _rebuilding.release()
+
+        threading.Thread(target=run, name='feature-store-rebuild', daemon=True).start()
+        return True
+
+    def stats(self):
+        with self.lock:
+            return {
+                **self.counters,
+                'papers': self.features.matrix.shape[0] if self.features is not None else None,
+                'terms': self.features.matrix.shape[1] if self.features is not None else None,
+            }
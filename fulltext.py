@@ -0,0 +1,123 @@
+import re
+
+# bm25() column weights of arxiv_fts: a hit in the title counts more than
+# one in the abstract
+ARXIV_WEIGHTS = (5.0, 1.0)
+SNIPPET_TOKENS = 16
+
+_TOKEN_RE = re.compile(r'\w+\*?', re.UNICODE)
+
+
+def fts_query(text):
+    """@brief turn free user input into a safe FTS5 MATCH expression
+
+    Every word becomes a quoted term, so FTS5 operators and punctuation in
+    the input are never interpreted; the terms are AND-ed. A trailing '*'
+    keeps its prefix-search meaning.
+
+    Args:
+        text (str): user input
+
+    Returns:
+        (str): the MATCH expression, empty if the input has no words
+    """
+    terms = []
+    for token in _TOKEN_RE.findall(text):
+        prefix = token.endswith('*')
+        word = token.rstrip('*')
+        terms.append(f'"{word}"*' if prefix else f'"{word}"')
+    return ' '.join(terms)
+
+
+def fts_phrase(text):
+    """@brief the FTS5 expression matching `text` as one phrase"""
+    words = _TOKEN_RE.findall(text.replace('*', ''))
+    return '"' + ' '.join(words) + '"' if words else ''
+
+
+def search_local(conn, query, limit=10, offset=0):
+    """@brief BM25-ranked full-text search over the bodies of local papers
+
+    Args:
+        conn (sqlite3.Connection): database connection
+        query (str): user query, see fts_query()
+        limit (int): maximum number of results
+        offset (int): number of results to skip
+
+    Returns:
+        (list): dicts with paper_id, title, pdf_path, score and snippet, best first
+    """
+    match = fts_query(query)
+    if not match:
+        return []
+    # Ordering by FTS5's own rank column lets it sort the matches itself, so
+    # snippet() only runs for the rows that are returned
+    rows = conn.execute(f"""
+        SELECT p.paper_id, p.paper_name, p.paper_pdf, hit.rank, hit.snippet
+        FROM (
+            SELECT rowid, rank, snippet(papers_fts, 0, '<b>', '</b>', '...', {SNIPPET_TOKENS}) AS snippet
+            FROM papers_fts
+            WHERE papers_fts MATCH ?
+            ORDER BY rank
+            LIMIT ? OFFSET ?
+        ) AS hit
+        JOIN papers p ON p.paper_id = hit.rowid
+        ORDER BY hit.rank
+    """, (match, limit, offset)).fetchall()
+    return [{
+        'source': 'local',
+        'paper_id': paper_id,
+        'title': title,
+        'pdf_path': pdf_path,
+        # bm25() is lower for better matches, flip it so higher means more relevant
+        'score': -rank,
+        'snippet': snippet,
+    } for paper_id, title, pdf_path, rank, snippet in rows]
+
+
+def search_arxiv(conn, query, limit=10, offset=0):
+    """@brief BM25-ranked full-text search over the titles and abstracts of saved arXiv papers
+
+    Args:
+        conn (sqlite3.Connection): database connection
+        query (str): user query, see fts_query()
+        limit (int): maximum number of results
+        offset (int): number of results to skip
+
+    Returns:
+        (list): dicts with arxiv_id, title, pdf_url, score and snippet, best first
+    """
+    match = fts_query(query)
+    if not match:
+        return []
+    rank_function = 'bm25({}, {})'.format(*ARXIV_WEIGHTS)
+    rows = conn.execute(f"""
+        SELECT a.arxiv_id, a.title, a.pdf_url, hit.rank, hit.snippet
+        FROM (
+            SELECT rowid, rank, snippet(arxiv_fts, -1, '<b>', '</b>', '...', {SNIPPET_TOKENS}) AS snippet
+            FROM arxiv_fts
+            WHERE arxiv_fts MATCH ? AND rank MATCH ?
+            ORDER BY rank
+            LIMIT ? OFFSET ?
+        ) AS hit
+        JOIN arxiv_papers a ON a.rowid = hit.rowid
+        ORDER BY hit.rank
+    """, (match, rank_function, limit, offset)).fetchall()
+    return [{
+        'source': 'arxiv',
+        'arxiv_id': arxiv_id,
+        'title': title,
+        'pdf_url': pdf_url,
+        'score': -rank,
+        'snippet': snippet,
+    } for arxiv_id, title, pdf_url, rank, snippet in rows]
+
+
+def paper_mentions(conn, paper_id, text):
+    """@brief whether the body of a local paper contains `text` as a phrase"""
+    phrase = fts_phrase(text)
+    if not phrase:
+        return False
+    row = conn.execute("SELECT 1 FROM papers_fts WHERE papers_fts MATCH ? AND rowid = ?",
+                       (phrase, paper_id)).fetchone()
+    return row is not None
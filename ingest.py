@@ -0,0 +1,579 @@
+from concurrent.futures import ProcessPoolExecutor, FIRST_COMPLETED, wait
+from os.path import exists
+from collections import Counter
+from datetime import datetime
+import threading
+import hashlib
+import logging
+import json
+import os
+
+from sentiment_cache import document_hash, document_key, paper_key, text_hash
+import models
+
+logger = logging.getLogger(__name__)
+
+# CPU-heavy stages every paper goes through before the single writer stores it.
+# 'docx' round-trips through pdf2docx/simplify_docx and keeps the DOCX/JSON/entity
+# files, 'pdf' streams text straight out of the PDF and writes no artifacts.
+ENGINES = {
+    'docx': ('docx', 'json', 'entities'),
+    'pdf': ('text', 'entities'),
+}
+STAGES = ENGINES['docx']
+DEFAULT_ENGINE = os.environ.get('INGEST_ENGINE', 'docx')
+
+# Version of the NER/text output. Bumping it re-runs NER for every paper once;
+# DOCX/JSON are only regenerated when the PDF content changes.
+PIPELINE_VERSION = 3
+
+# Paragraphs are grouped into chunks of at most this many characters before NER
+NER_MAX_CHARS = int(os.environ.get('NER_MAX_CHARS', 10000))
+NER_BATCH_SIZE = int(os.environ.get('NER_BATCH_SIZE', 32))
+NER_N_PROCESS = int(os.environ.get('NER_N_PROCESS', 1))
+
+# Run the optional 'sentiment' stage after NER to fill the sentiment cache
+INGEST_SENTIMENT = os.environ.get('INGEST_SENTIMENT', '0') == '1'
+
+
+
+def default_workers():
+    """Number of worker processes used when none is given explicitly
+
+    Returns:
+        (int): value of the INGEST_WORKERS environment variable, or the CPU count
+    """
+    return int(os.environ.get('INGEST_WORKERS', os.cpu_count() or 1))
+
+
+def iter_chunks(paragraphs, max_chars=NER_MAX_CHARS):
+    """@brief split a paper into bounded text chunks for NER
+
+    Paragraphs are joined with newlines and chunks are cut at the last
+    paragraph break (or space) before max_chars, so offsets refer to
+    '\\n'.join(paragraphs).
+
+    Args:
+        paragraphs (list): paragraph strings in document order
+        max_chars (int): upper bound for the length of a chunk
+
+    Yields:
+        (tuple): (offset of the chunk in the joined text, chunk text)
+    """
+    text = '\n'.join(paragraphs)
+    start = 0
+    while start < len(text):
+        end = start + max_chars
+        if end >= len(text):
+            yield start, text[start:]
+            return
+        cut = text.rfind('\n', start, end)
+        if cut <= start:
+            cut = text.rfind(' ', start, end)
+        if cut <= start:
+            yield start, text[start:end]
+            start = end
+        else:
+            yield start, text[start:cut]
+            start = cut + 1
+
+
+def find_entities(paragraphs, nlp=None, batch_size=NER_BATCH_SIZE, n_process=NER_N_PROCESS, max_chars=NER_MAX_CHARS):
+    """@brief run NER over a paper by streaming bounded chunks through nlp.pipe
+
+    Args:
+        paragraphs (list): paragraph strings of the paper
+        nlp: spaCy pipeline, defaults to the registry's 'ner' variant (see models.py)
+        batch_size (int): number of chunks per nlp.pipe batch
+        n_process (int): number of processes nlp.pipe may use
+        max_chars (int): maximum chunk length
+
+    Returns:
+        (list): entity dicts with text, start_char, end_char and label
+    """
+    nlp = nlp or models.nlp('ner')
+    chunks = list(iter_chunks(paragraphs, max_chars))
+    docs = nlp.pipe((text for _, text in chunks), batch_size=batch_size, n_process=n_process)
+    entities = []
+    for (offset, _), doc in zip(chunks, docs):
+        for e in doc.ents:
+            entities.append({"text": e.text, "start_char": offset + e.start_char,
+                             "end_char": offset + e.end_char, "label": e.label_})
+    return entities
+
+
+def convert_to_docx(payload):
+    """@brief stage 1: convert the paper PDF to DOCX if it has not been converted yet
+
+    Args:
+        payload (dict): pipeline payload, payload['file'] is the paper's file dict
+
+    Returns:
+        (dict): the same payload
+    """
+    file_dict = payload['file']
+    if not exists(file_dict['paper_docx']):
+        from pdf2docx import parse
+        parse(file_dict['paper_pdf'], file_dict['paper_docx'])
+    return payload
+
+
+def simplify_to_json(payload):
+    """@brief stage 2: write the simplified JSON and collect the paragraph text
+
+    Args:
+        payload (dict): pipeline payload
+
+    Returns:
+        (dict): the payload with 'paragraphs' set
+    """
+    import docx
+    file_dict = payload['file']
+    doc = docx.Document(file_dict['paper_docx'])
+    if not exists(file_dict['paper_json']):
+        from simplify_docx import simplify
+        with open(file_dict['paper_json'], 'w') as outputjson:
+            json.dump(simplify(doc, {"special-characters-as-text": False}), outputjson)
+    payload['paragraphs'] = [para.text for para in doc.paragraphs]
+    return payload
+
+
+def iter_pdf_paragraphs(pdf_path):
+    """@brief stream the text blocks of a PDF page by page
+
+    Args:
+        pdf_path (str): path of the PDF
+
+    Yields:
+        (str): text of one block with its line breaks folded into spaces
+    """
+    import fitz
+    with fitz.open(pdf_path) as pdf:
+        for page in pdf:
+            for block in page.get_text("blocks"):
+                # block = (x0, y0, x1, y1, text, block_no, block_type), type 1 is an image
+                if block[6] != 0:
+                    continue
+                text = ' '.join(block[4].split())
+                if text:
+                    yield text
+
+
+def extract_pdf_text(payload):
+    """@brief stage 1 of the 'pdf' engine: read the paragraph text straight from the PDF
+
+    Args:
+        payload (dict): pipeline payload
+
+    Returns:
+        (dict): the payload with 'paragraphs' set
+    """
+    payload['paragraphs'] = list(iter_pdf_paragraphs(payload['file']['paper_pdf']))
+    return payload
+
+
+def extract_entities(payload):
+    """@brief last stage: run spaCy NER over the paper text, or reuse the cached entity file
+
+    The 'pdf' engine sets payload['cache_entities'] to False, so it neither
+    reads nor writes the Ents/ file.
+
+    Args:
+        payload (dict): pipeline payload
+
+    Returns:
+        (dict): the payload with 'entities' set to the list of entity dicts and
+            'text' set to the newline-joined paragraphs
+    """
+    file_dict = payload['file']
+    cache_entities = payload.get('cache_entities', True)
+    if cache_entities and exists(file_dict['paper_entities']):
+        with open(file_dict['paper_entities'], 'r') as reading:
+            entities = json.load(reading)
+    else:
+        entities = {"entities": find_entities(payload['paragraphs'], n_process=payload.get('n_process', NER_N_PROCESS))}
+        if cache_entities:
+            with open(file_dict['paper_entities'], 'w') as outputents:
+                json.dump(entities, outputents)
+    payload['entities'] = entities['entities']
+    payload['text'] = '\n'.join(payload['paragraphs'])
+    payload['paragraphs'] = None
+    return payload
+
+
+def analyze_sentiment(payload):
+    """@brief optional stage after NER: precompute the paper's sentiment for the sentiment cache
+
+    Analyzes the same input /papers/<id>/sentiment would: the simplified
+    JSON when it exists, otherwise the extracted text. A failed analysis
+    only leaves the cache empty, it does not fail the paper.
+
+    Args:
+        payload (dict): pipeline payload with 'text' set
+
+    Returns:
+        (dict): the payload with 'sentiment' set to a dict with the cache key
+            (None for text, the writer keys it by paper id), content hash and
+            results, or None
+    """
+    from sentiment_analyzer import SentimentAnalyzer
+    json_path = payload['file'].get('paper_json')
+    analyzer = SentimentAnalyzer()
+    if json_path and exists(json_path):
+        sentiment = {'key': document_key(json_path), 'content_hash': document_hash(json_path),
+                     'results': analyzer.analyze_document(json_path)}
+    else:
+        sentiment = {'key': None, 'content_hash': text_hash(payload['text']),
+                     'results': analyzer.analyze_text(payload['text'])}
+    if 'error' in sentiment['results']:
+        logger.warning(f"Sentiment precompute failed for {payload['file']['paper_pdf']}: {sentiment['results']['error']}")
+        sentiment = None
+    payload['sentiment'] = sentiment
+    return payload
+
+
+def materialize_artifacts(file_dict):
+    """@brief produce the DOCX and simplified JSON of a paper on request
+
+    Used for papers ingested with the 'pdf' engine, which skips both files.
+
+    Args:
+        file_dict (dict): paper file dict with paper_pdf/paper_docx/paper_json paths
+
+    Returns:
+        (dict): the same file dict
+    """
+    simplify_to_json(convert_to_docx({'file': file_dict}))
+    return file_dict
+
+
+STAGE_FUNCTIONS = {
+    'docx': convert_to_docx,
+    'json': simplify_to_json,
+    'text': extract_pdf_text,
+    'entities': extract_entities,
+    'sentiment': analyze_sentiment,
+}
+
+
+class IngestProgress:
+    """Thread-safe per-stage progress counters for an ingestion run"""
+
+    def __init__(self, total=0, callback=None):
+        self.lock = threading.Lock()
+        self.callback = callback
+        self.reset(total)
+
+    def reset(self, total, stages=STAGES):
+        with self.lock:
+            self.total = total
+            self.stages = {stage: {'done': 0, 'failed': 0} for stage in tuple(stages) + ('write',)}
+
+    def advance(self, stage, failed=False):
+        with self.lock:
+            self.stages[stage]['failed' if failed else 'done'] += 1
+            counts = self.stages[stage]
+            logger.info(f"[{stage}] {counts['done']}/{self.total} done, {counts['failed']} failed")
+        if self.callback:
+            self.callback(self.snapshot())
+
+    def snapshot(self):
+        """Return a JSON-serialisable copy of the counters"""
+        with self.lock:
+            return {
+                'total': self.total,
+                'stages': {stage: dict(counts) for stage, counts in self.stages.items()}
+            }
+
+
+class IngestPipeline:
+    """Run the stages of an ingestion engine in a process pool
+
+    Every paper is resubmitted to the pool stage by stage, so different papers
+    can be in different stages at the same time. Finished papers are handed to
+    ``writer`` in the calling process, which keeps SQLite single-writer.
+    """
+
+    def __init__(self, workers=None, progress=None, engine=None, sentiment=None):
+        self.workers = workers if workers is not None else default_workers()
+        self.progress = progress or IngestProgress()
+        self.engine = engine or DEFAULT_ENGINE
+        if self.engine not in ENGINES:
+            raise ValueError(f"Unknown ingestion engine: {self.engine}")
+        self.stages = ENGINES[self.engine]
+        if sentiment if sentiment is not None else INGEST_SENTIMENT:
+            self.stages += ('sentiment',)
+
+    def models(self):
+        """Names of the registry models (see models.py) the stages of this pipeline use"""
+        names = ['ner']
+        if 'sentiment' in self.stages:
+            names += ['sentences', 'vader']
+        return names
+
+    def _payload(self, file_dict, n_process=NER_N_PROCESS):
+        return {'file': file_dict, 'n_process': n_process, 'cache_entities': self.engine == 'docx'}
+
+    def run(self, files, writer):
+        """@brief process every file dict and pass the results to writer
+
+        Args:
+            files (list): file dicts with paper_pdf/paper_docx/paper_json/paper_entities paths
+            writer (callable): called as writer(file_dict, entities, text, sentiment) for every finished
+                paper, sentiment is the precomputed sentiment (see analyze_sentiment) or None
+
+        Returns:
+            (list): file dicts that were written successfully
+        """
+        self.progress.reset(len(files), self.stages)
+        if self.workers <= 1:
+            return self._run_serial(files, writer)
+
+        if files and models.forks_share_models():
+            # Load the models once here so every forked worker shares them
+            models.preload(self.models())
+
+        written = []
+        with ProcessPoolExecutor(max_workers=self.workers) as pool:
+            pending = {}
+            for file_dict in files:
+                # Pool workers already use every core, nlp.pipe stays single-process there
+                future = pool.submit(STAGE_FUNCTIONS[self.stages[0]], self._payload(file_dict, n_process=1))
+                pending[future] = (0, file_dict)
+            while pending:
+                done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    stage_index, file_dict = pending.pop(future)
+                    stage = self.stages[stage_index]
+                    try:
+                        payload = future.result()
+                    except Exception as e:
+                        logger.error(f"Stage {stage} failed for {file_dict['paper_pdf']}: {str(e)}")
+                        self.progress.advance(stage, failed=True)
+                        continue
+                    self.progress.advance(stage)
+                    if stage_index + 1 < len(self.stages):
+                        next_future = pool.submit(STAGE_FUNCTIONS[self.stages[stage_index + 1]], payload)
+                        pending[next_future] = (stage_index + 1, file_dict)
+                    elif self._write(writer, payload):
+                        written.append(file_dict)
+        return written
+
+    def _run_serial(self, files, writer):
+        written = []
+        for file_dict in files:
+            payload = self._payload(file_dict)
+            for stage in self.stages:
+                try:
+                    payload = STAGE_FUNCTIONS[stage](payload)
+                except Exception as e:
+                    logger.error(f"Stage {stage} failed for {file_dict['paper_pdf']}: {str(e)}")
+                    self.progress.advance(stage, failed=True)
+                    payload = None
+                    break
+                self.progress.advance(stage)
+            if payload is not None and self._write(writer, payload):
+                written.append(file_dict)
+        return written
+
+    def _write(self, writer, payload):
+        try:
+            writer(payload['file'], payload['entities'], payload['text'], payload.get('sentiment'))
+        except Exception as e:
+            logger.error(f"Writing {payload['file']['paper_pdf']} failed: {str(e)}")
+            self.progress.advance('write', failed=True)
+            return False
+        self.progress.advance('write')
+        return True
+
+
+def load_entities(cur, paper_id, entities):
+    """@brief replace a paper's entity links with one batch of set-based statements
+
+    Mentions are counted in memory, staged in a temp table with a single
+    executemany, and entity ids are resolved with a join instead of one
+    INSERT ... RETURNING per mention. Runs inside the caller's transaction.
+
+    Args:
+        cur: database cursor
+        paper_id (int): id of the paper the entities belong to
+        entities (list): entity dicts with 'text' and 'label'
+
+    Returns:
+        (int): number of distinct entities linked to the paper
+    """
+    mentions = Counter((entity['text'], entity['label']) for entity in entities)
+    cur.execute("""CREATE TEMP TABLE IF NOT EXISTS staged_mentions (
+        entity_name TEXT NOT NULL,
+        entity_type TEXT NOT NULL,
+        mentions INTEGER NOT NULL
+    )""")
+    cur.execute("DELETE FROM staged_mentions")
+    cur.executemany("INSERT INTO staged_mentions(entity_name, entity_type, mentions) VALUES(?, ?, ?)",
+                    [(name, label, count) for (name, label), count in mentions.items()])
+    cur.execute("""INSERT OR IGNORE INTO entities(entity_name, entity_type)
+        SELECT entity_name, entity_type FROM staged_mentions""")
+    cur.execute("DELETE FROM papers_have_entities WHERE paper_id = ?", (paper_id,))
+    cur.execute("""INSERT INTO papers_have_entities(entity_id, paper_id, count)
+        SELECT e.entity_id, ?, s.mentions
+        FROM staged_mentions s
+        JOIN entities e ON e.entity_name = s.entity_name AND e.entity_type = s.entity_type""", (paper_id,))
+    return len(mentions)
+
+
+def file_hash(path, chunk_size=1 << 20):
+    """Return the SHA-256 hex digest of a file's content"""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def remove_artifacts(file_dict, keys=('paper_docx', 'paper_json', 'paper_entities')):
+    """Delete the DOCX/JSON/entity files generated for a paper"""
+    for key in keys:
+        path = file_dict.get(key)
+        if path and exists(path):
+            os.remove(path)
+
+
+class IngestManifest:
+    """Persistent record of which PDF content has already been ingested
+
+    Each row stores the content hash, size, mtime and pipeline version a paper
+    was ingested with. A paper whose size and mtime still match its row is
+    skipped after a single ``os.stat``; only papers that fail that check are
+    hashed, and only papers whose hash or pipeline version changed go back
+    through the pipeline. The ingest_manifest table is created by migrations.py.
+    """
+
+    def __init__(self, conn):
+        self.conn = conn
+
+    def entries(self):
+        """@brief load the whole manifest
+
+        Returns:
+            (dict): manifest rows keyed by paper_pdf
+        """
+        cur = self.conn.execute("""SELECT paper_pdf, paper_id, content_hash, size, mtime_ns, pipeline_version
+            FROM ingest_manifest""")
+        columns = [column[0] for column in cur.description]
+        return {row[0]: dict(zip(columns, row)) for row in cur.fetchall()}
+
+    @staticmethod
+    def is_unchanged(entry, stat_result):
+        """Check a manifest row against a fresh os.stat result without reading the file"""
+        return (entry is not None
+                and entry['size'] == stat_result.st_size
+                and entry['mtime_ns'] == stat_result.st_mtime_ns
+                and entry['pipeline_version'] == PIPELINE_VERSION)
+
+    def record(self, paper_pdf, paper_id, content_hash, stat_result):
+        self.conn.execute("""INSERT INTO ingest_manifest(paper_pdf, paper_id, content_hash, size, mtime_ns, pipeline_version, ingested_at)
+            VALUES(?, ?, ?, ?, ?, ?, ?)
+            ON CONFLICT(paper_pdf) DO UPDATE SET
+                paper_id=excluded.paper_id,
+                content_hash=excluded.content_hash,
+                size=excluded.size,
+                mtime_ns=excluded.mtime_ns,
+                pipeline_version=excluded.pipeline_version,
+                ingested_at=excluded.ingested_at""",
+            (paper_pdf, paper_id, content_hash, stat_result.st_size, stat_result.st_mtime_ns,
+             PIPELINE_VERSION, datetime.now().isoformat()))
+
+    def touch(self, paper_pdf, stat_result):
+        """Refresh size/mtime of a paper whose content hash did not change"""
+        self.conn.execute("UPDATE ingest_manifest SET size = ?, mtime_ns = ? WHERE paper_pdf = ?",
+                          (stat_result.st_size, stat_result.st_mtime_ns, paper_pdf))
+
+    def remove(self, paper_pdf):
+        """@brief drop a paper that no longer exists on disk, together with its database rows
+
+        Args:
+            paper_pdf (str): path of the removed PDF
+
+        Returns:
+            (dict): file dict of the removed paper (paths of its generated artifacts), or None
+        """
+        cur = self.conn.execute("""SELECT p.paper_id, p.paper_docx, p.paper_json, p.paper_entities
+            FROM ingest_manifest m LEFT JOIN papers p ON p.paper_id = m.paper_id
+            WHERE m.paper_pdf = ?""", (paper_pdf,))
+        row = cur.fetchone()
+        self.conn.execute("DELETE FROM ingest_manifest WHERE paper_pdf = ?", (paper_pdf,))
+        if row is None or row[0] is None:
+            return None
+        self.conn.execute("DELETE FROM papers_have_entities WHERE paper_id = ?", (row[0],))
+        self.conn.execute("DELETE FROM paper_texts WHERE paper_id = ?", (row[0],))
+        self.conn.execute("DELETE FROM paper_clusters WHERE paper_id = ?", (row[0],))
+        # Paper ids can be reused, a new paper must not inherit these lists
+        self.conn.execute("DELETE FROM paper_neighbours WHERE paper_id = ? OR neighbour_id = ?", (row[0], row[0]))
+        self.conn.execute("DELETE FROM sentiment_cache WHERE cache_key IN (?, ?)",
+                          (paper_key(row[0]), document_key(row[2])))
+        self.conn.execute("DELETE FROM papers WHERE paper_id = ?", (row[0],))
+        return {'paper_pdf': paper_pdf, 'paper_docx': row[1], 'paper_json': row[2], 'paper_entities': row[3]}
+
+
+class IngestJob:
+    """Run an ingestion function in a background thread and expose its state
+
+    ``target`` is called as ``target(progress=...)``, e.g. initialize_database.
+    """
+
+    def __init__(self, target, progress=None):
+        self.target = target
+        self.progress = progress or IngestProgress()
+        self.lock = threading.Lock()
+        self.thread = None
+        self.state = 'pending'
+        self.error = None
+        self.started_at = None
+        self.finished_at = None
+
+    def start(self):
+        """@brief start the job unless it is already running
+
+        Returns:
+            (bool): True if a new run was started
+        """
+        with self.lock:
+            if self.state == 'running':
+                return False
+            self.state = 'running'
+            self.error = None
+            self.started_at = datetime.now().isoformat()
+            self.finished_at = None
+            self.thread = threading.Thread(target=self._run, name='ingest', daemon=True)
+            self.thread.start()
+        return True
+
+    def _run(self):
+        try:
+            self.target(progress=self.progress)
+        except Exception as e:
+            logger.error(f"Background ingestion failed: {str(e)}", exc_info=True)
+            with self.lock:
+                self.state = 'failed'
+                self.error = str(e)
+        else:
+            with self.lock:
+                self.state = 'done'
+        with self.lock:
+            self.finished_at = datetime.now().isoformat()
+
+    @property
+    def ready(self):
+        return self.state == 'done'
+
+    def status(self):
+        """Return the job state and per-stage progress as a JSON-serialisable dict"""
+        with self.lock:
+            status = {
+                'state': self.state,
+                'error': self.error,
+                'started_at': self.started_at,
+                'finished_at': self.finished_at,
+            }
+        status['progress'] = self.progress.snapshot()
+        return status
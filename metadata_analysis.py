@@ -0,0 +1,104 @@
+from collections import Counter
+from datetime import datetime
+import logging
+import json
+
+logger = logging.getLogger(__name__)
+
+def load_arxiv_metadata(file_path, limit=None):
+    """加载arXiv元数据文件"""
+    papers = []
+    try:
+        with open(file_path, 'r', encoding='utf-8') as f:
+            for i, line in enumerate(f):
+                if limit and i >= limit:
+                    break
+                try:
+                    paper = json.loads(line.strip())
+                    papers.append(paper)
+                except json.JSONDecodeError:
+                    continue
+        return papers
+    except Exception as e:
+        logger.error(f"Error loading arXiv metadata: {str(e)}")
+        return None
+
+
+def analyze_metadata(file_path, limit=None, analysis_type='all'):
+    """统计arXiv元数据: 分类、作者、时间趋势和基本信息
+
+    在分析进程池中运行, 文件在工作进程里读取, 不经过请求线程
+
+    Args:
+        file_path (str): arxiv-metadata-oai-snapshot.json 的路径
+        limit (int): 最多读取的论文数量, None 表示全部
+        analysis_type (str): categories, authors, time 或 all
+
+    Returns:
+        dict: 各项统计结果; 文件无法加载时返回 None
+    """
+    papers = load_arxiv_metadata(file_path, limit)
+    if not papers:
+        return None
+
+    results = {}
+
+    # 分类统计
+    if analysis_type in ['categories', 'all']:
+        category_counter = Counter()
+        for paper in papers:
+            categories = paper.get('categories', '').split()
+            category_counter.update(categories)
+
+        results['category_analysis'] = {
+            'total_categories': len(category_counter),
+            'category_distribution': dict(category_counter.most_common(20))
+        }
+
+    # 作者统计
+    if analysis_type in ['authors', 'all']:
+        author_counter = Counter()
+        for paper in papers:
+            authors_parsed = paper.get('authors_parsed', [])
+            for author in authors_parsed:
+                if author and len(author) >= 2:
+                    author_name = f"{author[0]}, {author[1]}"
+                    author_counter[author_name] += 1
+
+        results['author_analysis'] = {
+            'total_authors': len(author_counter),
+            'top_authors': dict(author_counter.most_common(20))
+        }
+
+    # 时间趋势分析
+    if analysis_type in ['time', 'all']:
+        time_counter = Counter()
+        version_counter = Counter()
+
+        for paper in papers:
+            update_date = paper.get('update_date', '')
+            if update_date:
+                try:
+                    year = datetime.strptime(update_date, '%Y-%m-%d').year
+                    time_counter[year] += 1
+                except ValueError:
+                    continue
+
+            versions = paper.get('versions', [])
+            version_counter[len(versions)] += 1
+
+        results['time_analysis'] = {
+            'yearly_distribution': dict(sorted(time_counter.items())),
+            'version_distribution': dict(sorted(version_counter.items()))
+        }
+
+    # 基本统计
+    if analysis_type == 'all':
+        results['basic_stats'] = {
+            'total_papers': len(papers),
+            'papers_with_doi': sum(1 for p in papers if p.get('doi')),
+            'papers_with_license': sum(1 for p in papers if p.get('license')),
+            'papers_with_journal_ref': sum(1 for p in papers if p.get('journal-ref'))
+        }
+
+    return results
@@ -0,0 +1,281 @@
+import logging
+
+logger = logging.getLogger(__name__)
+
+# (version, description, statements). Applied in order; the database's
+# PRAGMA user_version records the last version applied. Never edit a
+# released migration, append a new one instead.
+MIGRATIONS = [
+    (1, 'base schema', [
+        """CREATE TABLE IF NOT EXISTS papers (
+            paper_id INTEGER PRIMARY KEY,
+            paper_name TEXT NOT NULL UNIQUE,
+            paper_pdf TEXT NOT NULL,
+            paper_docx TEXT NOT NULL,
+            paper_json TEXT NOT NULL,
+            paper_entities TEXT NOT NULL
+        )""",
+        """CREATE TABLE IF NOT EXISTS entities (
+            entity_id INTEGER PRIMARY KEY,
+            entity_name TEXT NOT NULL,
+            entity_type TEXT NOT NULL,
+            UNIQUE(entity_name, entity_type)
+        )""",
+        """CREATE TABLE IF NOT EXISTS papers_have_entities (
+            entity_id INTEGER,
+            paper_id INTEGER,
+            count INTEGER DEFAULT 1,
+            FOREIGN KEY(entity_id) REFERENCES entities(entity_id),
+            FOREIGN KEY(paper_id) REFERENCES papers(paper_id),
+            PRIMARY KEY(entity_id, paper_id)
+        )""",
+        """CREATE TABLE IF NOT EXISTS paper_texts (
+            paper_id INTEGER PRIMARY KEY,
+            body TEXT NOT NULL,
+            FOREIGN KEY(paper_id) REFERENCES papers(paper_id)
+        )""",
+        """CREATE TABLE IF NOT EXISTS ingest_manifest (
+            paper_pdf TEXT PRIMARY KEY,
+            paper_id INTEGER,
+            content_hash TEXT NOT NULL,
+            size INTEGER NOT NULL,
+            mtime_ns INTEGER NOT NULL,
+            pipeline_version INTEGER NOT NULL,
+            ingested_at TEXT NOT NULL
+        )""",
+        """CREATE TABLE IF NOT EXISTS arxiv_papers (
+            arxiv_id TEXT PRIMARY KEY,
+            title TEXT NOT NULL,
+            abstract TEXT,
+            authors TEXT,
+            categories TEXT,
+            published TEXT,
+            updated TEXT,
+            pdf_url TEXT,
+            relevance_score REAL DEFAULT 1.0,
+            json_data TEXT
+        )""",
+    ]),
+    (2, 'entity type/name, reverse link and title indexes', [
+        # Covers `entity_type = ? AND entity_name LIKE ?` lookups; entity_id is
+        # the rowid, so the index alone answers them
+        "CREATE INDEX IF NOT EXISTS idx_entities_type_name ON entities(entity_type, entity_name COLLATE NOCASE)",
+        # The primary key starts with entity_id, this serves per-paper lookups and deletes
+        "CREATE INDEX IF NOT EXISTS idx_papers_have_entities_paper ON papers_have_entities(paper_id, entity_id)",
+        # Case-insensitive title dedupe in unified_search
+        "CREATE INDEX IF NOT EXISTS idx_papers_name_nocase ON papers(paper_name COLLATE NOCASE)",
+    ]),
+    (3, 'FTS5 indexes over paper bodies and arXiv titles/abstracts', [
+        # External content tables: the text lives once, in paper_texts and
+        # arxiv_papers, and the triggers keep the indexes in step with it
+        """CREATE VIRTUAL TABLE IF NOT EXISTS papers_fts USING fts5(
+            body, content='paper_texts', content_rowid='paper_id', tokenize='porter unicode61'
+        )""",
+        """CREATE TRIGGER IF NOT EXISTS paper_texts_fts_insert AFTER INSERT ON paper_texts BEGIN
+            INSERT INTO papers_fts(rowid, body) VALUES (new.paper_id, new.body);
+        END""",
+        """CREATE TRIGGER IF NOT EXISTS paper_texts_fts_delete AFTER DELETE ON paper_texts BEGIN
+            INSERT INTO papers_fts(papers_fts, rowid, body) VALUES ('delete', old.paper_id, old.body);
+        END""",
+        """CREATE TRIGGER IF NOT EXISTS paper_texts_fts_update AFTER UPDATE ON paper_texts BEGIN
+            INSERT INTO papers_fts(papers_fts, rowid, body) VALUES ('delete', old.paper_id, old.body);
+            INSERT INTO papers_fts(rowid, body) VALUES (new.paper_id, new.body);
+        END""",
+        "INSERT INTO papers_fts(papers_fts) VALUES ('rebuild')",
+        """CREATE VIRTUAL TABLE IF NOT EXISTS arxiv_fts USING fts5(
+            title, abstract, content='arxiv_papers', content_rowid='rowid', tokenize='porter unicode61'
+        )""",
+        """CREATE TRIGGER IF NOT EXISTS arxiv_papers_fts_insert AFTER INSERT ON arxiv_papers BEGIN
+            INSERT INTO arxiv_fts(rowid, title, abstract) VALUES (new.rowid, new.title, new.abstract);
+        END""",
+        """CREATE TRIGGER IF NOT EXISTS arxiv_papers_fts_delete AFTER DELETE ON arxiv_papers BEGIN
+            INSERT INTO arxiv_fts(arxiv_fts, rowid, title, abstract) VALUES ('delete', old.rowid, old.title, old.abstract);
+        END""",
+        """CREATE TRIGGER IF NOT EXISTS arxiv_papers_fts_update AFTER UPDATE ON arxiv_papers BEGIN
+            INSERT INTO arxiv_fts(arxiv_fts, rowid, title, abstract) VALUES ('delete', old.rowid, old.title, old.abstract);
+            INSERT INTO arxiv_fts(rowid, title, abstract) VALUES (new.rowid, new.title, new.abstract);
+        END""",
+        "INSERT INTO arxiv_fts(arxiv_fts) VALUES ('rebuild')",
+    ]),
+    (4, 'sentiment result cache', [
+        # cache_key is 'doc:<absolute JSON path>' or 'paper:<paper_id>', see sentiment_cache.py
+        """CREATE TABLE IF NOT EXISTS sentiment_cache (
+            cache_key TEXT PRIMARY KEY,
+            content_hash TEXT NOT NULL,
+            analyzer_version INTEGER NOT NULL,
+            results TEXT NOT NULL
+        )""",
+    ]),
+    (5, 'persisted cluster models and per-paper cluster assignment', [
+        # One row per fit; the latest row of a scope ('local' or 'arxiv', see
+        # cluster_models.py) is the model the assignments refer to
+        """CREATE TABLE IF NOT EXISTS cluster_models (
+            model_id INTEGER PRIMARY KEY,
+            scope TEXT NOT NULL,
+            corpus_version TEXT NOT NULL,
+            n_clusters INTEGER NOT NULL,
+            fitted_at TEXT NOT NULL,
+            fitted_papers INTEGER NOT NULL,
+            baseline_distance REAL NOT NULL,
+            assigned_papers INTEGER NOT NULL DEFAULT 0,
+            assigned_distance REAL NOT NULL DEFAULT 0,
+            terms TEXT NOT NULL,
+            idf BLOB NOT NULL,
+            centroids BLOB NOT NULL,
+            cluster_terms TEXT NOT NULL
+        )""",
+        "CREATE INDEX IF NOT EXISTS idx_cluster_models_scope ON cluster_models(scope, model_id)",
+        # Assignments live in side tables rather than in a papers column, so the
+        # shape of papers (and of queries selecting from it) stays as it was
+        """CREATE TABLE IF NOT EXISTS paper_clusters (
+            paper_id INTEGER PRIMARY KEY,
+            cluster_id INTEGER NOT NULL,
+            FOREIGN KEY(paper_id) REFERENCES papers(paper_id)
+        )""",
+        """CREATE TABLE IF NOT EXISTS arxiv_paper_clusters (
+            arxiv_id TEXT PRIMARY KEY,
+            cluster_id INTEGER NOT NULL,
+            FOREIGN KEY(arxiv_id) REFERENCES arxiv_papers(arxiv_id)
+        ) WITHOUT ROWID""",
+        # Listing a cluster is a range scan, already in id order
+        "CREATE INDEX IF NOT EXISTS idx_paper_clusters_cluster ON paper_clusters(cluster_id)",
+        "CREATE INDEX IF NOT EXISTS idx_arxiv_paper_clusters_cluster ON arxiv_paper_clusters(cluster_id)",
+    ]),
+    (6, 'precomputed nearest-neighbour lists', [
+        # Top-k most similar papers of every paper, see neighbour_index.py;
+        # clustered by (paper, rank) so a lookup reads one short range
+        """CREATE TABLE IF NOT EXISTS paper_neighbours (
+            paper_id INTEGER NOT NULL,
+            rank INTEGER NOT NULL,
+            neighbour_id INTEGER NOT NULL,
+            score REAL NOT NULL,
+            PRIMARY KEY (paper_id, rank)
+        ) WITHOUT ROWID""",
+        """CREATE TABLE IF NOT EXISTS arxiv_neighbours (
+            arxiv_id TEXT NOT NULL,
+            rank INTEGER NOT NULL,
+            neighbour_id TEXT NOT NULL,
+            score REAL NOT NULL,
+            PRIMARY KEY (arxiv_id, rank)
+        ) WITHOUT ROWID""",
+        # One row per scope: when its lists were last rebuilt from scratch
+        """CREATE TABLE IF NOT EXISTS neighbour_indexes (
+            scope TEXT PRIMARY KEY,
+            k INTEGER NOT NULL,
+            built_at TEXT NOT NULL,
+            built_papers INTEGER NOT NULL,
+            inserted_papers INTEGER NOT NULL DEFAULT 0
+        )""",
+    ]),
+    (7, 'arXiv API response cache', [
+        # Parsed results of arXiv API calls, see arxiv_cache.py
+        """CREATE TABLE IF NOT EXISTS arxiv_response_cache (
+            cache_key TEXT PRIMARY KEY,
+            kind TEXT NOT NULL,
+            fetched_at REAL NOT NULL,
+            accessed_at REAL NOT NULL,
+            results TEXT NOT NULL
+        )""",
+        # Eviction drops the least recently used entries first
+        "CREATE INDEX IF NOT EXISTS idx_arxiv_response_cache_accessed ON arxiv_response_cache(accessed_at)",
+    ]),
+    (8, 'stable rowids under the arXiv full-text index', [
+        # arxiv_fts points at the rowid of arxiv_papers, whose TEXT primary key
+        # leaves that rowid implicit, and VACUUM may renumber implicit rowids.
+        # The table is rebuilt with an INTEGER PRIMARY KEY alias (last, so
+        # column positions do not move) that keeps the current values.
+        "DROP TRIGGER IF EXISTS arxiv_papers_fts_insert",
+        "DROP TRIGGER IF EXISTS arxiv_papers_fts_delete",
+        "DROP TRIGGER IF EXISTS arxiv_papers_fts_update",
+        "DROP TABLE IF EXISTS arxiv_fts",
+        """CREATE TABLE arxiv_papers_new (
+            arxiv_id TEXT NOT NULL UNIQUE,
+            title TEXT NOT NULL,
+            abstract TEXT,
+            authors TEXT,
+            categories TEXT,
+            published TEXT,
+            updated TEXT,
+            pdf_url TEXT,
+            relevance_score REAL DEFAULT 1.0,
+            json_data TEXT,
+            arxiv_rowid INTEGER PRIMARY KEY
+        )""",
+        """INSERT INTO arxiv_papers_new(arxiv_id, title, abstract, authors, categories, published, updated,
+                pdf_url, relevance_score, json_data, arxiv_rowid)
+            SELECT arxiv_id, title, abstract, authors, categories, published, updated,
+                pdf_url, relevance_score, json_data, rowid
+            FROM arxiv_papers""",
+        "DROP TABLE arxiv_papers",
+        "ALTER TABLE arxiv_papers_new RENAME TO arxiv_papers",
+        """CREATE VIRTUAL TABLE arxiv_fts USING fts5(
+            title, abstract, content='arxiv_papers', content_rowid='arxiv_rowid', tokenize='porter unicode61'
+        )""",
+        """CREATE TRIGGER arxiv_papers_fts_insert AFTER INSERT ON arxiv_papers BEGIN
+            INSERT INTO arxiv_fts(rowid, title, abstract) VALUES (new.arxiv_rowid, new.title, new.abstract);
+        END""",
+        """CREATE TRIGGER arxiv_papers_fts_delete AFTER DELETE ON arxiv_papers BEGIN
+            INSERT INTO arxiv_fts(arxiv_fts, rowid, title, abstract) VALUES ('delete', old.arxiv_rowid, old.title, old.abstract);
+        END""",
+        """CREATE TRIGGER arxiv_papers_fts_update AFTER UPDATE ON arxiv_papers BEGIN
+            INSERT INTO arxiv_fts(arxiv_fts, rowid, title, abstract) VALUES ('delete', old.arxiv_rowid, old.title, old.abstract);
+            INSERT INTO arxiv_fts(rowid, title, abstract) VALUES (new.arxiv_rowid, new.title, new.abstract);
+        END""",
+        "INSERT INTO arxiv_fts(arxiv_fts) VALUES ('rebuild')",
+    ]),
+]
+
+SCHEMA_VERSION = MIGRATIONS[-1][0]
+
+
+def schema_version(conn):
+    return conn.execute("PRAGMA user_version").fetchone()[0]
+
+
+def migrate(conn):
+    """@brief upgrade the database schema in place to SCHEMA_VERSION
+
+    Every pending migration runs in its own transaction together with the
+    user_version bump, so an interrupted upgrade resumes where it stopped.
+    Statistics are refreshed with ANALYZE after an upgrade and with
+    PRAGMA optimize otherwise.
+
+    Args:
+        conn (sqlite3.Connection): database connection
+
+    Returns:
+        (list): versions that were applied
+    """
+    current = schema_version(conn)
+    applied = []
+    for version, description, statements in MIGRATIONS:
+        if version <= current:
+            continue
+        logger.info(f"Applying schema migration {version}: {description}")
+        if conn.in_transaction:
+            conn.commit()
+        conn.execute("BEGIN")
+        try:
+            for statement in statements:
+                conn.execute(statement)
+            conn.execute(f"PRAGMA user_version = {version}")
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+        applied.append(version)
+    if applied:
+        conn.execute("ANALYZE")
+    else:
+        conn.execute("PRAGMA optimize")
+    conn.commit()
+    return applied
+
+
+def explain(conn, query, args=()):
+    """@brief return the EXPLAIN QUERY PLAN details of a query
+
+    Returns:
+        (list): the 'detail' column of every plan row
+    """
+    return [row[3] for row in conn.execute("EXPLAIN QUERY PLAN " + query, args).fetchall()]
@@ -0,0 +1,117 @@
+import multiprocessing
+import threading
+import logging
+import time
+import os
+
+logger = logging.getLogger(__name__)
+
+SPACY_MODEL = os.environ.get('SPACY_MODEL', 'en_core_web_sm')
+
+# Pipeline components each variant skips. All variants run on one shared
+# copy of SPACY_MODEL, loaded without the components no variant needs.
+SPACY_VARIANTS = {
+    # entity extraction at ingest time
+    'ner': ['tagger', 'parser', 'attribute_ruler', 'lemmatizer'],
+    # sentence splitting for sentiment; doc.sents comes from the parser
+    'sentences': ['tagger', 'attribute_ruler', 'lemmatizer', 'ner'],
+}
+
+# Models loaded by preload() when the app starts, e.g. "ner,sentences,vader"
+PRELOAD = [name for name in os.environ.get('PRELOAD_MODELS', '').split(',') if name]
+
+_lock = threading.Lock()
+_loaded = {}
+_load_seconds = {}
+
+
+class SpacyVariant:
+    """A view of the shared spaCy pipeline that skips some components
+
+    Calls and pipe() behave like the underlying Language object with
+    ``disable`` applied, without loading another copy of the model.
+    """
+
+    def __init__(self, nlp, disable):
+        self.nlp = nlp
+        self.disable = disable
+
+    def __call__(self, text):
+        return self.nlp(text, disable=self.disable)
+
+    def pipe(self, texts, **kwargs):
+        return self.nlp.pipe(texts, disable=self.disable, **kwargs)
+
+
+def _load(name, loader):
+    model = _loaded.get(name)
+    if model is None:
+        with _lock:
+            model = _loaded.get(name)
+            if model is None:
+                start = time.perf_counter()
+                model = loader()
+                _load_seconds[name] = time.perf_counter() - start
+                logger.info(f"Loaded model {name} in {_load_seconds[name]:.2f}s")
+                _loaded[name] = model
+    return model
+
+
+def _load_spacy():
+    import spacy
+    exclude = sorted(set.intersection(*(set(skip) for skip in SPACY_VARIANTS.values())))
+    return spacy.load(SPACY_MODEL, exclude=exclude)
+
+
+def _load_vader():
+    from nltk.sentiment import SentimentIntensityAnalyzer
+    return SentimentIntensityAnalyzer()
+
+
+def nlp(variant):
+    """@brief the shared spaCy pipeline as seen by one variant, loaded on first use
+
+    Args:
+        variant (str): a key of SPACY_VARIANTS
+
+    Returns:
+        (SpacyVariant): callable like a spaCy Language, with pipe()
+    """
+    if variant not in SPACY_VARIANTS:
+        raise ValueError(f"Unknown spaCy variant: {variant}")
+    return SpacyVariant(_load('spacy', _load_spacy), SPACY_VARIANTS[variant])
+
+
+def vader():
+    """@brief the shared NLTK VADER analyzer, loaded on first use"""
+    return _load('vader', _load_vader)
+
+
+def preload(names):
+    """@brief load models up front, e.g. before worker processes are forked
+
+    Forked workers then find the models already loaded and share their
+    memory pages with the parent copy-on-write instead of loading their own.
+
+    Args:
+        names (list): SPACY_VARIANTS keys and/or 'vader'
+    """
+    for name in names:
+        if name == 'vader':
+            vader()
+        else:
+            nlp(name)
+
+
+def forks_share_models():
+    """Whether new worker processes are forked and so inherit preloaded models"""
+    return multiprocessing.get_start_method() == 'fork'
+
+
+def status():
+    """Return the loaded models and how long each took to load"""
+    with _lock:
+        return {
+            'spacy_model': SPACY_MODEL,
+            'loaded': {name: round(seconds, 3) for name, seconds in _load_seconds.items()},
+        }
@@ -0,0 +1,309 @@
+from datetime import datetime
+import threading
+import logging
+import os
+
+import numpy as np
+from scipy import sparse
+
+import db
+from feature_store import CorpusFeatures, FeatureStore
+from cluster_models import arxiv_documents
+from paper_clustering import make_vectorizer
+
+logger = logging.getLogger(__name__)
+
+# Neighbours kept per paper
+TOP_K = int(os.environ.get('SIMILAR_TOP_K', 10))
+# Similarity scores held in memory at once while building, rows x corpus size
+BLOCK_CELLS = int(os.environ.get('SIMILAR_BLOCK_CELLS', 1 << 22))
+# Rebuild from scratch once papers inserted since the last build exceed this share
+REBUILD_SHARE = float(os.environ.get('SIMILAR_REBUILD_SHARE', 0.2))
+# TF-IDF rows and vocabulary of the saved arXiv papers as of the last build,
+# one .npz file; inserts vectorize only the new papers with that vocabulary
+ARXIV_FEATURES_PATH = os.environ.get('ARXIV_FEATURES_PATH', 'data/arxiv_features.npz')
+
+# Called as insert_runner(insert_database, db_file, scope, new_ids) to update
+# an index away from the calling process, e.g. AnalysisPool.run; None updates
+# in the background thread itself
+insert_runner = None
+
+# The neighbour table of every scope, its key column and where titles come from
+SCOPES = {
+    'local': ('paper_neighbours', 'paper_id', 'papers', 'paper_name'),
+    'arxiv': ('arxiv_neighbours', 'arxiv_id', 'arxiv_papers', 'title'),
+}
+
+_updating = {scope: threading.Lock() for scope in SCOPES}
+
+
+def scope_vectors(conn, scope, store=None, built_at=None):
+    """@brief L2-normalised TF-IDF rows of every paper of a scope
+
+    Local papers come from the feature store. Saved arXiv papers are
+    vectorized from their titles and abstracts with a vocabulary fitted
+    here, which is saved to ARXIV_FEATURES_PATH for insert() to reuse.
+
+    Args:
+        built_at (str): the build the arXiv features are saved for
+
+    Returns:
+        (tuple): (list of ids, csr_matrix), None when the scope is empty
+    """
+    if scope == 'local':
+        features = (store or FeatureStore()).get(conn, stale_ok=False)
+        if features is None:
+            return None
+        return [int(paper_id) for paper_id in features.paper_ids], features.matrix
+    documents = arxiv_documents(conn)
+    if not documents:
+        if os.path.exists(ARXIV_FEATURES_PATH):
+            os.remove(ARXIV_FEATURES_PATH)
+        return None
+    vectorizer = make_vectorizer()
+    matrix = vectorizer.fit_transform(f"{title} {text}" for _, title, text in documents).tocsr()
+    ids = [arxiv_id for arxiv_id, _, _ in documents]
+    CorpusFeatures(matrix, np.array(ids, dtype=str), [title for _, title, _ in documents],
+                   vectorizer.get_feature_names_out(), vectorizer.idf_, built_at or '').save(ARXIV_FEATURES_PATH)
+    return ids, matrix
+
+
+def _extend_arxiv_vectors(conn, new_ids, built_at):
+    """@brief add new or changed arXiv papers to the features of the last build
+
+    Only the given papers are vectorized, with the vocabulary and IDF of the
+    build, so their scores are comparable with the lists already stored.
+
+    Returns:
+        (tuple): (list of ids, csr_matrix), None when no features of this build are saved
+    """
+    try:
+        features = CorpusFeatures.load(ARXIV_FEATURES_PATH)
+    except (OSError, ValueError, KeyError):
+        return None
+    if features.signature != built_at:
+        return None
+    documents = arxiv_documents(conn, new_ids)
+    changed = set(arxiv_id for arxiv_id, _, _ in documents)
+    keep = [row for row, arxiv_id in enumerate(features.paper_ids) if str(arxiv_id) not in changed]
+    ids = [str(features.paper_ids[row]) for row in keep] + [arxiv_id for arxiv_id, _, _ in documents]
+    matrix = features.matrix[keep]
+    if documents:
+        matrix = sparse.vstack([matrix, features.vectorizer().transform(
+            f"{title} {text}" for _, title, text in documents)]).tocsr()
+        CorpusFeatures(matrix, np.array(ids, dtype=str),
+                       [features.titles[row] for row in keep] + [title for _, title, _ in documents],
+                       features.terms, features.idf, built_at).save(ARXIV_FEATURES_PATH)
+    return ids, matrix
+
+
+def _score_blocks(queries, corpus, block_cells=BLOCK_CELLS):
+    """Cosine similarities of the query rows with every corpus row, a dense block of rows at a time
+
+    Yields:
+        (tuple): (index of the first query row, block of shape rows x corpus size)
+    """
+    rows = max(1, block_cells // max(corpus.shape[0], 1))
+    corpus_t = corpus.T.tocsc()
+    for start in range(0, queries.shape[0], rows):
+        yield start, (queries[start:start + rows] @ corpus_t).toarray()
+
+
+def _top_k(block, k):
+    """Column indexes and scores of the k best positive scores of every row, best first"""
+    k = min(k, block.shape[1])
+    if k == 0:
+        return [[] for _ in range(block.shape[0])]
+    best = np.argpartition(-block, k - 1, axis=1)[:, :k]
+    lists = []
+    for row, columns in enumerate(best):
+        scores = block[row, columns]
+        order = np.argsort(-scores, kind='stable')
+        lists.append([(int(columns[i]), float(scores[i])) for i in order if scores[i] > 0])
+    return lists
+
+
+def _write_lists(conn, scope, lists):
+    """Replace the neighbour lists of some papers, lists maps an id to [(neighbour id, score), ...]"""
+    table, key, _, _ = SCOPES[scope]
+    conn.executemany(f"DELETE FROM {table} WHERE {key} = ?", [(paper_id,) for paper_id in lists])
+    conn.executemany(f"INSERT INTO {table}({key}, rank, neighbour_id, score) VALUES(?, ?, ?, ?)",
+                     [(paper_id, rank, neighbour_id, score)
+                      for paper_id, neighbours in lists.items()
+                      for rank, (neighbour_id, score) in enumerate(neighbours)])
+
+
+def build(conn, scope, k=TOP_K, store=None, block_cells=BLOCK_CELLS):
+    """@brief compute the top-k neighbours of every paper of a scope from scratch
+
+    Similarities are sparse matrix products of the TF-IDF rows, taken a
+    block of rows at a time so at most block_cells scores are in memory.
+
+    Returns:
+        (int): number of papers indexed
+    """
+    table, _, _, _ = SCOPES[scope]
+    built_at = datetime.now().isoformat()
+    vectors = scope_vectors(conn, scope, store, built_at)
+    ids, matrix = vectors if vectors is not None else ([], None)
+    lists = {}
+    if ids:
+        for start, block in _score_blocks(matrix, matrix, block_cells):
+            # A paper is not its own neighbour
+            block[np.arange(block.shape[0]), np.arange(start, start + block.shape[0])] = -np.inf
+            for offset, neighbours in enumerate(_top_k(block, k)):
+                lists[ids[start + offset]] = [(ids[column], score) for column, score in neighbours]
+    try:
+        conn.execute(f"DELETE FROM {table}")
+        _write_lists(conn, scope, lists)
+        conn.execute("""INSERT INTO neighbour_indexes(scope, k, built_at, built_papers, inserted_papers)
+            VALUES(?, ?, ?, ?, 0)
+            ON CONFLICT(scope) DO UPDATE SET k = excluded.k, built_at = excluded.built_at,
+                built_papers = excluded.built_papers, inserted_papers = 0""",
+            (scope, k, built_at, len(ids)))
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    logger.info(f"Built the {scope} neighbour index: {len(ids)} papers, k={k}")
+    return len(ids)
+
+
+def insert(conn, scope, new_ids, store=None, block_cells=BLOCK_CELLS):
+    """@brief add new or changed papers to the neighbour index of a scope
+
+    Only the rows of the new papers are multiplied with the corpus: they get
+    their own lists, and a paper already in the index takes a new paper into
+    its list when it scores above the paper's current k-th neighbour. The
+    index is built from scratch instead when it does not exist yet, or when
+    the papers inserted since the last build exceed SIMILAR_REBUILD_SHARE,
+    since every insert leaves the older lists with the IDF of their time.
+    New arXiv papers are vectorized with the vocabulary of the last build,
+    not with one refitted over all saved papers.
+
+    Args:
+        conn (sqlite3.Connection): database connection, committed by this function
+        scope (str): a key of SCOPES
+        new_ids (list): paper ids (local) or arXiv ids
+
+    Returns:
+        (dict): 'indexed' papers and whether the index was 'rebuilt'
+    """
+    table, key, _, _ = SCOPES[scope]
+    new_ids = list(new_ids)
+    # Papers that already have a list are updated, they do not count towards a rebuild
+    already_indexed = set(row[0] for row in conn.execute(
+        f"SELECT DISTINCT {key} FROM {table} WHERE {key} IN ({','.join('?' * len(new_ids))})", new_ids)) \
+        if new_ids else set()
+    index = conn.execute("SELECT k, built_papers, inserted_papers, built_at FROM neighbour_indexes WHERE scope = ?",
+                         (scope,)).fetchone()
+    inserted = len(set(new_ids) - already_indexed)
+    if index is None or index[1] == 0 or index[2] + inserted > REBUILD_SHARE * index[1]:
+        return {'indexed': build(conn, scope, index[0] if index else TOP_K, store, block_cells), 'rebuilt': True}
+    k = index[0]
+    if not new_ids:
+        return {'indexed': 0, 'rebuilt': False}
+
+    if scope == 'local':
+        vectors = scope_vectors(conn, scope, store)
+    else:
+        vectors = _extend_arxiv_vectors(conn, new_ids, index[3])
+        if vectors is None:
+            # The features of the last build are gone, start over
+            return {'indexed': build(conn, scope, k, store, block_cells), 'rebuilt': True}
+    if vectors is None:
+        return {'indexed': 0, 'rebuilt': False}
+    ids, matrix = vectors
+    position = {paper_id: row for row, paper_id in enumerate(ids)}
+    new_rows = sorted(set(position[paper_id] for paper_id in new_ids if paper_id in position))
+    if not new_rows:
+        return {'indexed': 0, 'rebuilt': False}
+
+    # A new paper enters another paper's list if it beats that list's k-th score
+    threshold = np.zeros(len(ids))
+    for paper_id, count, lowest in conn.execute(f"SELECT {key}, count(*), min(score) FROM {table} GROUP BY {key}"):
+        if count >= k and paper_id in position:
+            threshold[position[paper_id]] = lowest
+    threshold[new_rows] = np.inf
+
+    lists = {}
+    candidates = {}
+    queries = matrix[new_rows]
+    for start, block in _score_blocks(queries, matrix, block_cells):
+        rows = new_rows[start:start + block.shape[0]]
+        block[np.arange(block.shape[0]), rows] = -np.inf
+        for offset, neighbours in enumerate(_top_k(block, k)):
+            lists[ids[rows[offset]]] = [(ids[column], score) for column, score in neighbours]
+        for offset, column in zip(*np.nonzero(block > threshold)):
+            candidates.setdefault(column, []).append((ids[rows[offset]], float(block[offset, column])))
+
+    new_set = set(lists)
+    for column, entries in candidates.items():
+        paper_id = ids[column]
+        merged = {neighbour_id: score for neighbour_id, score in conn.execute(
+            f"SELECT neighbour_id, score FROM {table} WHERE {key} = ?", (paper_id,)) if neighbour_id not in new_set}
+        merged.update(entries)
+        lists[paper_id] = sorted(merged.items(), key=lambda item: -item[1])[:k]
+    try:
+        _write_lists(conn, scope, lists)
+        conn.execute("UPDATE neighbour_indexes SET inserted_papers = inserted_papers + ? WHERE scope = ?",
+                     (len(new_set - already_indexed), scope))
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    return {'indexed': len(new_set), 'rebuilt': False}
+
+
+def insert_database(db_file, scope, new_ids):
+    """insert() with a connection of its own"""
+    conn = db.connect(db_file)
+    try:
+        return insert(conn, scope, new_ids)
+    finally:
+        conn.close()
+
+
+def insert_in_background(scope, new_ids, db_file=None):
+    """@brief insert() in a background thread; inserts of one scope run one after another
+
+    The update itself runs through insert_runner when one is set.
+    """
+    db_file = db_file or db.pool.db_file
+    new_ids = list(new_ids)
+
+    def run():
+        with _updating[scope]:
+            try:
+                if insert_runner is not None:
+                    insert_runner(insert_database, db_file, scope, new_ids)
+                else:
+                    insert_database(db_file, scope, new_ids)
+            except Exception as e:
+                logger.error(f"Updating the {scope} neighbour index failed: {str(e)}")
+
+    thread = threading.Thread(target=run, name=f'neighbour-index-{scope}', daemon=True)
+    thread.start()
+    return thread
+
+
+def similar(conn, scope, paper_id, limit=TOP_K):
+    """@brief the precomputed most similar papers of a paper, best first
+
+    Neighbours that have been removed since the lists were computed are skipped.
+
+    Returns:
+        (list): (id, title, score) rows, None when the paper does not exist
+    """
+    table, key, papers, title = SCOPES[scope]
+    if conn.execute(f"SELECT 1 FROM {papers} WHERE {key} = ?", (paper_id,)).fetchone() is None:
+        return None
+    return conn.execute(f"""SELECT n.neighbour_id, p.{title}, n.score FROM {table} n
+        JOIN {papers} p ON p.{key} = n.neighbour_id
+        WHERE n.{key} = ? ORDER BY n.rank LIMIT ?""", (paper_id, limit)).fetchall()
+
+
+def stats(conn):
+    return {scope: {'k': k, 'built_at': built_at, 'built_papers': built, 'inserted_papers': inserted}
+            for scope, k, built_at, built, inserted in conn.execute(
+                "SELECT scope, k, built_at, built_papers, inserted_papers FROM neighbour_indexes")}
@@ -1,28 +1,285 @@
 from sklearn.feature_extraction.text import TfidfVectorizer
-from sklearn.cluster import KMeans
-from sklearn.decomposition import PCA
+from sklearn.cluster import KMeans, MiniBatchKMeans
+from sklearn.decomposition import PCA, TruncatedSVD
+from dataclasses import dataclass, field, replace
+from collections import OrderedDict, defaultdict
 import numpy as np
+import threading
+import hashlib
 import json
 import logging
+import os
 import pandas as pd
-from collections import defaultdict
 
 logger = logging.getLogger(__name__)
 
-class PaperClusterer:
-    def __init__(self, n_clusters=5):
-        self.n_clusters = n_clusters
-        self.vectorizer = TfidfVectorizer(
-            max_features=1000,
-            stop_words='english',
-            ngram_range=(1, 2)
+# exact: KMeans + 对稠密矩阵做 PCA; scalable: MiniBatchKMeans + 直接对稀疏矩阵做 TruncatedSVD
+CLUSTER_MODES = ('auto', 'exact', 'scalable')
+# auto 模式下论文数超过该值时使用 scalable
+SCALABLE_THRESHOLD = int(os.environ.get('CLUSTER_SCALABLE_THRESHOLD', 5000))
+# MiniBatchKMeans 每批的论文数
+MINIBATCH_SIZE = int(os.environ.get('CLUSTER_BATCH_SIZE', 1024))
+# ClusteringCache 在内存中保留的结果数量
+CLUSTER_CACHE_SIZE = int(os.environ.get('CLUSTER_CACHE_SIZE', 32))
+
+def make_vectorizer(**kwargs):
+    """创建聚类使用的 TF-IDF 向量器, feature_store.py 也用它保持特征一致"""
+    return TfidfVectorizer(
+        max_features=1000,
+        stop_words='english',
+        ngram_range=(1, 2),
+        **kwargs
+    )
+
+def fitted_vectorizer(terms, idf):
+    """用保存下来的词表和 IDF 重建已拟合的向量器, 只用于 transform"""
+    vectorizer = make_vectorizer(vocabulary={str(term): index for index, term in enumerate(terms)})
+    vectorizer.idf_ = np.asarray(idf)
+    return vectorizer
+
+@dataclass(frozen=True)
+class ClusteringConfig:
+    """一次聚类的全部参数; 不可变且可哈希, 可以作为缓存键
+
+    Attributes:
+        n_clusters (int): 簇的数量
+        mode (str): CLUSTER_MODES 之一, auto 按论文数量在 exact 和 scalable 之间选择
+        batch_size (int): scalable 模式下 MiniBatchKMeans 的批大小
+        scalable_threshold (int): auto 模式下论文数超过该值时使用 scalable
+        top_terms (int): 每个簇返回的关键词数量
+        random_state (int): 随机种子, 相同输入和参数得到相同结果
+    """
+    n_clusters: int = 5
+    mode: str = 'auto'
+    batch_size: int = MINIBATCH_SIZE
+    scalable_threshold: int = SCALABLE_THRESHOLD
+    top_terms: int = 5
+    random_state: int = 42
+
+    def __post_init__(self):
+        if self.mode not in CLUSTER_MODES:
+            raise ValueError(f"Unknown clustering mode: {self.mode}")
+
+    def resolve_mode(self, n_papers):
+        """返回对 n_papers 篇论文实际使用的模式 (exact 或 scalable)"""
+        if self.mode != 'auto':
+            return self.mode
+        return 'scalable' if n_papers > self.scalable_threshold else 'exact'
+
+
+@dataclass(frozen=True, eq=False)
+class ClusteringResult:
+    """一次聚类的结果和拟合好的模型, 创建后不再修改, 可以在线程之间共享
+
+    Attributes:
+        config (ClusteringConfig): 使用的参数
+        mode (str): 实际使用的模式 (exact 或 scalable)
+        paper_ids (tuple): 每行对应的论文ID
+        titles (tuple): 每行对应的标题
+        labels (numpy.ndarray): 每篇论文的簇编号 (只读)
+        coords (numpy.ndarray): 每篇论文的二维坐标 (只读)
+        cluster_terms (dict): 簇编号 -> 关键词元组
+        model: 拟合好的 KMeans / MiniBatchKMeans, 不要再对它调用 fit
+        vectorizer: 从文本聚类时拟合的 TfidfVectorizer, 使用已有特征时为 None
+    """
+    config: ClusteringConfig
+    mode: str
+    paper_ids: tuple
+    titles: tuple
+    labels: np.ndarray = field(repr=False)
+    coords: np.ndarray = field(repr=False)
+    cluster_terms: dict
+    model: object = field(repr=False)
+    vectorizer: object = field(default=None, repr=False)
+
+    def to_dict(self):
+        """转换成接口返回的格式: clusters, cluster_terms 和 mode"""
+        clusters = defaultdict(list)
+        for i, label in enumerate(self.labels):
+            clusters[int(label)].append({
+                'paper_id': self.paper_ids[i],
+                'title': self.titles[i],
+                'x': float(self.coords[i][0]),
+                'y': float(self.coords[i][1])
+            })
+        return {
+            'clusters': dict(clusters),
+            'cluster_terms': {label: list(terms) for label, terms in self.cluster_terms.items()},
+            'mode': self.mode
+        }
+
+
+def _read_only(array):
+    array = np.asarray(array)
+    array.setflags(write=False)
+    return array
+
+
+def _cluster_terms(features, labels, terms, n_clusters, top_n):
+    """获取每个簇的主要关键词
+
+    Args:
+        features: TF-IDF特征矩阵
+        labels: 聚类标签
+        terms: 每列对应的词条
+        n_clusters (int): 簇的数量
+        top_n: 每个簇返回的关键词数量
+
+    Returns:
+        dict: 每个簇的关键词元组
+    """
+    cluster_terms = {}
+
+    for i in range(n_clusters):
+        # 获取该簇的所有文档
+        cluster_docs = features[labels == i]
+        if cluster_docs.shape[0] == 0:
+            continue
+
+        # 计算该簇的平均TF-IDF值
+        centroid = cluster_docs.mean(axis=0).A1
+        # 获取最重要的词条
+        top_term_indices = centroid.argsort()[-top_n:][::-1]
+        cluster_terms[i] = tuple(str(terms[idx]) for idx in top_term_indices)
+
+    return cluster_terms
+
+
+def cluster(features, paper_ids, titles, terms, config=ClusteringConfig()):
+    """对已经算好的 TF-IDF 特征聚类 (例如 feature_store.py 中保存的特征)
+
+    每次调用都新建模型, 不读写任何共享状态, 可以在多个线程或进程中同时调用
+
+    Args:
+        features: TF-IDF特征矩阵, 每篇论文一行
+        paper_ids (list): 每行对应的论文ID
+        titles (list): 每行对应的标题
+        terms: 每列对应的词条
+        config (ClusteringConfig): 聚类参数
+
+    Returns:
+        ClusteringResult: 聚类结果
+    """
+    mode = config.resolve_mode(features.shape[0])
+
+    # 执行聚类
+    logger.info(f"Performing clustering of {features.shape[0]} papers, mode={mode}")
+    if mode == 'exact':
+        model = KMeans(
+            n_clusters=config.n_clusters,
+            random_state=config.random_state
         )
-        self.kmeans = KMeans(
-            n_clusters=n_clusters,
-            random_state=42
+    else:
+        model = MiniBatchKMeans(
+            n_clusters=config.n_clusters,
+            batch_size=config.batch_size,
+            n_init=3,
+            random_state=config.random_state
         )
-        self.pca = PCA(n_components=2)
-        
+    labels = model.fit_predict(features)
+
+    # 降维用于可视化; scalable 模式不把稀疏矩阵转成稠密矩阵
+    logger.info("Reducing dimensions for visualization")
+    if mode == 'exact':
+        coords = PCA(n_components=2).fit_transform(features.toarray())
+    else:
+        svd = TruncatedSVD(n_components=2, algorithm='randomized', random_state=config.random_state)
+        coords = svd.fit_transform(features)
+
+    # 获取每个簇的关键词
+    logger.info("Extracting key terms for each cluster")
+    cluster_terms = _cluster_terms(features, labels, terms, config.n_clusters, config.top_terms)
+
+    return ClusteringResult(
+        config=config,
+        mode=mode,
+        paper_ids=tuple(paper_ids),
+        titles=tuple(titles),
+        labels=_read_only(labels),
+        coords=_read_only(coords),
+        cluster_terms=cluster_terms,
+        model=model
+    )
+
+
+def cluster_texts(papers_data, config=ClusteringConfig()):
+    """对论文的标题和摘要聚类, 每次调用都拟合新的 TF-IDF 向量器
+
+    Args:
+        papers_data (list): 包含 paper_id, title, abstract 的论文列表
+        config (ClusteringConfig): 聚类参数
+
+    Returns:
+        ClusteringResult: 聚类结果, vectorizer 为拟合好的向量器
+    """
+    # 提取文本数据(标题 + 摘要)
+    texts = [f"{paper.get('title', '')} {paper.get('abstract', '')}" for paper in papers_data]
+
+    # 转换文本为TF-IDF特征
+    logger.info(f"Converting {len(texts)} papers to TF-IDF features")
+    vectorizer = make_vectorizer()
+    features = vectorizer.fit_transform(texts)
+    # 被 max_features 截掉的词条只用于调试, 语料大时很占内存, 结果会在进程间传递和缓存
+    if hasattr(vectorizer, 'stop_words_'):
+        del vectorizer.stop_words_
+
+    result = cluster(features, [paper.get('paper_id') for paper in papers_data],
+                     [paper.get('title') for paper in papers_data], vectorizer.get_feature_names_out(), config)
+    return replace(result, vectorizer=vectorizer)
+
+
+def papers_digest(papers_data):
+    """论文列表内容的摘要, 与 ClusteringConfig 一起作为 ClusteringCache 的键"""
+    digest = hashlib.sha256()
+    for paper in papers_data:
+        digest.update(json.dumps([paper.get('paper_id'), paper.get('title'), paper.get('abstract')]).encode('utf-8'))
+    return digest.hexdigest()
+
+
+class ClusteringCache:
+    """按 (输入, ClusteringConfig) 缓存 ClusteringResult 的 LRU
+
+    结果不可变, 命中时直接返回同一个对象, 多个请求可以同时使用
+    """
+
+    def __init__(self, max_entries=CLUSTER_CACHE_SIZE):
+        self.max_entries = max_entries
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+        self.counters = {'hits': 0, 'misses': 0}
+
+    def get_or_compute(self, key, compute):
+        """返回 key 对应的结果, 不存在时调用 compute() 计算并保存
+
+        compute 在锁外执行, 同一个键的并发请求可能各自计算一次
+        """
+        with self.lock:
+            result = self.entries.get(key)
+            if result is not None:
+                self.entries.move_to_end(key)
+                self.counters['hits'] += 1
+                return result
+            self.counters['misses'] += 1
+        result = compute()
+        with self.lock:
+            self.entries[key] = result
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+        return result
+
+    def stats(self):
+        with self.lock:
+            return {**self.counters, 'entries': len(self.entries), 'capacity': self.max_entries}
+
+
+class PaperClusterer:
+    """旧接口: 保存一份 ClusteringConfig, 每次调用都是无状态的 cluster() / cluster_texts()"""
+
+    def __init__(self, n_clusters=5, mode='auto', batch_size=MINIBATCH_SIZE, scalable_threshold=SCALABLE_THRESHOLD):
+        self.config = ClusteringConfig(n_clusters=n_clusters, mode=mode, batch_size=batch_size,
+                                       scalable_threshold=scalable_threshold)
+
     def process_papers(self, papers_data):
         """处理论文数据并进行聚类
         
@@ -33,78 +290,19 @@ class PaperClusterer:
             dict: 包含聚类结果的字典
         """
         try:
-            # 提取文本数据(标题 + 摘要)
-            texts = []
-            paper_ids = []
-            titles = []
-            
-            for paper in papers_data:
-                combined_text = f"{paper.get('title', '')} {paper.get('abstract', '')}"
-                texts.append(combined_text)
-                paper_ids.append(paper.get('paper_id'))
-                titles.append(paper.get('title'))
-            
-            # 转换文本为TF-IDF特征
-            logger.info(f"Converting {len(texts)} papers to TF-IDF features")
-            features = self.vectorizer.fit_transform(texts)
-            
-            # 执行聚类
-            logger.info("Performing clustering")
-            cluster_labels = self.kmeans.fit_predict(features)
-            
-            # 降维用于可视化
-            logger.info("Reducing dimensions for visualization")
-            coords = self.pca.fit_transform(features.toarray())
-            
-            # 为每个簇收集论文
-            clusters = defaultdict(list)
-            for i, label in enumerate(cluster_labels):
-                clusters[int(label)].append({
-                    'paper_id': paper_ids[i],
-                    'title': titles[i],
-                    'x': float(coords[i][0]),
-                    'y': float(coords[i][1])
-                })
-            
-            # 获取每个簇的关键词
-            logger.info("Extracting key terms for each cluster")
-            cluster_terms = self._get_cluster_terms(features, cluster_labels)
-            
+            return cluster_texts(papers_data, self.config).to_dict()
+        except Exception as e:
+            logger.error(f"Error in paper clustering: {str(e)}")
             return {
-                'clusters': dict(clusters),
-                'cluster_terms': cluster_terms
+                'error': f'Error in paper clustering: {str(e)}'
             }
-            
+    
+    def process_features(self, features, paper_ids, titles, terms):
+        """对已经算好的 TF-IDF 特征进行聚类, 返回格式同 process_papers"""
+        try:
+            return cluster(features, paper_ids, titles, terms, self.config).to_dict()
         except Exception as e:
             logger.error(f"Error in paper clustering: {str(e)}")
             return {
                 'error': f'Error in paper clustering: {str(e)}'
             }
-    
-    def _get_cluster_terms(self, features, labels, top_n=5):
-        """获取每个簇的主要关键词
-        
-        Args:
-            features: TF-IDF特征矩阵
-            labels: 聚类标签
-            top_n: 每个簇返回的关键词数量
-            
-        Returns:
-            dict: 每个簇的关键词列表
-        """
-        terms = self.vectorizer.get_feature_names_out()
-        cluster_terms = {}
-        
-        for i in range(self.n_clusters):
-            # 获取该簇的所有文档
-            cluster_docs = features[labels == i]
-            if cluster_docs.shape[0] == 0:
-                continue
-                
-            # 计算该簇的平均TF-IDF值
-            centroid = cluster_docs.mean(axis=0).A1
-            # 获取最重要的词条
-            top_term_indices = centroid.argsort()[-top_n:][::-1]
-            cluster_terms[i] = [terms[idx] for idx in top_term_indices]
-            
-        return cluster_terms 
\ No newline at end of file
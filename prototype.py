@@ -1,11 +1,8 @@
 from distutils.command.build import build
-from pdf2docx import parse
-import docx
-from simplify_docx import simplify
-import json
-import spacy
+import argparse
+import threading
+import logging
 import os
-from os.path import exists
 import sqlite3
 from sqlite3 import Error
 import openpyxl
@@ -14,123 +11,192 @@ from prompt_toolkit import prompt
 from prompt_toolkit.history import FileHistory
 from prompt_toolkit.auto_suggest import AutoSuggestFromHistory
 from prompt_toolkit.completion import WordCompleter
+from ingest import IngestPipeline, IngestManifest, PIPELINE_VERSION, file_hash, load_entities, remove_artifacts
+from watcher import PapersWatcher
+from db import connect
+from migrations import migrate
+from sentiment_cache import SentimentCache, paper_key
+from feature_store import FeatureStore
+import cluster_models
+import neighbour_index
+
+logger = logging.getLogger(__name__)
+
+# Serialises ingestion runs in this process (background job, watcher, CLI)
+_ingest_lock = threading.Lock()
 
 def get_connection(db_file):
-    """ create a database connection to a SQLite database """
-    return sqlite3.connect(db_file)
+    """ create a database connection to a SQLite database (WAL mode, tuned pragmas) """
+    return connect(db_file)
+
+def make_file_dict(pdf_name, paper_name, source_path="Papers/", docs_path="Docs/", json_path="JSON/", ents_path="Ents/"):
+    """ build the file dict (paper name and pdf/docx/json/entities paths) for a PDF in the papers folder """
+    return {
+        'paper_name': paper_name,
+        'paper_pdf': os.path.join(source_path, pdf_name),
+        'paper_docx': os.path.join(docs_path, pdf_name + '.docx'),
+        'paper_json': os.path.join(json_path, pdf_name + '.json'),
+        'paper_entities': os.path.join(ents_path, pdf_name + '.json'),
+    }
 
-def initialize_database():
+def load_index(source_path="Papers/", docs_path="Docs/", json_path="JSON/", ents_path="Ents/"):
+    """@brief read index.xlsx into file dicts
+
+    Returns:
+        (list): one dict per row with paper_name and the pdf/docx/json/entities paths
+    """
     xlsx_file = Path(".", "index.xlsx")
     wb_obj = openpyxl.load_workbook(xlsx_file, data_only=True)
-    print(wb_obj.sheetnames)
+    logger.debug(f"index.xlsx sheets: {wb_obj.sheetnames}")
     index = wb_obj['Sheet']
     headers = [cell.value.strip() for cell in index[1]]
 
-    source_path = "Papers/"
-    docs_path = "Docs/"
-    json_path = "JSON/"
-    ents_path = "Ents/"
-
-    print(headers)
+    logger.debug(f"index.xlsx headers: {headers}")
     files_to_process = []
     for row in index.iter_rows(min_row=2):  # Ignore Header Row
         row_dictionary = {
             key: cell.value for key, cell in zip(headers, row)
         }
-        row_dictionary['paper_docx'] = os.path.join(docs_path, row_dictionary['paper_pdf'] + '.docx')
-        row_dictionary['paper_json'] = os.path.join(json_path, row_dictionary['paper_pdf'] + '.json')
-        row_dictionary['paper_entities'] = os.path.join(ents_path, row_dictionary['paper_pdf'] + '.json')
-        row_dictionary['paper_pdf'] = os.path.join(source_path, row_dictionary['paper_pdf'])
-        files_to_process.append(row_dictionary)
+        files_to_process.append(make_file_dict(row_dictionary['paper_pdf'], row_dictionary['paper_name'],
+                                               source_path, docs_path, json_path, ents_path))
+    return files_to_process
+
+def create_tables(cur):
+    """ create or upgrade the database schema (see migrations.py) """
+    migrate(cur.connection)
+
+def get_paper_text(cur, paper_id):
+    """ return the plain text stored for a paper at ingest time, or None """
+    cur.execute("SELECT body FROM paper_texts WHERE paper_id = ?", (paper_id,))
+    row = cur.fetchone()
+    return row[0] if row else None
+
+def initialize_database(workers=None, progress=None, commit_every=20, engine=None, paths=None, sentiment=None):
+    """@brief incrementally ingest the PDFs in Papers/ into the database
+
+    Papers whose size and mtime match the ingest manifest are skipped, changed
+    papers are re-ingested and papers removed from disk are deleted. Names come
+    from index.xlsx; PDFs missing from the index are named after their file.
+
+    Args:
+        workers (int): number of worker processes for the PDF/DOCX/NER stages, defaults to INGEST_WORKERS or the CPU count
+        progress (IngestProgress): optional progress tracker that receives per-stage counts
+        commit_every (int): number of papers written per transaction
+        engine (str): 'docx' (pdf2docx round trip) or 'pdf' (direct text extraction), defaults to INGEST_ENGINE
+        paths (list): only look at these PDF paths (as 'Papers/<name>') instead of the whole folder
+        sentiment (bool): also precompute each paper's sentiment into the sentiment cache, defaults to INGEST_SENTIMENT
+
+    Returns:
+        (list): paths of the PDFs that went through the pipeline
+    """
+    with _ingest_lock:
+        return _ingest(workers, progress, commit_every, engine, paths, sentiment)
+
+def _ingest(workers, progress, commit_every, engine, paths, sentiment):
+    source_path = "Papers/"
 
     conn = get_connection("data/test_db.sqlite")
     cur = conn.cursor()
+    create_tables(cur)
+    manifest = IngestManifest(conn)
+    known = manifest.entries()
 
-    cur.execute("""CREATE TABLE IF NOT EXISTS papers (
-        paper_id INTEGER PRIMARY KEY,
-        paper_name TEXT NOT NULL UNIQUE,
-        paper_pdf TEXT NOT NULL,
-        paper_docx TEXT NOT NULL,
-        paper_json TEXT NOT NULL,
-        paper_entities TEXT NOT NULL
-    );""")
-
-    cur.execute("""CREATE TABLE IF NOT EXISTS entities (
-        entity_id INTEGER PRIMARY KEY,
-        entity_name TEXT NOT NULL,
-        entity_type TEXT NOT NULL,
-        UNIQUE(entity_name, entity_type)
-    );""")
-
-    cur.execute("""CREATE TABLE IF NOT EXISTS papers_have_entities (
-        entity_id INTEGER,
-        paper_id INTEGER,
-        count INTEGER DEFAULT 1,
-        FOREIGN KEY(entity_id) REFERENCES entities(entity_id),
-        FOREIGN KEY(paper_id) REFERENCES papers(paper_id),
-        PRIMARY KEY(entity_id, paper_id)
-    );""")
-
-    nlp = spacy.load("en_core_web_sm")
-
+    # One stat per paper decides whether it needs any further work
+    if paths is None:
+        paths = [os.path.join(source_path, path) for path in os.listdir(source_path)]
+        gone = set(known)
+    else:
+        gone = set(paths) & set(known)
     unprocessed = []
-    processed = []
-    for path in os.listdir(source_path):
-        find_file = list(filter(lambda file: file['paper_pdf'] == os.path.join(source_path, path), files_to_process))
-        if len(find_file) == 0:
-            unprocessed.append(os.path.join(source_path, path))
-        elif os.path.isfile(os.path.join(source_path, path)):
-            file_dict = find_file[-1]
-            pdf_file = file_dict['paper_pdf']
-            docx_file = file_dict['paper_docx']
-            if not exists(docx_file):
-                # convert pdf to docx
-                parse(pdf_file, docx_file)
-            # read in a document 
-            doc = docx.Document(docx_file)
-            if not exists(file_dict['paper_json']):
-                with open(file_dict['paper_json'],'w') as outputjson:
-                    json.dump(simplify(doc,  {"special-characters-as-text":False} ),outputjson)
-            fullTextArray = []
-            for para in doc.paragraphs:
-                fullTextArray.append(para.text)
-
-            entities = {"entities":[]}        
-            if not exists(file_dict['paper_entities']):
-                full_doc = nlp(''.join(fullTextArray))
-                with open(file_dict['paper_entities'],'w') as outputents:
-                    for e in full_doc.ents:
-                        entities["entities"].append({"text": e.text, "start_char": e.start_char, "end_char": e.end_char, "label": e.label_})
-                    json.dump(entities,outputents)
-            else:
-                with open(file_dict['paper_entities'], 'r') as reading:
-                    entities = json.load(reading)
-            cur.execute("""INSERT INTO papers(paper_name,paper_pdf,paper_docx,paper_json,paper_entities)
-                VALUES(:paper_name,:paper_pdf,:paper_docx,:paper_json,:paper_entities)
-                ON CONFLICT(paper_name) DO UPDATE SET
-                    paper_pdf=:paper_pdf,
-                    paper_docx=:paper_docx,
-                    paper_json=:paper_json,
-                    paper_entities=:paper_entities
-                    RETURNING paper_id""", file_dict)
-            file_id = cur.fetchone()[0]
-            for entity in entities['entities']:
-                print(entity)
-                cur.execute("""INSERT INTO entities(entity_name, entity_type)
-                    VALUES(:text,:label)
-                    ON CONFLICT(entity_name, entity_type) DO UPDATE SET entity_name=:text
-                        RETURNING entity_id""", entity)
-                entity_id = cur.fetchone()[0]
-                cur.execute("""INSERT INTO papers_have_entities(entity_id, paper_id)
-                    VALUES(:entity_id,:paper_id)
-                    ON CONFLICT(entity_id, paper_id) DO UPDATE SET count=count+1""", {"entity_id": entity_id, "paper_id": file_id})           
-            processed.append(file_dict['paper_pdf'])
-        else:
-            unprocessed.append(os.path.join(source_path, path))
+    candidates = {}
+    for pdf_path in paths:
+        if not os.path.isfile(pdf_path):
+            continue
+        gone.discard(pdf_path)
+        if not pdf_path.lower().endswith('.pdf'):
+            unprocessed.append(pdf_path)
+            continue
+        stat_result = os.stat(pdf_path)
+        if not IngestManifest.is_unchanged(known.get(pdf_path), stat_result):
+            candidates[pdf_path] = stat_result
+
+    removed_papers = 0
+    for pdf_path in gone:
+        removed = manifest.remove(pdf_path)
+        if removed:
+            remove_artifacts(removed)
+            removed_papers += 1
+        logger.info(f"Removed {pdf_path}")
+
+    to_ingest = []
+    hashes = {}
+    if candidates:
+        files_to_process = {file['paper_pdf']: file for file in load_index(source_path)}
+        for pdf_path, stat_result in candidates.items():
+            pdf_name = os.path.basename(pdf_path)
+            file_dict = files_to_process.get(pdf_path) or make_file_dict(pdf_name, os.path.splitext(pdf_name)[0], source_path)
+            entry = known.get(pdf_path)
+            hashes[pdf_path] = file_hash(pdf_path)
+            if entry is not None and entry['content_hash'] == hashes[pdf_path] and entry['pipeline_version'] == PIPELINE_VERSION:
+                manifest.touch(pdf_path, stat_result)
+                continue
+            if entry is not None and entry['content_hash'] != hashes[pdf_path]:
+                # The PDF changed, every cached artifact is stale
+                remove_artifacts(file_dict)
+            elif entry is not None:
+                # Only the NER stage changed since this paper was ingested
+                remove_artifacts(file_dict, keys=('paper_entities',))
+            to_ingest.append(file_dict)
+
+    written = []
+
+    def write_paper(file_dict, entities, text, sentiment):
+        cur.execute("""INSERT INTO papers(paper_name,paper_pdf,paper_docx,paper_json,paper_entities)
+            VALUES(:paper_name,:paper_pdf,:paper_docx,:paper_json,:paper_entities)
+            ON CONFLICT(paper_name) DO UPDATE SET
+                paper_pdf=:paper_pdf,
+                paper_docx=:paper_docx,
+                paper_json=:paper_json,
+                paper_entities=:paper_entities
+                RETURNING paper_id""", file_dict)
+        file_id = cur.fetchone()[0]
+        load_entities(cur, file_id, entities)
+        cur.execute("""INSERT INTO paper_texts(paper_id, body) VALUES(?, ?)
+            ON CONFLICT(paper_id) DO UPDATE SET body=excluded.body""", (file_id, text))
+        if sentiment is not None:
+            SentimentCache.store(conn, sentiment['key'] or paper_key(file_id), sentiment['content_hash'], sentiment['results'])
+        manifest.record(file_dict['paper_pdf'], file_id, hashes[file_dict['paper_pdf']], candidates[file_dict['paper_pdf']])
+        written.append(file_id)
+        # One transaction per batch of papers
+        if len(written) % commit_every == 0:
+            conn.commit()
+
+    # CPU-heavy stages run in worker processes, SQLite writes stay in this process
+    pipeline = IngestPipeline(workers=workers, progress=progress, engine=engine, sentiment=sentiment)
+    processed = [file_dict['paper_pdf'] for file_dict in pipeline.run(to_ingest, write_paper)]
     conn.commit()
-    print(files_to_process)
-    print(unprocessed)
-    print(processed)
+    if processed or removed_papers:
+        # The TF-IDF features of the corpus only change here, refit them once per run
+        try:
+            FeatureStore().rebuild(conn)
+        except Exception as e:
+            logger.error(f"Rebuilding the feature store failed: {str(e)}")
+    if written:
+        # New papers join the nearest existing cluster, the model is refit only once it drifted
+        try:
+            cluster_models.assign(conn, 'local', written)
+        except Exception as e:
+            logger.error(f"Assigning clusters failed: {str(e)}")
+    # Builds the similar-papers index on the first run, afterwards only the new papers are scored
+    try:
+        neighbour_index.insert(conn, 'local', written)
+    except Exception as e:
+        logger.error(f"Updating the neighbour index failed: {str(e)}")
+    conn.close()
+    if unprocessed:
+        logger.warning(f"Skipped {len(unprocessed)} files that are not PDFs: {unprocessed}")
+    logger.info(f"Ingested {len(processed)} papers: {processed}")
+    return processed
 
 def build_and_cases(query_string_array, query_parts, entry_index):
     """@brief processes user's query string to build the SQL where clause
@@ -171,6 +237,14 @@ def build_and_cases(query_string_array, query_parts, entry_index):
     # Return the index of the current word in the query string array after processing
     return current_index
 
+# Columns of a 'get papers' result, named so the positions do not move when a
+# table gains a column: the paper (0-5), then for 'that mention' queries the
+# entity link (6-8) and the entity's name (9) and type (10)
+PAPER_COLUMNS = ['papers.paper_id', 'papers.paper_name', 'papers.paper_pdf', 'papers.paper_docx',
+                 'papers.paper_json', 'papers.paper_entities']
+MENTION_COLUMNS = ['papers_have_entities.entity_id', 'papers_have_entities.paper_id', 'papers_have_entities.count',
+                   'entities.entity_name', 'entities.entity_type']
+
 def build_query(input_values):
     """@brief processes user's query string to build the SQL query
 
@@ -203,10 +277,10 @@ def build_query(input_values):
         elif current_index < len(query_string_array) and query_string_array[current_index] == 'all':
             current_index+=1
 
-        # Check if the query word after 'one' or 'all' is 'papers' and if so, select all columns from the papers table
+        # Check if the query word after 'one' or 'all' is 'papers' and if so, select the columns of the papers table
         if current_index < len(query_string_array) and query_string_array[current_index] == 'papers':
             current_index+=1
-            query_parts['select'].append('*')
+            query_parts['select'].extend(PAPER_COLUMNS)
             query_parts['from'].append('papers')
         # Check if the query word after 'papers' is 'that' and if so, start building the where clause
         if current_index < len(query_string_array) and query_string_array[current_index] == 'that':
@@ -217,6 +291,7 @@ def build_query(input_values):
                 # Add the inner join statements for the paper table ,papers_have_entities table and entities table
                 query_parts['from'].append('INNER JOIN papers_have_entities ON papers_have_entities.paper_id = papers.paper_id')
                 query_parts['from'].append('INNER JOIN entities ON papers_have_entities.entity_id = entities.entity_id')
+                query_parts['select'].extend(MENTION_COLUMNS)
                 # call the build_and_cases function repeatedly to build the where clause
                 while current_index < len(query_string_array):
                     current_index = build_and_cases(query_string_array, query_parts, current_index)
@@ -229,14 +304,31 @@ def build_query(input_values):
                             current_index += 1
                             query_parts['where'].append(" OR ")
             # Generate the SQL query string based on the different parts of the query parts dict
-            query_string = "SELECT " + ' '.join(query_parts['select']) + " FROM " + ' '.join(query_parts['from']) + " WHERE " + ' '.join(query_parts['where']) + ' ' + ' '.join(query_parts['limit'])
+            query_string = "SELECT " + ', '.join(query_parts['select']) + " FROM " + ' '.join(query_parts['from']) + " WHERE " + ' '.join(query_parts['where']) + ' ' + ' '.join(query_parts['limit'])
      
         else:
             # If the query string does not contain the word 'that' then the query do not have a where clause
-            query_string = "SELECT " + ' '.join(query_parts['select']) + " FROM " + ' '.join(query_parts['from']) + ' '.join(query_parts['limit'])
+            query_string = "SELECT " + ', '.join(query_parts['select']) + " FROM " + ' '.join(query_parts['from']) + ' '.join(query_parts['limit'])
     # Return the generated SQL query
     return query_string
 
+def run_daemon(interval=2.0, debounce=5.0, workers=None, engine=None, sentiment=None):
+    """@brief watch Papers/ and ingest new or changed PDFs until interrupted
+
+    Every PDF is committed in its own small transaction so readers of the
+    database never wait long. Queue depth and per-file latency are logged
+    whenever a batch has been ingested.
+    """
+    def ingest_batch(paths):
+        return initialize_database(workers=workers, commit_every=1, engine=engine, paths=paths, sentiment=sentiment)
+
+    watcher = PapersWatcher(ingest_batch, source_path="Papers/", interval=interval, debounce=debounce)
+    watcher.on_batch = lambda stats: logger.info(f"Ingest batch: {stats}")
+    try:
+        watcher.run_forever()
+    except KeyboardInterrupt:
+        watcher.stop()
+
 def run_cli():
     # Create a WordCompleter object to suggest words to the user
     QuestionWorkCompleter = WordCompleter(['get', 'one', 'all', 'papers', 'that', 'mention', 'person', 'organisation', 'work', 'and', 'or'],
@@ -260,5 +352,18 @@ def run_cli():
             print(result)
 
 if __name__ == '__main__':
-    initialize_database()
-    run_cli()
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--workers', type=int, default=None, help='number of ingestion worker processes')
+    parser.add_argument('--engine', choices=['docx', 'pdf'], default=None, help='text extraction engine')
+    parser.add_argument('--sentiment', action='store_true', default=None, help='precompute paper sentiment into the sentiment cache')
+    parser.add_argument('--watch', action='store_true', help='keep watching Papers/ and ingest new or changed PDFs')
+    parser.add_argument('--interval', type=float, default=2.0, help='seconds between scans of Papers/ in --watch mode')
+    parser.add_argument('--debounce', type=float, default=5.0, help='seconds a file must stay unchanged before it is ingested')
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO)
+    if args.watch:
+        run_daemon(interval=args.interval, debounce=args.debounce, workers=args.workers, engine=args.engine,
+                   sentiment=args.sentiment)
+    else:
+        initialize_database(workers=args.workers, engine=args.engine, sentiment=args.sentiment)
+        run_cli()
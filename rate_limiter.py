@@ -0,0 +1,164 @@
+from collections import deque
+import threading
+import asyncio
+import sqlite3
+import logging
+import time
+import os
+
+logger = logging.getLogger(__name__)
+
+# arXiv asks for at most 3 requests per second
+ARXIV_RATE = float(os.environ.get('ARXIV_RATE', 3.0))
+# Requests that may go out back to back after an idle period
+ARXIV_BURST = float(os.environ.get('ARXIV_BURST', 1))
+# SQLite file shared by every process that calls arXiv, unset to limit each process on its own
+ARXIV_RATE_LIMIT_DB = os.environ.get('ARXIV_RATE_LIMIT_DB')
+
+# Recent waits kept for the percentiles in stats()
+WAIT_HISTORY = 500
+
+
+class TokenBucket:
+    """A token bucket shared by the threads of one process
+
+    Tokens accrue at ``rate`` per second up to ``burst``; every request takes
+    one. A request that finds no token reserves the next one (the balance
+    goes negative) and sleeps until it is due outside the lock, so waiting
+    callers are served in arrival order and never all pass at once.
+    """
+
+    def __init__(self, rate=ARXIV_RATE, burst=ARXIV_BURST):
+        self.rate = rate
+        self.burst = max(burst, 1)
+        self.lock = threading.Lock()
+        self.tokens = self.burst
+        self.updated = time.monotonic()
+        self.waits = deque(maxlen=WAIT_HISTORY)
+        self.counters = {'acquired': 0, 'waited': 0, 'wait_seconds': 0.0, 'max_wait_seconds': 0.0}
+
+    def _reserve(self):
+        """Take a token and return the seconds until it may be used"""
+        with self.lock:
+            now = time.monotonic()
+            self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+            self.tokens -= 1
+            return max(0.0, -self.tokens / self.rate)
+
+    def acquire(self):
+        """@brief block until the caller may send one request
+
+        Returns:
+            (float): seconds the caller waited
+        """
+        wait = self._reserve()
+        if wait > 0:
+            time.sleep(wait)
+        self._record(wait)
+        return wait
+
+    async def acquire_async(self):
+        """@brief acquire() for coroutines, waits on the event loop instead of blocking its thread
+
+        Returns:
+            (float): seconds the caller waited
+        """
+        # A shared bucket may wait for the SQLite lock, keep that off the loop too
+        wait = await asyncio.get_running_loop().run_in_executor(None, self._reserve)
+        if wait > 0:
+            await asyncio.sleep(wait)
+        self._record(wait)
+        return wait
+
+    def _record(self, wait):
+        with self.lock:
+            self.counters['acquired'] += 1
+            if wait > 0:
+                self.counters['waited'] += 1
+                self.counters['wait_seconds'] += wait
+                self.counters['max_wait_seconds'] = max(self.counters['max_wait_seconds'], wait)
+            self.waits.append(wait)
+
+    def stats(self):
+        """Return request and queue-wait counters for monitoring"""
+        with self.lock:
+            counters = dict(self.counters)
+            waits = sorted(self.waits)
+        return {
+            'rate': self.rate,
+            'burst': self.burst,
+            'shared': False,
+            **counters,
+            'mean_wait_seconds': counters['wait_seconds'] / counters['acquired'] if counters['acquired'] else None,
+            'p50_wait_seconds': waits[len(waits) // 2] if waits else None,
+            'p95_wait_seconds': waits[int(len(waits) * 0.95)] if waits else None,
+        }
+
+
+class SQLiteTokenBucket(TokenBucket):
+    """A token bucket whose balance lives in a SQLite file, shared by every process using that file
+
+    Each reservation is one BEGIN IMMEDIATE transaction, so processes (e.g.
+    several app workers) take tokens one at a time from the same balance.
+    The file is separate from the application database so that a long
+    ingest transaction never holds up an arXiv request. Wall-clock time is
+    used, as monotonic clocks are not comparable across processes.
+    """
+
+    def __init__(self, path=ARXIV_RATE_LIMIT_DB, name='arxiv', rate=ARXIV_RATE, burst=ARXIV_BURST):
+        super().__init__(rate, burst)
+        self.path = path
+        self.name = name
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self.conn = sqlite3.connect(path, timeout=30.0, isolation_level=None, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("""CREATE TABLE IF NOT EXISTS token_buckets (
+            name TEXT PRIMARY KEY,
+            tokens REAL NOT NULL,
+            updated REAL NOT NULL
+        )""")
+
+    def _reserve(self):
+        with self.lock:
+            self.conn.execute("BEGIN IMMEDIATE")
+            try:
+                now = time.time()
+                row = self.conn.execute("SELECT tokens, updated FROM token_buckets WHERE name = ?",
+                                        (self.name,)).fetchone()
+                tokens = self.burst if row is None else min(self.burst, row[0] + max(0.0, now - row[1]) * self.rate)
+                tokens -= 1
+                self.conn.execute("""INSERT INTO token_buckets(name, tokens, updated) VALUES(?, ?, ?)
+                    ON CONFLICT(name) DO UPDATE SET tokens = excluded.tokens, updated = excluded.updated""",
+                                  (self.name, tokens, now))
+                self.conn.execute("COMMIT")
+            except Exception:
+                self.conn.execute("ROLLBACK")
+                raise
+            return max(0.0, -tokens / self.rate)
+
+    def stats(self):
+        return {**super().stats(), 'shared': True, 'path': self.path}
+
+
+_arxiv_limiter = None
+_arxiv_limiter_lock = threading.Lock()
+
+
+def arxiv_limiter():
+    """@brief the limiter every ArxivClient of this process shares
+
+    A SQLiteTokenBucket on ARXIV_RATE_LIMIT_DB when that is set, so separate
+    worker processes stay within the limit together; otherwise a TokenBucket.
+    """
+    global _arxiv_limiter
+    if _arxiv_limiter is None:
+        with _arxiv_limiter_lock:
+            if _arxiv_limiter is None:
+                if ARXIV_RATE_LIMIT_DB:
+                    _arxiv_limiter = SQLiteTokenBucket(ARXIV_RATE_LIMIT_DB)
+                else:
+                    _arxiv_limiter = TokenBucket()
+    return _arxiv_limiter
@@ -1,15 +1,53 @@
-import nltk
-from nltk.sentiment import SentimentIntensityAnalyzer
-import spacy
 import json
 import logging
 
+import models
+from vader_fast import FastVader
+
 logger = logging.getLogger(__name__)
 
+def document_segments(doc_path):
+    """Read the text segments of a simplified JSON document
+
+    Args:
+        doc_path (str): Path to JSON format document
+
+    Returns:
+        list: Text values of every TYPE 'text' node, in document order
+    """
+    with open(doc_path, 'r', encoding='utf-8') as f:
+        doc_data = json.load(f)
+
+    texts = []
+    def extract_text(obj):
+        if isinstance(obj, dict):
+            for key, value in obj.items():
+                if key == 'TYPE' and value == 'text':
+                    if 'VALUE' in obj:
+                        texts.append(obj['VALUE'])
+                elif isinstance(value, (dict, list)):
+                    extract_text(value)
+        elif isinstance(obj, list):
+            for item in obj:
+                extract_text(item)
+
+    extract_text(doc_data)
+    return texts
+
 class SentimentAnalyzer:
+    # Results are cached by sentiment_cache.py: bump its ANALYZER_VERSION
+    # whenever the output of this class changes
+
     def __init__(self):
-        self.nlp = spacy.load("en_core_web_sm")
-        self.sia = SentimentIntensityAnalyzer()
+        # Models come from the shared registry; spaCy is only loaded once a
+        # text needs sentence splitting
+        self.sia = models.vader()
+        # Same scores as self.sia.polarity_scores, see vader_fast.py
+        self.scorer = FastVader(self.sia)
+
+    @property
+    def nlp(self):
+        return models.nlp('sentences')
     
     def analyze_text(self, text):
         """Analyze sentiment of text
@@ -20,37 +58,93 @@ class SentimentAnalyzer:
         Returns:
             dict: Dictionary containing sentiment analysis results
         """
-        logger.info(f"Starting text analysis, length: {len(text)}")
-        logger.info(f"First 500 characters: {text[:500]}")
-        
-        doc = self.nlp(text)
+        logger.debug(f"Starting text analysis, length: {len(text)}")
+        return self._analyze(text, self.nlp(text))
+
+    def analyze_many(self, texts, overall_only=False, batch_size=32):
+        """Analyze sentiment of many texts in one pass
+
+        Args:
+            texts (list): Texts to analyze
+            overall_only (bool): Only score every text as a whole. This skips
+                spaCy entirely and sets 'sentence_sentiments' to None
+            batch_size (int): Number of texts spaCy processes per batch
+
+        Returns:
+            list: One result per text, in order, shaped like analyze_text's
+        """
+        logger.debug(f"Analyzing {len(texts)} texts, overall_only={overall_only}")
+        if overall_only:
+            return [{
+                'overall_sentiment': self.overall_sentiment(text),
+                'sentence_sentiments': None
+            } for text in texts]
+        docs = self.nlp.pipe(texts, batch_size=batch_size)
+        return [self._analyze(text, doc) for text, doc in zip(texts, docs)]
+
+    def overall_sentiment(self, text):
+        """Score a text as a whole
+
+        Args:
+            text (str): Text to analyze
+
+        Returns:
+            dict: 'polarity' and 'subjectivity' of the text
+        """
+        return self._summary(self.scorer.polarity_scores(text))
+
+    def split_sentences(self, text):
+        """Split a text into sentences the way analyze_text does
+
+        Args:
+            text (str): Text to split
+
+        Returns:
+            list: The stripped sentences, in order
+        """
+        return [sent.text.strip() for sent in self.nlp(text).sents]
+
+    def score_sentences(self, sentences):
+        """Score some sentences of a split text
+
+        Args:
+            sentences (list): Sentences from split_sentences
+
+        Returns:
+            list: One 'sentence_sentiments' entry of analyze_text per sentence
+        """
+        return [{'text': sentence, **self._summary(self.scorer.polarity_scores(sentence))}
+                for sentence in sentences]
+
+    def combined_sentiment(self, sentences, text):
+        """Score a whole text from its sentences
+
+        Args:
+            sentences (list): All sentences of text, from split_sentences
+            text (str): The text itself
+
+        Returns:
+            dict: The 'overall_sentiment' analyze_text gives the text
+        """
+        return self._summary(self.scorer.joined_scores(sentences, text))
+
+    @staticmethod
+    def _summary(scores):
+        return {
+            'polarity': scores['compound'],
+            'subjectivity': (scores['pos'] + scores['neg']) / 2
+        }
+
+    def _analyze(self, text, doc):
         sentences = [sent.text.strip() for sent in doc.sents]
-        logger.info(f"Sentence splitting result: {len(sentences)} sentences")
-        for i, sent in enumerate(sentences[:3]):
-            logger.info(f"Example sentence {i+1}: {sent}")
-        
-        overall_scores = self.sia.polarity_scores(text)
-        logger.info(f"Overall sentiment scores: {overall_scores}")
-        
-        sentence_sentiments = []
-        for sentence in sentences:
-            scores = self.sia.polarity_scores(sentence)
-            sentence_sentiments.append({
-                'text': sentence,
-                'polarity': scores['compound'],
-                'subjectivity': (scores['pos'] + scores['neg']) / 2
-            })
-            
-        logger.info(f"Sentiment scores for first 3 sentences:")
-        for i, sent in enumerate(sentence_sentiments[:3]):
-            logger.info(f"Sentence {i+1} - Polarity: {sent['polarity']}, Subjectivity: {sent['subjectivity']}")
-        
+        logger.debug(f"Sentence splitting result: {len(sentences)} sentences")
+
+        # Sentences and the whole text are scored from one tokenization
+        sentence_scores, text_scores = self.scorer.score_document(sentences, text)
         return {
-            'overall_sentiment': {
-                'polarity': overall_scores['compound'],
-                'subjectivity': (overall_scores['pos'] + overall_scores['neg']) / 2
-            },
-            'sentence_sentiments': sentence_sentiments
+            'overall_sentiment': self._summary(text_scores),
+            'sentence_sentiments': [{'text': sentence, **self._summary(scores)}
+                                    for sentence, scores in zip(sentences, sentence_scores)]
         }
     
     def analyze_document(self, doc_path):
@@ -63,28 +157,12 @@ class SentimentAnalyzer:
             dict: Dictionary containing document sentiment analysis results
         """
         try:
-            logger.info(f"Starting document analysis: {doc_path}")
-            with open(doc_path, 'r', encoding='utf-8') as f:
-                doc_data = json.load(f)
-            
-            texts = []
-            def extract_text(obj):
-                if isinstance(obj, dict):
-                    for key, value in obj.items():
-                        if key == 'TYPE' and value == 'text':
-                            if 'VALUE' in obj:
-                                texts.append(obj['VALUE'])
-                        elif isinstance(value, (dict, list)):
-                            extract_text(value)
-                elif isinstance(obj, list):
-                    for item in obj:
-                        extract_text(item)
-            
-            extract_text(doc_data)
-            logger.info(f"Extracted {len(texts)} text segments from document")
+            logger.debug(f"Starting document analysis: {doc_path}")
+            texts = document_segments(doc_path)
+            logger.debug(f"Extracted {len(texts)} text segments from document")
             
             full_text = ' '.join(texts)
-            logger.info(f"Combined text length: {len(full_text)}")
+            logger.debug(f"Combined text length: {len(full_text)}")
             
             return self.analyze_text(full_text)
             
@@ -94,7 +172,8 @@ class SentimentAnalyzer:
                 'error': f'Error analyzing document: {str(e)}'
             }
     
-    def get_sentiment_label(self, polarity):
+    @staticmethod
+    def get_sentiment_label(polarity):
         """Get sentiment label based on polarity
         
         Args:
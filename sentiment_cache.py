@@ -0,0 +1,291 @@
+from collections import OrderedDict
+import threading
+import hashlib
+import logging
+import json
+import os
+
+import db
+from sentiment_analyzer import document_segments
+
+logger = logging.getLogger(__name__)
+
+# Version of SentimentAnalyzer's output. Bump it whenever the analysis
+# changes so every cached result is recomputed on its next request.
+ANALYZER_VERSION = 2
+
+# Number of results kept in memory in front of the sentiment_cache table
+MEMORY_ENTRIES = int(os.environ.get('SENTIMENT_CACHE_SIZE', 128))
+# Sentences scored per analyzer call while a result is streamed
+STREAM_BATCH = int(os.environ.get('SENTIMENT_STREAM_BATCH', 64))
+
+
+def document_key(doc_path):
+    return 'doc:' + os.path.abspath(doc_path)
+
+
+def paper_key(paper_id):
+    return f'paper:{paper_id}'
+
+
+def arxiv_key(arxiv_id):
+    return f'arxiv:{arxiv_id}'
+
+
+def text_hash(text):
+    return hashlib.sha256(text.encode('utf-8')).hexdigest()
+
+
+def document_hash(doc_path, chunk_size=1 << 20):
+    digest = hashlib.sha256()
+    with open(doc_path, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def _usable(results, overall_only):
+    """Whether a cached result can answer a lookup of the given mode"""
+    return overall_only or results.get('sentence_sentiments') is not None
+
+
+class SentimentCache:
+    """Sentiment results cached in SQLite with an LRU in memory in front
+
+    Entries are keyed by document path, paper id or arXiv id and are only valid for
+    the content hash and ANALYZER_VERSION they were computed with, so an
+    edited JSON file or a new analyzer version recomputes them on their next
+    request. The memory front compares a cheap fingerprint (size/mtime of a
+    document, the hash of a text) before trusting an entry.
+    """
+
+    def __init__(self, analyzer, max_entries=MEMORY_ENTRIES, pool=None):
+        """
+        Args:
+            analyzer (callable): returns the SentimentAnalyzer, only called on a miss
+            max_entries (int): size of the in-memory LRU
+            pool (db.ConnectionPool): used when no connection is passed, defaults to db.pool
+        """
+        self.analyzer = analyzer
+        self.max_entries = max_entries
+        self.pool = pool or db.pool
+        self.memory = OrderedDict()
+        self.lock = threading.Lock()
+        self.counters = {'memory_hits': 0, 'db_hits': 0, 'misses': 0}
+
+    def document(self, doc_path, conn=None, compute=True):
+        """@brief sentiment of a simplified JSON document, see SentimentAnalyzer.analyze_document
+
+        Args:
+            doc_path (str): path of the JSON document
+            conn (sqlite3.Connection): database connection, a pooled one when None
+            compute (bool): analyze the document on a miss; when False a miss returns None
+
+        Returns:
+            (dict): the analysis results (a copy the caller may modify)
+        """
+        try:
+            stat_result = os.stat(doc_path)
+        except OSError as e:
+            return {'error': f'Error analyzing document: {str(e)}'}
+        fingerprint = (stat_result.st_size, stat_result.st_mtime_ns)
+        return self._get(document_key(doc_path), fingerprint, lambda: document_hash(doc_path),
+                         (lambda: self.analyzer().analyze_document(doc_path)) if compute else None, conn)
+
+    def text(self, key, text, conn=None, compute=True):
+        """@brief sentiment of a text, see SentimentAnalyzer.analyze_text
+
+        Args:
+            key (str): cache key of the text, paper_key() or arxiv_key()
+            text (str): the text itself
+            conn (sqlite3.Connection): database connection, a pooled one when None
+            compute (bool): analyze the text on a miss; when False a miss returns None
+
+        Returns:
+            (dict): the analysis results (a copy the caller may modify)
+        """
+        content_hash = text_hash(text)
+        return self._get(key, content_hash, lambda: content_hash,
+                         (lambda: self.analyzer().analyze_text(text)) if compute else None, conn)
+
+    def document_stream(self, doc_path, conn, batch_size=STREAM_BATCH):
+        """@brief analyze a document a batch of sentences at a time, see _stream
+
+        Raises:
+            OSError, ValueError: the document cannot be read
+        """
+        stat_result = os.stat(doc_path)
+        text = ' '.join(document_segments(doc_path))
+        return self._stream(document_key(doc_path), (stat_result.st_size, stat_result.st_mtime_ns),
+                            document_hash(doc_path), text, conn, batch_size)
+
+    def text_stream(self, key, text, conn, batch_size=STREAM_BATCH):
+        """@brief analyze a text a batch of sentences at a time, see _stream"""
+        content_hash = text_hash(text)
+        return self._stream(key, content_hash, content_hash, text, conn, batch_size)
+
+    def _stream(self, key, fingerprint, content_hash, text, conn, batch_size):
+        """@brief the analysis of a text as it is computed, cached once it is complete
+
+        The text is split into sentences once, exactly as analyze_text splits
+        it, and the sentences are scored batch_size at a time, so a caller can
+        pass on the first sentences before the rest is done. The full result
+        equals analyze_text's and is stored like any other miss.
+
+        Yields:
+            (tuple): ('sentence', entry) per sentence in order, then ('overall', overall_sentiment)
+        """
+        analyzer = self.analyzer()
+        sentences = analyzer.split_sentences(text)
+        entries = []
+        for start in range(0, len(sentences), batch_size):
+            for entry in analyzer.score_sentences(sentences[start:start + batch_size]):
+                entries.append(entry)
+                yield 'sentence', entry
+        results = {
+            'overall_sentiment': analyzer.combined_sentiment(sentences, text),
+            'sentence_sentiments': entries
+        }
+        self.store(conn, key, content_hash, results)
+        conn.commit()
+        with self.lock:
+            self.counters['misses'] += 1
+            self._remember(key, fingerprint, results)
+        yield 'overall', dict(results['overall_sentiment'])
+
+    def texts(self, items, overall_only=False, conn=None):
+        """@brief sentiment of many texts, the misses are analyzed in one analyze_many() call
+
+        A cached full result also answers an overall_only lookup; an
+        overall_only result (sentence_sentiments None) never answers a full one.
+
+        Args:
+            items (list): (cache key, text) pairs
+            overall_only (bool): see SentimentAnalyzer.analyze_many
+            conn (sqlite3.Connection): database connection, a pooled one when None
+
+        Returns:
+            (list): one result per item, in order (copies the caller may modify)
+        """
+        if conn is None:
+            with self.pool.connection() as pooled_conn:
+                return self.texts(items, overall_only, pooled_conn)
+
+        hashes = [text_hash(text) for _, text in items]
+        results = [None] * len(items)
+        pending = []
+        with self.lock:
+            for index, (key, _) in enumerate(items):
+                entry = self.memory.get(key)
+                if entry is not None and entry[0] == hashes[index] and _usable(entry[1], overall_only):
+                    self.memory.move_to_end(key)
+                    self.counters['memory_hits'] += 1
+                    results[index] = dict(entry[1])
+                else:
+                    pending.append(index)
+        if not pending:
+            return results
+
+        keys = [items[index][0] for index in pending]
+        placeholders = ','.join('?' * len(keys))
+        stored = {row[0]: row[1:] for row in conn.execute(f"""SELECT cache_key, content_hash, analyzer_version, results
+            FROM sentiment_cache WHERE cache_key IN ({placeholders})""", keys)}
+        found = {}
+        misses = []
+        for index in pending:
+            row = stored.get(items[index][0])
+            if row is not None and row[0] == hashes[index] and row[1] == ANALYZER_VERSION:
+                cached = json.loads(row[2])
+                if _usable(cached, overall_only):
+                    found[index] = cached
+                    continue
+            misses.append(index)
+
+        if misses:
+            computed = self.analyzer().analyze_many([items[index][1] for index in misses], overall_only=overall_only)
+            for index, result in zip(misses, computed):
+                if 'error' in result:
+                    # Like _get, a failure is returned but not cached
+                    results[index] = result
+                    continue
+                found[index] = result
+                self.store(conn, items[index][0], hashes[index], result)
+            conn.commit()
+
+        with self.lock:
+            self.counters['db_hits'] += len(pending) - len(misses)
+            self.counters['misses'] += len(misses)
+            for index, result in found.items():
+                self._remember(items[index][0], hashes[index], result)
+                results[index] = dict(result)
+        return results
+
+    def _remember(self, key, fingerprint, results):
+        self.memory[key] = (fingerprint, results)
+        self.memory.move_to_end(key)
+        while len(self.memory) > self.max_entries:
+            self.memory.popitem(last=False)
+
+    def _get(self, key, fingerprint, hash_content, compute, conn):
+        with self.lock:
+            entry = self.memory.get(key)
+            if entry is not None and entry[0] == fingerprint and _usable(entry[1], False):
+                self.memory.move_to_end(key)
+                self.counters['memory_hits'] += 1
+                return dict(entry[1])
+
+        if conn is None:
+            with self.pool.connection() as pooled_conn:
+                return self._get(key, fingerprint, hash_content, compute, pooled_conn)
+
+        content_hash = hash_content()
+        row = conn.execute("""SELECT content_hash, analyzer_version, results FROM sentiment_cache
+            WHERE cache_key = ?""", (key,)).fetchone()
+        results = json.loads(row[2]) if row is not None and row[0] == content_hash and row[1] == ANALYZER_VERSION else None
+        if results is not None and _usable(results, False):
+            counter = 'db_hits'
+        elif compute is None:
+            with self.lock:
+                self.counters['misses'] += 1
+            return None
+        else:
+            results = compute()
+            counter = 'misses'
+            if 'error' in results:
+                with self.lock:
+                    self.counters[counter] += 1
+                return results
+            self.store(conn, key, content_hash, results)
+            conn.commit()
+
+        with self.lock:
+            self.counters[counter] += 1
+            self._remember(key, fingerprint, results)
+        return dict(results)
+
+    @staticmethod
+    def store(conn, key, content_hash, results):
+        """Write one result to the sentiment_cache table, the caller commits"""
+        conn.execute("""INSERT INTO sentiment_cache(cache_key, content_hash, analyzer_version, results)
+            VALUES(?, ?, ?, ?)
+            ON CONFLICT(cache_key) DO UPDATE SET
+                content_hash=excluded.content_hash,
+                analyzer_version=excluded.analyzer_version,
+                results=excluded.results""",
+            (key, content_hash, ANALYZER_VERSION, json.dumps(results)))
+
+    def stats(self):
+        """Return hit/miss counters and hit ratios for monitoring"""
+        with self.lock:
+            counters = dict(self.counters)
+            entries = len(self.memory)
+        lookups = sum(counters.values())
+        return {
+            **counters,
+            'lookups': lookups,
+            'hit_ratio': (counters['memory_hits'] + counters['db_hits']) / lookups if lookups else None,
+            'memory_hit_ratio': counters['memory_hits'] / lookups if lookups else None,
+            'memory_entries': entries,
+            'memory_capacity': self.max_entries,
+            'analyzer_version': ANALYZER_VERSION,
+        }
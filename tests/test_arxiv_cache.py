@@ -0,0 +1,130 @@
+"""ArxivCache in front of ArxivClient, against the local fake arXiv server
+
+Checks that repeated and equivalent queries are answered from the cache,
+that expired entries are served stale while one background request
+refreshes them, that a failing API falls back to the expired entry, that
+errors are never cached and that the table stays within its size.
+"""
+import time
+
+import pytest
+
+import db
+from arxiv_cache import ArxivCache
+from arxiv_client import ArxivClient
+from benchmarks.fake_arxiv import FakeArxivServer
+from migrations import migrate
+from rate_limiter import TokenBucket
+
+TTL = 0.3
+STALE = 1.0
+
+
+@pytest.fixture
+def server():
+    with FakeArxivServer() as server:
+        yield server
+
+
+@pytest.fixture
+def cache(tmp_path):
+    db_file = str(tmp_path / 'cache.sqlite')
+    conn = db.connect(db_file)
+    migrate(conn)
+    conn.close()
+    return ArxivCache(ttls={'search': TTL, 'paper': 60}, stale_seconds=STALE, max_entries=5,
+                      pool=db.ConnectionPool(db_file))
+
+
+@pytest.fixture
+def client(server, cache):
+    client = ArxivClient(base_url=server.base_url, cache=cache, limiter=TokenBucket(rate=1000, burst=100))
+    # A failing call should fail right away rather than after backoff
+    client.async_client.retries = 0
+    yield client
+    client.runner.run(client.async_client.close())
+
+
+def wait_for_refresh(cache, timeout=5.0):
+    deadline = time.time() + timeout
+    while cache.stats()['refreshing'] and time.time() < deadline:
+        time.sleep(0.02)
+
+
+def test_equivalent_query_is_a_hit(client, server):
+    first = client.search_papers('graph learning', 0, 20)
+    assert len(server.requests) == 1 and len(first['papers']) == 20
+    assert client.search_papers('  Graph   LEARNING ', 0, 20) == first
+    assert len(server.requests) == 1
+
+
+def test_hits_are_independent_copies(client):
+    client.search_papers('graph learning', 0, 20)['papers'].clear()
+    assert len(client.search_papers('graph learning', 0, 20)['papers']) == 20
+
+
+def test_other_page_is_a_miss(client, server):
+    client.search_papers('graph learning', 0, 20)
+    client.search_papers('graph learning', 20, 20)
+    assert len(server.requests) == 2
+
+
+def test_paper_lookup_is_cached(client, server):
+    paper = client.get_paper_by_id('2401.00007')
+    assert paper['arxiv_id'].startswith('2401.00007')
+    assert client.get_paper_by_id('2401.00007') == paper
+    assert len(server.requests) == 1
+
+
+def test_expired_entry_is_served_stale_and_refreshed_once(client, server, cache):
+    first = client.search_papers('graph learning', 0, 20)
+    time.sleep(TTL + 0.1)
+    assert client.search_papers('graph learning', 0, 20) == first
+    assert client.search_papers('graph learning', 0, 20) == first
+    wait_for_refresh(cache)
+    stats = cache.stats()
+    assert stats['stale_hits'] >= 1 and stats['revalidations'] == 1
+    assert len(server.requests) == 2
+    # The refreshed entry is fresh again
+    client.search_papers('graph learning', 0, 20)
+    assert len(server.requests) == 2
+
+
+def test_failing_api_falls_back_to_the_expired_entry(client, server, cache):
+    first = client.search_papers('graph learning', 0, 20)
+    time.sleep(TTL + STALE + 0.1)
+    server.fail = True
+    assert client.search_papers('graph learning', 0, 20) == first
+    assert cache.stats()['stale_on_error'] == 1
+
+
+def test_errors_are_not_cached(client, server):
+    server.fail = True
+    assert 'error' in client.search_papers('never cached', 0, 5)
+    server.fail = False
+    assert len(client.search_papers('never cached', 0, 5)['papers']) == 5
+
+
+def test_table_stays_within_max_entries(client, cache):
+    for page in range(10):
+        client.search_papers('eviction', page * 5, 5)
+    stats = cache.stats()
+    assert stats['entries'] <= 5 and stats['evictions'] == 5
+
+
+def test_caller_connection_is_reused(server, tmp_path):
+    # A request that holds the pool's only connection must not wait for another one
+    db_file = str(tmp_path / 'single.sqlite')
+    conn = db.connect(db_file)
+    migrate(conn)
+    conn.close()
+    pool = db.ConnectionPool(db_file, max_size=1, timeout=0.5)
+    client = ArxivClient(base_url=server.base_url, cache=ArxivCache(pool=pool),
+                         limiter=TokenBucket(rate=1000, burst=100))
+    try:
+        with pool.connection() as held:
+            first = client.search_papers('graph learning', 0, 20, conn=held)
+            assert client.search_papers('graph learning', 0, 20, conn=held) == first
+        assert len(server.requests) == 1
+    finally:
+        client.runner.run(client.async_client.close())
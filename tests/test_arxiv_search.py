@@ -0,0 +1,51 @@
+"""Search results that must match the feedparser-based client the async one replaced
+
+The total of a feed without a usable opensearch:totalResults, and the
+author search falling back to the keyword search when arXiv fails.
+"""
+import re
+
+import pytest
+
+from arxiv_cache import ArxivCache
+from arxiv_client import ArxivClient
+from arxiv_feed import parse_feed
+from benchmarks.fake_arxiv import FakeArxivServer, atom_feed
+from rate_limiter import TokenBucket
+
+TOTAL = re.compile(rb'\s*<opensearch:totalResults[^>]*>\d+</opensearch:totalResults>')
+
+
+@pytest.fixture
+def server():
+    with FakeArxivServer() as server:
+        yield server
+
+
+@pytest.fixture
+def client(server):
+    client = ArxivClient(base_url=server.base_url, cache=ArxivCache(max_entries=0),
+                         limiter=TokenBucket(rate=1000, burst=100))
+    client.async_client.retries = 0
+    yield client
+    client.runner.run(client.async_client.close())
+
+
+def test_missing_total_is_none():
+    papers, total = parse_feed(TOTAL.sub(b'', atom_feed(3)))
+    assert len(papers) == 3 and total is None
+
+
+def test_unparseable_total_is_zero():
+    body = TOTAL.sub(b'<opensearch:totalResults xmlns:opensearch="http://a9.com/-/spec/opensearch/1.1/">'
+                     b'n/a</opensearch:totalResults>', atom_feed(3))
+    papers, total = parse_feed(body)
+    assert len(papers) == 3 and total == 0
+
+
+def test_author_search_falls_back_when_exact_query_fails(client, server):
+    server.fail_next = 1
+    result = client.search_by_author('Smith', 0, 5)
+    assert 'error' not in result
+    assert len(result['papers']) == 5
+    assert len(server.requests) == 2
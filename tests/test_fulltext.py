@@ -0,0 +1,55 @@
+"""The arXiv full-text index stays in step with arxiv_papers
+
+The index references arxiv_papers by rowid; these checks make sure that
+rowid survives the migration that made it explicit and a VACUUM.
+"""
+import sqlite3
+
+from fulltext import search_arxiv
+from migrations import MIGRATIONS, migrate
+
+TOPICS = ['graph neural networks', 'protein folding', 'quantum error correction', 'sparse attention',
+          'causal inference', 'diffusion models']
+
+
+def add_papers(conn, topics):
+    conn.executemany("""INSERT INTO arxiv_papers(arxiv_id, title, abstract) VALUES(?, ?, ?)""",
+                     [(f"2401.{index:05d}", topic.title(), f"A study of {topic}.")
+                      for index, topic in enumerate(topics)])
+    conn.commit()
+
+
+def found(conn, query):
+    return [hit['arxiv_id'] for hit in search_arxiv(conn, query)]
+
+
+def test_migration_keeps_existing_papers_searchable():
+    conn = sqlite3.connect(':memory:')
+    for statement in MIGRATIONS[0][2]:
+        conn.execute(statement)
+    add_papers(conn, TOPICS)
+    migrate(conn)
+    assert found(conn, 'protein') == ['2401.00001']
+    assert found(conn, 'diffusion') == ['2401.00005']
+
+
+def test_index_references_an_integer_primary_key():
+    conn = sqlite3.connect(':memory:')
+    migrate(conn)
+    # An INTEGER PRIMARY KEY aliases the rowid, which VACUUM then never renumbers
+    columns = {name: (kind, pk) for _, name, kind, _, _, pk in conn.execute("PRAGMA table_info(arxiv_papers)")}
+    assert columns['arxiv_rowid'] == ('INTEGER', 1)
+    fts = conn.execute("SELECT sql FROM sqlite_master WHERE name = 'arxiv_fts'").fetchone()[0]
+    assert "content_rowid='arxiv_rowid'" in fts
+
+
+def test_index_survives_vacuum(tmp_path):
+    conn = sqlite3.connect(str(tmp_path / 'fts.sqlite'))
+    migrate(conn)
+    add_papers(conn, TOPICS)
+    conn.execute("DELETE FROM arxiv_papers WHERE arxiv_id IN ('2401.00000', '2401.00002')")
+    conn.commit()
+    conn.execute("VACUUM")
+    assert found(conn, 'protein') == ['2401.00001']
+    assert found(conn, 'attention') == ['2401.00003']
+    assert found(conn, 'quantum') == []
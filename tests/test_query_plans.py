@@ -0,0 +1,80 @@
+"""EXPLAIN QUERY PLAN assertions for the hot entity/paper queries
+
+Builds a baseline-schema database (no user_version, as created before
+migrations existed), fills it with synthetic data, upgrades it in place
+with migrations.migrate() and checks that every query uses the expected
+index.
+"""
+import random
+import sqlite3
+
+import pytest
+
+from ingest import load_entities
+from migrations import MIGRATIONS, SCHEMA_VERSION, explain, migrate, schema_version
+from prototype import MENTION_COLUMNS, PAPER_COLUMNS, build_query
+
+ORG_SEARCH = f"""
+    SELECT {', '.join(PAPER_COLUMNS + MENTION_COLUMNS)} FROM papers
+    JOIN papers_have_entities ON papers.paper_id = papers_have_entities.paper_id
+    JOIN entities ON papers_have_entities.entity_id = entities.entity_id
+    WHERE entities.entity_type = 'ORG' AND entities.entity_name LIKE ?
+"""
+
+EXPECTED_PLANS = [
+    ('entity type + name LIKE', ORG_SEARCH, ('%univ%',), 'COVERING INDEX idx_entities_type_name'),
+    ('entity type sample', "SELECT entity_id, entity_name FROM entities WHERE entity_type = 'ORG' LIMIT 5", (),
+     'COVERING INDEX idx_entities_type_name'),
+    ('entities of a paper', "SELECT entity_id, count FROM papers_have_entities WHERE paper_id = ?", (1,),
+     'idx_papers_have_entities_paper'),
+    ('title dedupe', "SELECT paper_id FROM papers WHERE paper_name = ? COLLATE NOCASE", ('Paper 1',),
+     'idx_papers_name_nocase'),
+    ('CLI entity query', build_query("get all papers that mention person name 7"), (),
+     'sqlite_autoindex_entities_1'),
+    ('papers of a cluster', """SELECT c.paper_id, p.paper_name FROM paper_clusters c
+        JOIN papers p ON p.paper_id = c.paper_id WHERE c.cluster_id = ? ORDER BY c.paper_id LIMIT 20""",
+     (0,), 'idx_paper_clusters_cluster'),
+    ('arXiv papers of a cluster', """SELECT c.arxiv_id, p.title FROM arxiv_paper_clusters c
+        JOIN arxiv_papers p ON p.arxiv_id = c.arxiv_id WHERE c.cluster_id = ? ORDER BY c.arxiv_id LIMIT 20""",
+     (0,), 'idx_arxiv_paper_clusters_cluster'),
+]
+
+
+def baseline_database():
+    """A database with the pre-migration schema, the way initialize_database used to create it"""
+    conn = sqlite3.connect(':memory:')
+    for statement in MIGRATIONS[0][2][:3]:
+        conn.execute(statement)
+    rng = random.Random(0)
+    labels = ['PERSON', 'ORG', 'WORK_OF_ART', 'GPE']
+    for paper_id in range(1, 301):
+        conn.execute("""INSERT INTO papers(paper_id, paper_name, paper_pdf, paper_docx, paper_json, paper_entities)
+            VALUES(?, ?, '', '', '', '')""", (paper_id, f"Paper {paper_id}"))
+        load_entities(conn.cursor(), paper_id, [{'text': f"name {rng.randrange(3000)}", 'label': rng.choice(labels)}
+                                                for _ in range(200)])
+    conn.commit()
+    return conn
+
+
+@pytest.fixture(scope='module')
+def upgraded():
+    conn = baseline_database()
+    assert schema_version(conn) == 0
+    applied = migrate(conn)
+    yield conn, applied
+    conn.close()
+
+
+def test_migrations_upgrade_baseline_schema(upgraded):
+    conn, applied = upgraded
+    assert applied == [version for version, _, _ in MIGRATIONS]
+    assert schema_version(conn) == SCHEMA_VERSION
+    assert migrate(conn) == [], "second run must be a no-op"
+
+
+@pytest.mark.parametrize('name, query, args, expected', EXPECTED_PLANS, ids=[plan[0] for plan in EXPECTED_PLANS])
+def test_query_uses_index(upgraded, name, query, args, expected):
+    conn, _ = upgraded
+    plan = explain(conn, query, args)
+    assert any(expected in detail for detail in plan), f"{name}: {' | '.join(plan)}"
+    assert not any('TEMP B-TREE' in detail for detail in plan), f"{name} sorts: {' | '.join(plan)}"
@@ -0,0 +1,72 @@
+"""FastVader must give the same scores as NLTK's VADER
+
+Compares every sentence and every whole document of the bundled JSON/
+corpus, plus sentences aimed at VADER's special cases (negation, 'but',
+capitals, punctuation emphasis, idioms, emoticons). Sentences are split
+with a regular expression so no spaCy model is needed.
+"""
+import glob
+import os
+import re
+
+import pytest
+
+import models
+from sentiment_analyzer import document_segments
+from vader_fast import FastVader
+
+CORPUS = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'JSON')
+SENTENCE_END = re.compile(r'(?<=[.!?])\s+')
+FIELDS = ('neg', 'neu', 'pos', 'compound')
+
+SPECIAL_CASES = [
+    "The results are NOT good at all.",
+    "This method is kind of great, but the baseline is terrible!!!",
+    "Hardly a failure :)",
+    "The model isn't bad.",
+    "VERY GOOD results, truly AMAZING",
+    "It was never so wonderful?",
+    "Without doubt the least effective approach we tried.",
+    "That result is the bomb, it really cuts the mustard.",
+    "no",
+    "",
+]
+
+
+@pytest.fixture(scope='module')
+def sia():
+    return models.vader()
+
+
+@pytest.fixture(scope='module')
+def fast(sia):
+    return FastVader(sia)
+
+
+def corpus_documents():
+    for path in sorted(glob.glob(os.path.join(CORPUS, '*.json'))):
+        segments = [segment for segment in document_segments(path) if segment.strip()]
+        sentences = [sentence.strip() for segment in segments for sentence in SENTENCE_END.split(segment)
+                     if sentence.strip()]
+        yield os.path.basename(path), sentences, ' '.join(segments)
+
+
+def assert_same(expected, actual, label):
+    assert {field: actual[field] for field in FIELDS} == pytest.approx(
+        {field: expected[field] for field in FIELDS}, abs=1e-9), label
+
+
+@pytest.mark.parametrize('text', SPECIAL_CASES)
+def test_polarity_scores_match_nltk(sia, fast, text):
+    assert_same(sia.polarity_scores(text), fast.polarity_scores(text), text)
+
+
+def test_score_document_matches_nltk_on_corpus(sia, fast):
+    documents = list(corpus_documents())
+    assert documents, f"no JSON documents in {CORPUS}"
+    for name, sentences, text in documents:
+        scores, document = fast.score_document(sentences, text)
+        assert len(scores) == len(sentences)
+        for sentence, actual in zip(sentences, scores):
+            assert_same(sia.polarity_scores(sentence), actual, f"{name}: {sentence[:80]!r}")
+        assert_same(sia.polarity_scores(text), document, f"<document {name}>")
@@ -0,0 +1,182 @@
+import string
+import math
+import re
+
+import numpy as np
+
+import models
+
+# Constants and rule helpers come from NLTK's implementation so the fast path
+# follows exactly the same rules
+from nltk.sentiment.vader import VaderConstants
+
+_PUNCTUATION = re.escape(string.punctuation)
+# A token split into leading punctuation, a punctuation-free word and trailing punctuation
+_TOKEN_RE = re.compile(f'([{_PUNCTUATION}]*)([^{_PUNCTUATION}]*)([{_PUNCTUATION}]*)\\Z')
+_PUNC_SET = set(VaderConstants.PUNC_LIST)
+
+
+def tokenize(text):
+    """@brief VADER's words_and_emoticons in a single pass
+
+    Tokens of one character are dropped; one PUNC_LIST item in front of or
+    behind an otherwise punctuation-free word of two or more characters is
+    stripped, as SentiText does through its words_plus_punc table.
+
+    Args:
+        text (str): text to tokenize
+
+    Returns:
+        (list): the tokens
+    """
+    tokens = []
+    for token in text.split():
+        if len(token) <= 1:
+            continue
+        match = _TOKEN_RE.match(token)
+        if match is not None:
+            lead, word, tail = match.groups()
+            if len(word) > 1 and ((not lead and tail in _PUNC_SET) or (not tail and lead in _PUNC_SET)):
+                token = word
+        tokens.append(token)
+    return tokens
+
+
+def _is_cap_diff(tokens):
+    capitals = sum(1 for token in tokens if token.isupper())
+    return 0 < len(tokens) - capitals < len(tokens)
+
+
+class _Scope:
+    """The two SentiText attributes sentiment_valence() reads"""
+
+    def __init__(self, tokens):
+        self.words_and_emoticons = tokens
+        self.is_cap_diff = _is_cap_diff(tokens)
+
+
+class FastVader:
+    """Drop-in replacement for SentimentIntensityAnalyzer.polarity_scores over many sentences
+
+    Every sentence is tokenized once and its tokens are looked up in the
+    lexicon once. The context rules (boosters, negation, idioms, 'least')
+    only run for tokens that are in the lexicon, through NLTK's own
+    sentiment_valence(), and the document score reuses the sentence tokens
+    instead of re-scoring the whole text. Sums, the 'but' rule, punctuation
+    emphasis and compound normalization run on numpy arrays for all
+    sentences at once.
+
+    Quirks of NLTK's implementation are reproduced on purpose, e.g. a
+    repeated token is scored in the context of its first occurrence.
+    """
+
+    def __init__(self, sia=None):
+        """
+        Args:
+            sia (SentimentIntensityAnalyzer): source of the lexicon and rules, defaults to models.vader()
+        """
+        self.sia = sia or models.vader()
+        self.lexicon = self.sia.lexicon
+        self.boosters = VaderConstants.BOOSTER_DICT
+
+    def _valences(self, tokens):
+        """Per-token valences of one VADER input (sentence or document), before the 'but' rule"""
+        lower = [token.lower() for token in tokens]
+        valences = np.zeros(len(tokens))
+        hits = [index for index, word in enumerate(lower) if word in self.lexicon]
+        if not hits:
+            return valences, lower
+        scope = _Scope(tokens)
+        first = {}
+        for index, token in enumerate(tokens):
+            first.setdefault(token, index)
+        by_position = {}
+        for index in hits:
+            i = first[tokens[index]]
+            valence = by_position.get(i)
+            if valence is None:
+                if (i < len(tokens) - 1 and lower[i] == 'kind' and lower[i + 1] == 'of') or lower[i] in self.boosters:
+                    valence = 0.0
+                else:
+                    valence = self.sia.sentiment_valence(0, scope, tokens[i], i, [])[0]
+                by_position[i] = valence
+            valences[index] = valence
+        return valences, lower
+
+    @staticmethod
+    def _but_check(valences, lower):
+        if 'but' in lower:
+            but_index = lower.index('but')
+            valences[:but_index] *= 0.5
+            valences[but_index + 1:] *= 1.5
+        return valences
+
+    def _score(self, token_lists, texts):
+        """VADER scores of several inputs from their tokens, vectorized across inputs"""
+        valences = []
+        for tokens in token_lists:
+            values, lower = self._valences(tokens)
+            valences.append(self._but_check(values, lower))
+        lengths = np.array([len(values) for values in valences])
+        flat = np.concatenate(valences) if valences else np.zeros(0)
+        segment = np.repeat(np.arange(len(valences)), lengths)
+
+        def per_input(values):
+            return np.bincount(segment, weights=values, minlength=len(valences))
+
+        sums = per_input(flat)
+        pos_sum = per_input(np.where(flat > 0, flat + 1, 0.0))
+        neg_sum = per_input(np.where(flat < 0, flat - 1, 0.0))
+        neu_count = per_input((flat == 0).astype(float))
+
+        exclamations = np.minimum([text.count('!') for text in texts], 4)
+        questions = np.array([text.count('?') for text in texts])
+        amplifier = exclamations * 0.292 + np.where(questions > 1, np.where(questions <= 3, questions * 0.18, 0.96), 0.0)
+
+        sums = sums + np.sign(sums) * amplifier
+        compound = sums / np.sqrt(sums * sums + 15)
+        more_positive = pos_sum > -neg_sum
+        more_negative = pos_sum < -neg_sum
+        pos_sum = pos_sum + np.where(more_positive, amplifier, 0.0)
+        neg_sum = neg_sum - np.where(more_negative, amplifier, 0.0)
+        total = pos_sum - neg_sum + neu_count
+        empty = lengths == 0
+        total[empty] = 1.0
+
+        scores = []
+        for index in range(len(valences)):
+            if empty[index]:
+                scores.append({'neg': 0.0, 'neu': 0.0, 'pos': 0.0, 'compound': 0.0})
+                continue
+            scores.append({
+                'neg': round(math.fabs(neg_sum[index] / total[index]), 3),
+                'neu': round(math.fabs(neu_count[index] / total[index]), 3),
+                'pos': round(math.fabs(pos_sum[index] / total[index]), 3),
+                'compound': round(float(compound[index]), 4),
+            })
+        return scores
+
+    def polarity_scores(self, text):
+        """@brief same as SentimentIntensityAnalyzer.polarity_scores(text)"""
+        return self._score([tokenize(text)], [text])[0]
+
+    def joined_scores(self, sentences, text):
+        """@brief the text score of score_document(sentences, text), without scoring the sentences"""
+        tokens = [token for sentence in sentences for token in tokenize(sentence)]
+        return self._score([tokens], [text])[0]
+
+    def score_document(self, sentences, text):
+        """@brief VADER scores of every sentence and of the whole text, tokenizing once
+
+        Args:
+            sentences (list): the sentences of text, in order
+            text (str): the whole text; its tokens are taken to be the
+                concatenated sentence tokens
+
+        Returns:
+            (tuple): (list of sentence score dicts, score dict of the text)
+        """
+        token_lists = [tokenize(sentence) for sentence in sentences]
+        document_tokens = [token for tokens in token_lists for token in tokens]
+        scores = self._score(token_lists + [document_tokens], list(sentences) + [text])
+        return scores[:-1], scores[-1]
@@ -0,0 +1,166 @@
+from collections import deque
+import threading
+import logging
+import time
+import os
+
+logger = logging.getLogger(__name__)
+
+
+class PapersWatcher:
+    """Poll a papers folder and feed new, changed or removed PDFs to an ingest function
+
+    A file is only handed over once its size and mtime have stayed the same
+    for ``debounce`` seconds, so PDFs that are still being copied are not
+    ingested half-written. ``ingest`` is called with a list of paths and
+    does the actual (incremental) work, e.g. initialize_database(paths=...).
+    """
+
+    def __init__(self, ingest, source_path="Papers/", interval=2.0, debounce=5.0, batch_size=8, history=500):
+        self.ingest = ingest
+        self.source_path = source_path
+        self.interval = interval
+        self.debounce = debounce
+        self.batch_size = batch_size
+        self.on_batch = None
+        self.lock = threading.Lock()
+        self.stop_event = threading.Event()
+        self.thread = None
+        # path -> (size, mtime_ns) of the version that was last handed to ingest
+        self.seen = {}
+        # path -> {'stat': (size, mtime_ns) or None if removed, 'first_seen': t, 'last_change': t}
+        self.pending = {}
+        self.in_flight = 0
+        self.processed = 0
+        self.failed = 0
+        self.latencies = deque(maxlen=history)
+        self.ingest_times = deque(maxlen=history)
+
+    def scan(self):
+        """@brief stat every PDF once and queue the ones that differ from what was ingested
+
+        Returns:
+            (int): number of queued paths
+        """
+        now = time.monotonic()
+        current = {}
+        for name in os.listdir(self.source_path):
+            path = os.path.join(self.source_path, name)
+            if not name.lower().endswith('.pdf') or not os.path.isfile(path):
+                continue
+            stat_result = os.stat(path)
+            current[path] = (stat_result.st_size, stat_result.st_mtime_ns)
+
+        with self.lock:
+            for path in set(self.seen) | set(current) | set(self.pending):
+                state = current.get(path)
+                entry = self.pending.get(path)
+                if entry is None:
+                    if state != self.seen.get(path):
+                        self.pending[path] = {'stat': state, 'first_seen': now, 'last_change': now}
+                elif entry['stat'] != state:
+                    # Still changing, restart the debounce window
+                    entry['stat'] = state
+                    entry['last_change'] = now
+            return len(self.pending)
+
+    def take_ready(self):
+        """Remove and return up to batch_size paths whose debounce window has passed"""
+        now = time.monotonic()
+        with self.lock:
+            ready = [path for path, entry in self.pending.items() if now - entry['last_change'] >= self.debounce]
+            ready.sort(key=lambda path: self.pending[path]['first_seen'])
+            batch = {path: self.pending.pop(path) for path in ready[:self.batch_size]}
+            self.in_flight = len(batch)
+        return batch
+
+    def run_once(self):
+        """@brief scan the folder and ingest one batch of settled files
+
+        Returns:
+            (int): number of files handed to ingest
+        """
+        self.scan()
+        batch = self.take_ready()
+        if not batch:
+            return 0
+        start = time.monotonic()
+        try:
+            self.ingest(list(batch))
+        except Exception as e:
+            logger.error(f"Ingesting {len(batch)} files failed: {str(e)}", exc_info=True)
+            with self.lock:
+                self.failed += len(batch)
+                self.in_flight = 0
+                # Leave them out of `seen` so the next scan queues them again
+            return len(batch)
+        finished = time.monotonic()
+        with self.lock:
+            for path, entry in batch.items():
+                if entry['stat'] is None:
+                    self.seen.pop(path, None)
+                else:
+                    self.seen[path] = entry['stat']
+                self.latencies.append(finished - entry['first_seen'])
+                self.ingest_times.append((finished - start) / len(batch))
+            self.processed += len(batch)
+            self.in_flight = 0
+        if self.on_batch:
+            self.on_batch(self.stats())
+        return len(batch)
+
+    def run_forever(self):
+        """Keep polling until stop() is called"""
+        logger.info(f"Watching {self.source_path} every {self.interval}s (debounce {self.debounce}s)")
+        while not self.stop_event.is_set():
+            # Drain settled files before sleeping again
+            while self.run_once() and not self.stop_event.is_set():
+                pass
+            self.stop_event.wait(self.interval)
+
+    def start(self):
+        """Run the watcher in a daemon thread"""
+        if self.thread is None or not self.thread.is_alive():
+            self.stop_event.clear()
+            self.thread = threading.Thread(target=self.run_forever, name='papers-watcher', daemon=True)
+            self.thread.start()
+
+    def stop(self):
+        self.stop_event.set()
+
+    @staticmethod
+    def _percentile(values, fraction):
+        if not values:
+            return None
+        ordered = sorted(values)
+        return round(ordered[min(len(ordered) - 1, int(fraction * len(ordered)))], 3)
+
+    def stats(self):
+        """@brief queue depth and latency figures for monitoring
+
+        latency is measured from the first time a change was seen until it
+        was committed (includes the debounce window); ingest_seconds is the
+        pipeline time per file.
+
+        Returns:
+            (dict): JSON-serialisable statistics
+        """
+        with self.lock:
+            latencies = list(self.latencies)
+            ingest_times = list(self.ingest_times)
+            return {
+                'queue_depth': len(self.pending),
+                'in_flight': self.in_flight,
+                'processed': self.processed,
+                'failed': self.failed,
+                'latency_seconds': {
+                    'p50': self._percentile(latencies, 0.5),
+                    'p95': self._percentile(latencies, 0.95),
+                    'max': self._percentile(latencies, 1.0),
+                },
+                'ingest_seconds': {
+                    'p50': self._percentile(ingest_times, 0.5),
+                    'p95': self._percentile(ingest_times, 0.95),
+                    'max': self._percentile(ingest_times, 1.0),
+                },
+            }